@@ -2,166 +2,226 @@ import httpx
 import os
 import json
 import base64
+import logging
+import time
+from .config_loader import api_key_for
+from . import http_pool
+from .providers import get_adapter
+from .attachments import upload_cache
+from .prewarm import prewarmer
+from .usage_stats import usage_store
+from .request_body import content_encoding, encode_body, should_stream, stream_body
+
+class EndpointUnreachable(ConnectionError):
+    """The endpoint could not be connected to, nothing was sent or received.
+
+    Raised instead of returning an error text so the request can be queued
+    in the outbox and retried once the endpoint is back.
+    """
+
+    def __init__(self, endpoint, message):
+        super().__init__(message)
+        self.endpoint = endpoint
+
+
+class EndpointTimeout(TimeoutError):
+    """The endpoint took the request but did not answer in time.
+
+    Raised instead of returning an error text, so the failure is shown
+    with the reply rather than stored in the conversation as its answer.
+    """
+
+    def __init__(self, endpoint, message):
+        super().__init__(message)
+        self.endpoint = endpoint
+
+
+class EndpointError(Exception):
+    """The endpoint failed the request, or its answer could not be read.
+
+    Raised instead of returning an error text, so the message is shown
+    in place of the reply and never stored in the conversation. `status`
+    is the HTTP status of an error response, None for other failures.
+    """
+
+    def __init__(self, endpoint, message, status=None):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.status = status
+
 
 class OpenAIClient:
     def __init__(self, config):
         self.config = config
-        self.api_key = config.get("api_key", "") or os.getenv(f"{config['name'].upper().replace(' ', '_')}_API_KEY", "")
+        self.api_key = api_key_for(config)
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}" if self.api_key else ""
         }
-        # Determine API format (openai or custom)
-        self.api_format = config.get("api_format", "openai")
-        self.supports_streaming = config.get("supports_streaming", False)
+        # Payload, stream and response shapes come from the provider adapter
+        self.adapter = get_adapter(config)
+        self.api_format = config.get("api_format") or config.get("api_type", "openai")
+        self.supports_streaming = config.get("supports_streaming", True)
+        self.verify_ssl = config.get("verify_ssl", False)
+        # "upload" sends each attachment once and references it by file id,
+        # "inline" embeds it in every request. Only the kinds listed in
+        # "upload_kinds" are uploaded, chat completions take images and
+        # audio inline only, so those are for servers documenting file parts.
+        self.attachment_transport = config.get("attachment_transport", "inline")
+        self.request_compression = config.get("request_compression")  # gzip or zstd
+        # Streamed bodies keep memory flat but carry no Content-Length, by
+        # default ("auto") only requests with large attachments use them
+        self.stream_request_body = config.get("stream_request_body", "auto")
         
     async def mocked_send_request(*args, **kwargs):
         return "As an AI developed by Microsoft, I don't possess consciousness, thoughts, or feelings. My responses are generated based on patterns in the data I've been trained on. If you have any questions or need assitance with something specific, feel free to ask!"
 
-async def stream_response(self, messages, max_tokens=1500):
-    """Stream response from API for real-time updates"""
-    payload = self._prepare_openai_payload(messages, max_tokens)
-    payload["stream"] = True
-    
-    try:
-        async with httpx.AsyncClient() as client:
+    async def stream_response(self, messages, max_tokens=1500):
+        """Stream response from API for real-time updates"""
+        try:
+            client = http_pool.get_client(self.verify_ssl)
+            body, headers = await self._build_request(client, messages, max_tokens, stream=True)
+            started = time.monotonic()
+            first_at = None
             async with client.stream(
                 "POST",
                 self.config["endpoint"],
-                headers=self.headers,
-                json=payload,
+                headers=headers,
+                content=body,
                 timeout=30.0
             ) as response:
                 if response.status_code != 200:
-                    error_msg = f"API Error {response.status_code}: {response.text}"
-                    yield error_msg
-                    return
-                    
-                async for chunk in response.aiter_lines():
-                    if chunk.startswith("data: "):
-                        data = chunk[6:]
-                        if data == "[DONE]":
-                            break
-                        try:
-                            data_json = json.loads(data)
-                            if "choices" in data_json and data_json["choices"]:
-                                delta = data_json["choices"][0].get("delta", {})
-                                if "content" in delta:
-                                    yield delta["content"]
-                        except json.JSONDecodeError:
-                            continue
-    except (httpx.RemoteProtocolError, httpx.LocalProtocolError, asyncio.CancelledError):
-        # Gracefully handle connection closures
-        return
-    except Exception as e:
-        yield f"Streaming error: {str(e)}"
+                    await response.aread()
+                    raise EndpointError(
+                        self.config["endpoint"], f"API Error {response.status_code}: {response.text}",
+                        response.status_code
+                    )
+                
+                usage = {}
+                async for event in self.adapter.decode_stream(response):
+                    text = self.adapter.parse_event(event)
+                    if text:
+                        if first_at is None:
+                            first_at = time.monotonic()
+                        yield text
+                    usage.update(self.adapter.parse_usage(event) or {})
+                    if self.adapter.is_final(event):
+                        break
+                if first_at is not None:
+                    # Speed is measured from the first token, the prompt is not part of it
+                    self.report_usage(usage, first_at - started, time.monotonic() - first_at)
+        except (httpx.RemoteProtocolError, httpx.LocalProtocolError):
+            # Gracefully handle connection closures
+            return
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            raise EndpointUnreachable(self.config["endpoint"], str(e))
+        except httpx.TimeoutException as e:
+            raise EndpointTimeout(self.config["endpoint"], f"No answer from the model in time ({e})")
+        except httpx.RequestError as e:
+            raise EndpointError(self.config["endpoint"], f"Network error: {str(e)}")
+        except EndpointError:
+            raise
+        except Exception as e:
+            raise EndpointError(self.config["endpoint"], f"Streaming error: {str(e)}")
 
     async def send_request(self, messages, max_tokens=1500):
-        # Prepare payload based on API format
-        if self.api_format == "openai":
-            payload = self._prepare_openai_payload(messages, max_tokens)
-        else:
-            payload = self._prepare_custom_payload(messages, max_tokens)
-        
         try:
-            async with httpx.AsyncClient(verify=False) as client:
-                response = await client.post(
-                    self.config["endpoint"],
-                    headers=self.headers,
-                    json=payload,
-                    timeout=60.0
+            # Shared pool, so prewarmed connections are reused
+            client = http_pool.get_client(self.verify_ssl)
+            body, headers = await self._build_request(client, messages, max_tokens)
+            response = await client.post(
+                self.config["endpoint"],
+                headers=headers,
+                content=body,
+                timeout=60.0
+            )
+            
+            if response.status_code != 200:
+                try:
+                    error_msg = response.json().get('error', {}).get('message', response.text)
+                except (json.JSONDecodeError, AttributeError):
+                    error_msg = response.text
+                raise EndpointError(
+                    self.config["endpoint"], f"API Error {response.status_code}: {error_msg}", response.status_code
                 )
+            
+            data = response.json()
+            # Without a stream only the server can tell how long generation took,
+            # and the first token is not seen apart from the whole reply
+            usage = self.adapter.parse_usage(data) or {}
+            generation_ms = usage.get("generation_ms")
+            self.report_usage(usage, None, generation_ms / 1000 if generation_ms else None)
+            return self.adapter.parse_response(data)
                 
-                if response.status_code != 200:
-                    error_data = response.json()
-                    error_msg = error_data.get('error', {}).get('message', response.text)
-                    return f"API Error {response.status_code}: {error_msg}"
-                
-                return self._parse_response(response.json())
-                
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            raise EndpointUnreachable(self.config["endpoint"], str(e))
+        except httpx.TimeoutException as e:
+            raise EndpointTimeout(self.config["endpoint"], f"No answer from the model in time ({e})")
         except httpx.RequestError as e:
-            return f"Network error: {str(e)}"
+            raise EndpointError(self.config["endpoint"], f"Network error: {str(e)}")
+        except EndpointError:
+            raise
         except json.JSONDecodeError:
-            return "Invalid JSON response from API"
+            raise EndpointError(self.config["endpoint"], "Invalid JSON response from API")
         except KeyError:
-            return "Unexpected API response format"
+            raise EndpointError(self.config["endpoint"], "Unexpected API response format")
         except Exception as e:
-            return f"API request failed: {str(e)}"
+            raise EndpointError(self.config["endpoint"], f"API request failed: {str(e)}")
     
-    def _prepare_openai_payload(self, messages, max_tokens=1500):
-        api_messages = []
-        for msg in messages:
-            content = []
-        
-            # Handle text content
-            if isinstance(msg['content'], dict) and 'text' in msg['content']:
-                content.append({"type": "text", "text": msg['content']['text']})
-        
-            # Handle image content
-            if isinstance(msg['content'], dict) and 'image_base64' in msg['content']:
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{msg['content']['image_base64']}"
-                    }
-                })
-        
-            # Handle audio content
-            if isinstance(msg['content'], dict) and 'audio_base64' in msg['content']:
-                content.append({
-                    "type": "audio",
-                    "audio": {
-                        "url": f"data:audio/wav;base64,{msg['content']['audio_base64']}"
-                    }
-                })
-        
-            # Handle simple text
-            if not isinstance(msg['content'], dict) and msg['content']:
-                content.append({"type": "text", "text": msg['content']})
+    def prewarm(self):
+        """Warm DNS, the connection and a local model on the running loop"""
+        prewarmer.cancel(keep=self.config.get("endpoint"))
+        return prewarmer.prewarm(self.config)
+
+    def report_usage(self, usage, first_token, generation=None):
+        """Add a completed request to the usage stats and log prompt cache hits.
+
+        Local servers reuse the KV cache of an unchanged history prefix,
+        so on later turns cached_tokens should approach prompt_tokens and
+        prompt_ms should drop.
+        """
+        if "cached_tokens" in usage or "prompt_ms" in usage:
+            parts = []
+            if "cached_tokens" in usage:
+                parts.append(f"{usage['cached_tokens']}/{usage.get('prompt_tokens', '?')} prompt tokens cached")
+            if "prompt_ms" in usage:
+                parts.append(f"prompt processed in {usage['prompt_ms']:.0f} ms")
+            logging.info(f"Prompt cache ({self.config['name']}): {', '.join(parts)}")
+        usage_store.record(self.config, usage, first_token, generation)
+
+    def passthrough(self, payload):
+        """Forward an OpenAI-format request body, used by the gateway.
+
+        Returns the streaming response context of the shared pool. The
+        response is not decoded, so streams reach the caller unbuffered.
+        """
+        client = http_pool.get_client(self.verify_ssl)
+        payload = dict(payload, model=self.config["model_name"])
+        headers = self.headers
+        encoding = content_encoding(self.request_compression)
+        if encoding:
+            headers = dict(self.headers, **{"Content-Encoding": encoding})
+        return client.stream(
+            "POST",
+            self.config["endpoint"],
+            headers=headers,
+            content=encode_body(payload, self.request_compression),
+            timeout=30.0 if payload.get("stream") else 60.0
+        )
+
+    async def _build_request(self, client, messages, max_tokens, stream=False):
+        """Encoded body and headers, honouring the attachment transport"""
+        references = None
+        if self.attachment_transport == "upload" and self.adapter.upload_kinds:
+            references = await upload_cache.references(
+                client, self.config, self.headers, messages, self.adapter.upload_kinds
+            )
+        payload = self.adapter.build_payload(messages, max_tokens, stream=stream, references=references)
         
-            api_messages.append({
-                "role": msg['role'],
-                "content": content
-            })
-    
-        return {
-            "model": self.config["model_name"],
-            "messages": api_messages,
-            "max_tokens": max_tokens
-        }
-    
-    def _prepare_custom_payload(self, messages, max_tokens):
-        """Prepare langchain-style payload"""
-        # Extract all messages
-        message_list = []
-        for msg in messages:
-            role = "user" if msg['role'] == "user" else "assistant"
-            content = msg['content']
-            if isinstance(content, dict):
-                content = content.get('text', '')
-            message_list.append({"role": role, "content": content})
-    
-        return {
-            "model": self.config["model_name"],
-            "messages": message_list,
-            "max_tokens": max_tokens
-        }
-    
-    def _parse_response(self, response_data):
-        """Parse response based on API format"""
-        if self.api_format == "openai":
-            if response_data.get("choices") and len(response_data["choices"]) > 0:
-                content = response_data["choices"][0]["message"]["content"]
-                if isinstance(content, list):
-                    return "\n".join([item.get("text", "") for item in content if item.get("text")])
-                return content
-            return "No response from model"
-        else:
-            # Custom format parsing
-            if "response" in response_data:
-                return response_data["response"]
-            elif "text" in response_data:
-                return response_data["text"]
-            elif "output" in response_data:
-                return response_data["output"]
-            return "No response from model"
\ No newline at end of file
+        headers = self.headers
+        encoding = content_encoding(self.request_compression)
+        if encoding:
+            headers = dict(self.headers, **{"Content-Encoding": encoding})
+        if should_stream(payload, self.stream_request_body):
+            return stream_body(payload, self.request_compression), headers
+        return encode_body(payload, self.request_compression), headers
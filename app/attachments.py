@@ -0,0 +1,347 @@
+import asyncio
+import base64
+import codecs
+import collections
+import hashlib
+import logging
+import os
+import weakref
+
+import httpx
+
+try:
+    import charset_normalizer
+except ImportError:  # Optional, non UTF-8 files fall back to cp1252
+    charset_normalizer = None
+
+from .http_pool import api_url
+
+ATTACHMENT_KEYS = ("image", "audio")
+LEGACY_KEYS = {"image": ("image_base64", "image/png"), "audio": ("audio_base64", "audio/wav")}
+LEGACY_CACHE_SIZE = 32  # Wrapped base64 contents kept, so each is decoded and hashed once
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+class Attachment:
+    """Image, audio or text document attached to a message.
+
+    The source is either raw bytes in memory or a file on disk. Base64 is
+    only produced when a request is built, and the digest identifies the
+    attachment for upload caching. Documents are sent as text, decoded
+    with `encoding`.
+    """
+    CHUNK_SIZE = 48 * 1024  # Multiple of 3, so base64 chunks concatenate cleanly
+
+    def __init__(self, data, mime, kind, filename=None, path=None, encoding=None):
+        self.data = data
+        self.path = path
+        self.mime = mime
+        self.kind = kind  # "image", "audio" or "document" (text)
+        self.filename = filename or (os.path.basename(path) if path else f"{kind}.{mime.split('/')[-1]}")
+        self.encoding = encoding  # Text encoding of documents
+        self.line_count = None
+        self._digest = None
+
+    @classmethod
+    def from_base64(cls, value, mime, kind):
+        return cls(base64.b64decode(value), mime, kind)
+
+    @classmethod
+    def from_file(cls, path, mime, kind, filename=None, encoding=None):
+        return cls(None, mime, kind, filename=filename, path=path, encoding=encoding)
+
+    @property
+    def size(self):
+        data = self.data
+        if data is not None:
+            return len(data)
+        return os.path.getsize(self.path)
+
+    def digest(self):
+        if self._digest is None:
+            sha = hashlib.sha256()
+            for chunk in self.iter_chunks():
+                sha.update(chunk)
+            self._digest = sha.hexdigest()
+        return self._digest
+
+    @property
+    def in_memory(self):
+        return self.data is not None
+
+    def save_to(self, folder):
+        """Write the bytes to a file named by digest in folder, returns its path"""
+        path = os.path.join(folder, self.digest())
+        if not os.path.exists(path):
+            temp_path = path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                for chunk in self.iter_chunks():
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        else:
+            # Marks the blob as in use for a collection running meanwhile
+            os.utime(path)
+        return path
+
+    def spill(self, folder):
+        """Move the bytes to a file named by digest and drop them from memory"""
+        if self.data is None:
+            return
+        self.path = self.save_to(folder)
+        self.data = None
+
+    def read_bytes(self):
+        data = self.data  # May be spilled concurrently from another thread
+        if data is not None:
+            return data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def iter_chunks(self, size=CHUNK_SIZE):
+        """Raw bytes in pieces, without copying the whole source"""
+        data = self.data  # May be spilled concurrently from another thread
+        if data is not None:
+            view = memoryview(data)
+            for start in range(0, len(view), size):
+                yield view[start:start + size]
+            return
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def iter_base64(self, size=CHUNK_SIZE):
+        for chunk in self.iter_chunks(size):
+            yield base64.b64encode(chunk)
+
+    def iter_text(self, size=CHUNK_SIZE):
+        """Decoded text of a document in pieces"""
+        decoder = codecs.getincrementaldecoder(self.encoding or "utf-8")(errors="replace")
+        for chunk in self.iter_chunks(size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    def preview(self, limit=2000):
+        """Start of a document, without reading the rest"""
+        pieces = []
+        length = 0
+        for text in self.iter_text(size=4096):
+            pieces.append(text)
+            length += len(text)
+            if length >= limit:
+                break
+        return "".join(pieces)[:limit]
+
+    def to_base64(self):
+        return base64.b64encode(self.read_bytes()).decode('utf-8')
+
+    def data_url(self):
+        return f"data:{self.mime};base64,{self.to_base64()}"
+
+
+def content_attachments(content):
+    """Attachments of a message content dict, in display order.
+
+    Contents built before attachments existed carry base64 strings, those
+    are wrapped on the fly and the wrappers kept for the next turns.
+    """
+    if not isinstance(content, dict):
+        return []
+    attachments = []
+    for kind in ATTACHMENT_KEYS:
+        if isinstance(content.get(kind), Attachment):
+            attachments.append(content[kind])
+            continue
+        key, mime = LEGACY_KEYS[kind]
+        if content.get(key):
+            attachments.append(legacy_attachment(content[key], mime, kind))
+    for document in content.get("documents") or []:
+        if isinstance(document, Attachment):
+            attachments.append(document)
+    return attachments
+
+
+# The same base64 string is the same object every turn, its hash is cached
+_legacy_attachments = collections.OrderedDict()  # (base64, kind) -> Attachment
+
+
+def legacy_attachment(value, mime, kind):
+    """Attachment wrapping a base64 content string, reused across turns"""
+    key = (value, kind)
+    attachment = _legacy_attachments.get(key)
+    if attachment is None:
+        attachment = _legacy_attachments[key] = Attachment.from_base64(value, mime, kind)
+        if len(_legacy_attachments) > LEGACY_CACHE_SIZE:
+            _legacy_attachments.popitem(last=False)
+    else:
+        _legacy_attachments.move_to_end(key)
+    return attachment
+
+
+# Documents attached more than once share one Attachment while in use
+document_cache = weakref.WeakValueDictionary()  # digest -> Attachment
+
+
+def detect_encoding(head):
+    """Encoding from a byte order mark, None when there is none"""
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def _guess_encoding(head):
+    if charset_normalizer is not None:
+        match = charset_normalizer.from_bytes(head).best()
+        if match is not None:
+            return match.encoding
+    return "cp1252"
+
+
+def ingest_text_file(path, chunk_size=1024 * 1024):
+    """Document attachment for a text file, read in chunks.
+
+    Blocking, run it in an executor. Hashes, checks the encoding and counts
+    lines in one pass without keeping the contents: the attachment reads
+    from the file when a request is built. Raises ValueError for binary
+    files.
+    """
+    sha = hashlib.sha256()
+    head = None
+    encoding = None
+    decoder = None
+    lines = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+            if head is None:
+                head = chunk[:64 * 1024]
+                encoding = detect_encoding(head)
+                if encoding is None and b"\0" in head:
+                    raise ValueError(f"{os.path.basename(path)} is not a text file")
+                decoder = codecs.getincrementaldecoder(encoding or "utf-8")()
+            if decoder is not None:
+                try:
+                    lines += decoder.decode(chunk).count("\n")
+                    continue
+                except UnicodeDecodeError:
+                    decoder = None  # Not UTF-8, guessed below
+            lines += chunk.count(b"\n")
+        if decoder is not None:
+            try:
+                decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                decoder = None
+
+    digest = sha.hexdigest()
+    cached = document_cache.get(digest)
+    if cached is not None:
+        return cached
+
+    if decoder is None and head is not None:
+        encoding = _guess_encoding(head)
+    attachment = Attachment.from_file(path, "text/plain", "document", encoding=encoding or "utf-8")
+    attachment._digest = digest
+    attachment.line_count = lines + 1
+    document_cache[digest] = attachment
+    return attachment
+
+
+def text_attachment(text, filename="Pasted text"):
+    """Document attachment for pasted text"""
+    attachment = Attachment(text.encode("utf-8"), "text/plain", "document", filename=filename, encoding="utf-8")
+    attachment.line_count = text.count("\n") + 1
+    cached = document_cache.setdefault(attachment.digest(), attachment)
+    return cached
+
+
+def files_url(endpoint):
+    """Default upload URL, the /v1/files route next to the chat endpoint"""
+    return api_url(endpoint, 'files')
+
+
+class UploadCache:
+    """Uploads attachments once per endpoint and remembers their file ids"""
+
+    def __init__(self):
+        self.file_ids = {}  # (upload url, digest) -> file id
+        self.pending = {}  # (upload url, digest) -> future of an upload in flight
+        self.unsupported = set()  # Upload urls the server rejected as unknown
+
+    async def references(self, client, config, headers, messages, kinds):
+        """Map attachment digests in `messages` to uploaded file ids.
+
+        Only `kinds` (the adapter's upload kinds) are uploaded, attachments
+        of other kinds or that fail to upload get inlined.
+        """
+        url = config.get("upload_endpoint") or files_url(config["endpoint"])
+        if url in self.unsupported:
+            return {}
+        attachments = {}
+        for msg in messages:
+            for attachment in content_attachments(msg.get('content')):
+                if attachment.kind in kinds:
+                    attachments.setdefault(attachment.digest(), attachment)
+
+        results = await asyncio.gather(*(
+            self._file_id(client, url, config, headers, attachment)
+            for attachment in attachments.values()
+        ))
+        return {
+            digest: file_id
+            for digest, file_id in zip(attachments, results) if file_id
+        }
+
+    async def _file_id(self, client, url, config, headers, attachment):
+        key = (url, attachment.digest())
+        if key in self.file_ids:
+            return self.file_ids[key]
+        # Concurrent requests sharing an attachment wait for the same upload
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._upload(client, url, config, headers, attachment))
+            self.pending[key] = task
+            task.add_done_callback(lambda t, key=key: self.pending.pop(key, None))
+        file_id = await asyncio.shield(task)
+        if file_id:
+            self.file_ids[key] = file_id
+        return file_id
+
+    async def _upload(self, client, url, config, headers, attachment):
+        # multipart sets its own content type
+        upload_headers = {k: v for k, v in headers.items() if k.lower() != "content-type"}
+        try:
+            response = await client.post(
+                url,
+                headers=upload_headers,
+                data={"purpose": config.get("upload_purpose", "vision")},
+                files={"file": (attachment.filename, attachment.read_bytes(), attachment.mime)},
+                timeout=120.0
+            )
+            if response.status_code in (404, 405, 501):
+                self.unsupported.add(url)
+            response.raise_for_status()
+            return response.json().get("id")
+        except (httpx.HTTPError, ValueError, AttributeError) as e:
+            logging.warning(f"Attachment upload to {url} failed, sending inline: {e}")
+            return None
+
+
+upload_cache = UploadCache()
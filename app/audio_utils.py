@@ -17,8 +17,8 @@ def record_audio(duration=5, sample_rate=44100):
     sd.wait()
     return audio_data, sample_rate
 
-def audio_to_base64(audio_data, sample_rate):
-    """Convert audio data to base64 encoded WAV"""
+def audio_to_wav_bytes(audio_data, sample_rate):
+    """Convert audio data to WAV bytes"""
     try:
         # Convert to proper format
         if isinstance(audio_data, np.ndarray):
@@ -29,13 +29,18 @@ def audio_to_base64(audio_data, sample_rate):
         buffer = BytesIO()
         sf.write(buffer, audio_data, sample_rate, format='WAV')
         
-        # Convert to base64
-        buffer.seek(0)
-        return base64.b64encode(buffer.read()).decode('utf-8')
+        return buffer.getvalue()
     except Exception as e:
         print(f"Audio conversion error: {str(e)}")
         return None
 
+def audio_to_base64(audio_data, sample_rate):
+    """Convert audio data to base64 encoded WAV"""
+    data = audio_to_wav_bytes(audio_data, sample_rate)
+    if data is None:
+        return None
+    return base64.b64encode(data).decode('utf-8')
+
 def base64_to_audio(base64_str):
     """Convert base64 string to audio data"""
     audio_bytes = base64.b64decode(base64_str)
@@ -1,18 +1,48 @@
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QScrollArea, QFrame, QHBoxLayout, 
-    QLineEdit, QPushButton, QFileDialog, QSizePolicy, QLabel
+    QPushButton, QFileDialog, QSizePolicy, QLabel
 )
 from PySide6.QtCore import Qt, QTimer
 from .message_bubble import MessageBubble
-from .api_client import OpenAIClient
-from .image_utils import image_to_base64
-from .audio_utils import record_audio, audio_to_base64
+from .composer import Composer, DocumentChip
+from .network_thread import create_client
+from .image_utils import image_to_png_bytes
+from .audio_utils import record_audio, audio_to_wav_bytes
+from .attachments import Attachment, content_attachments, ingest_text_file, text_attachment
+from .memory_governor import get_governor
+from .conversation_tree import ConversationTree
+from .outbox import outbox
 import asyncio
 import base64
+import logging
+import time
 import threading
 import sounddevice as sd
 from PySide6.QtGui import QPixmap
 
+STREAM_UPDATE_INTERVAL = 0.05  # Seconds between bubble repaints while streaming
+RELOAD_BATCH = 20  # Messages rebuilt at once when an unloaded conversation is shown
+
+
+class PendingReply:
+    """A reply still being received.
+
+    Text is kept here rather than in the bubble so the stream can continue
+    while the conversation's widgets are unloaded.
+    """
+
+    def __init__(self, parent, node_id):
+        self.parent = parent  # Tree node the reply answers
+        self.node_id = node_id  # Id of the reply's node once it is complete
+        self.chunks = []
+        self.unrendered = []  # Chunks not yet pushed into the bubble
+        self.bubble = None
+        self.last_update = 0
+        self.status = "Thinking..."  # Shown until the first chunk arrives
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
 
 class ChatArea(QWidget):
     def __init__(self):
@@ -31,6 +61,12 @@ class ChatArea(QWidget):
         
         self.scroll_area = scroll_area
         
+        # Off screen media is evicted and rebuilt as the view scrolls
+        self.governor = get_governor()
+        self.governor.register_view(self)
+        scroll_area.verticalScrollBar().valueChanged.connect(self.governor.schedule)
+        scroll_area.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+        
         self.messages_container = QWidget()
         self.messages_container.setObjectName("messagesContainer")
         self.messages_layout = QVBoxLayout(self.messages_container)
@@ -49,12 +85,32 @@ class ChatArea(QWidget):
         # Input area
         input_widget = QWidget()
         input_widget.setObjectName("inputArea")
-        input_layout = QHBoxLayout(input_widget)
-        input_layout.setContentsMargins(15, 15, 15, 15)
-        
-        self.message_input = QLineEdit()
+        input_column = QVBoxLayout(input_widget)
+        input_column.setContentsMargins(15, 15, 15, 15)
+        input_column.setSpacing(8)
+        
+        # Documents waiting to be sent with the next message
+        self.document_chips = QWidget()
+        self.document_chips.setObjectName("documentChips")
+        self.document_chips_layout = QHBoxLayout(self.document_chips)
+        self.document_chips_layout.setContentsMargins(0, 0, 0, 0)
+        self.document_chips_layout.setSpacing(6)
+        self.document_chips_layout.addStretch(1)
+        self.document_chips.hide()
+        input_column.addWidget(self.document_chips)
+        
+        input_layout = QHBoxLayout()
+        input_column.addLayout(input_layout)
+        
+        self.message_input = Composer()
         self.message_input.setPlaceholderText("Message...")
         
+        self.document_button = QPushButton("📎")
+        self.document_button.setObjectName("documentButton")
+        self.document_button.setToolTip("Attach a text file")
+        self.document_button.setFixedSize(40, 40)
+        self.document_button.clicked.connect(self.add_document)
+        
         self.image_button = QPushButton("🖼️")
         self.image_button.setObjectName("imageButton")  # Add this
         self.image_button.setToolTip("Add image")
@@ -79,6 +135,7 @@ class ChatArea(QWidget):
         self.send_button = QPushButton("Send")
         self.send_button.setFixedWidth(80)
         
+        input_layout.addWidget(self.document_button)
         input_layout.addWidget(self.image_button)
         input_layout.addWidget(self.audio_button)  # Add to your input layout
         input_layout.addWidget(self.message_input, 1)
@@ -89,22 +146,37 @@ class ChatArea(QWidget):
         
         # Connect signals
         self.send_button.clicked.connect(self.send_message)
-        self.message_input.returnPressed.connect(self.send_message)
+        self.message_input.submitted.connect(self.send_message)
+        self.message_input.textEdited.connect(self._on_input_edited)
+        self.message_input.largePaste.connect(self.add_pasted_text)
         
         # State
         self.current_model = None
-        self.message_history = []
+        self.tree = ConversationTree()
+        self.editing = None  # User node being edited, sending adds a sibling
         self.current_image = None
+        self.pending_documents = []  # Document attachments for the next message
         self.client = None
+        self.prewarmed_turn = False  # Set once the current draft triggered prewarming
+        self.last_ttft = None  # Seconds until the last reply started
+        self.pending_replies = []
+        self.tasks = set()  # In-flight requests of this conversation
+        self.loaded = True  # False while the bubbles are unloaded
+        self.first_shown = 0  # Index in message_history of the oldest bubble shown
+        self.journal = None  # ConversationJournal, replayed after a restart
         
         # Add modality support state
         self.supports_image = False
         self.supports_audio = False
 
+    @property
+    def message_history(self):
+        """Messages of the branch on screen, oldest first"""
+        return self.tree.messages()
     
     def set_current_model(self, model_config):
         self.current_model = model_config
-        self.client = OpenAIClient(model_config)
+        self.client = create_client(model_config)
         # Update modality support
         modalities = model_config.get('modalities', [])
         self.supports_image = 'image' in modalities
@@ -113,6 +185,31 @@ class ChatArea(QWidget):
         # Update button states
         self.update_button_states()
         self.clear_chat()
+        if self.journal:
+            self.journal.record_model(model_config)
+        self.start_prewarm()
+    
+    def update_model_config(self, model_config):
+        """Apply an edited config for the current model, keeping the chat"""
+        self.current_model = model_config
+        self.client = create_client(model_config)
+        modalities = model_config.get('modalities', [])
+        self.supports_image = 'image' in modalities
+        self.supports_audio = 'audio' in modalities
+        self.update_button_states()
+        self.start_prewarm()
+    
+    def start_prewarm(self):
+        """Warm DNS, connection and (for local servers) the model in the background"""
+        if not self.current_model:
+            return
+        self.client.prewarm()
+    
+    def _on_input_edited(self, text):
+        # The first keystroke of a draft is a good hint a request is coming
+        if text and not self.prewarmed_turn:
+            self.prewarmed_turn = True
+            self.start_prewarm()
     
     def update_button_states(self):
         """Update button states based on model capabilities"""
@@ -132,52 +229,306 @@ class ChatArea(QWidget):
 
 
     def clear_chat(self):
-        # Clear chat history
+        # Replies still streaming or queued belong to the old chat
+        self.cancel_tasks()
+        outbox.drop(self.conversation_id)
+        self.remove_all_bubbles()
+        self.tree = ConversationTree()
+        self.editing = None
+        self.current_image = None
+        self.clear_documents()
+        self.first_shown = 0
+        if self.journal:
+            self.journal.record_clear()
+    
+    def attach_journal(self, journal):
+        self.journal = journal
+    
+    def restore(self, model_config, tree):
+        """Rebuild a conversation replayed from its journal"""
+        if model_config:
+            self.update_model_config(model_config)
+        self.tree = tree
+        for node in tree.all_nodes():
+            for attachment in content_attachments(node.content):
+                self.governor.track(attachment)
+        # Only the newest messages get bubbles, like a reloaded tab
+        self.show_branch()
+    
+    def journal_snapshot(self):
+        """State for journal compaction, None while a reply is streaming"""
+        if self.pending_replies:
+            return None
+        return (self.current_model['name'] if self.current_model else None), self.tree
+    
+    def compact_journal(self, force=False):
+        if self.journal and (force or self.journal.needs_compaction()):
+            asyncio.ensure_future(self.journal.compact(self.journal_snapshot))
+    
+    def remove_all_bubbles(self):
         while self.messages_layout.count() > 1:  # Keep spacer
             item = self.messages_layout.itemAt(0)
             widget = item.widget()
             if widget:
                 widget.deleteLater()
             self.messages_layout.removeItem(item)
-        self.message_history = []
+    
+    def start_task(self, coro):
+        """Run a request for this conversation, cancelled when it is closed"""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+    
+    def cancel_tasks(self):
+        for task in list(self.tasks):
+            task.cancel()
+    
+    def close_conversation(self):
+        """Stop everything this conversation has in flight"""
+        self.cancel_tasks()
+        outbox.drop(self.conversation_id)
+        if self.is_recording:
+            self.stop_audio_recording()
+    
+    def unload(self):
+        """Drop all bubble widgets, keeping only history and pending replies"""
+        if not self.loaded:
+            return
+        self.remove_all_bubbles()
+        for reply in self.pending_replies:
+            reply.bubble = None
+        self.loaded = False
+    
+    def load(self):
+        """Rebuild the bubbles of an unloaded conversation, newest first"""
+        if self.loaded:
+            return
+        self.loaded = True
+        history = self.message_history
+        self.first_shown = max(0, len(history) - RELOAD_BATCH)
+        for message in history[self.first_shown:]:
+            self.add_message_bubble(*self.bubble_for_message(message))
+        if self.current_image:
+            self.add_message_bubble(MessageBubble("user", {"image": self.current_image}), Qt.AlignRight)
+        for reply in self.pending_replies:
+            self.show_reply(reply)
+    
+    def bubble_for_message(self, message):
+        """Bubble and alignment for a history entry"""
+        if message['role'] == "user":
+            bubble = MessageBubble("user", message['content'])
+            self.add_branch_controls(bubble, message.node)
+            return bubble, Qt.AlignRight
+        bubble = MessageBubble("assistant", message['content'])
+        bubble.finish_content()
+        self.add_branch_controls(bubble, message.node)
+        return bubble, Qt.AlignLeft
+    
+    def add_branch_controls(self, bubble, node):
+        """Regenerate or edit buttons, and sibling navigation when there are alternatives"""
+        siblings = self.tree.siblings(node)
+        bubble.add_branch_controls(siblings.index(node), len(siblings))
+        bubble.branchRequested.connect(lambda step, node=node: self.switch_branch(node, step))
+        if node.role == "assistant":
+            bubble.regenerateRequested.connect(lambda node=node: self.regenerate(node))
+        else:
+            bubble.editRequested.connect(lambda node=node: self.edit_message(node))
+    
+    def show_branch(self):
+        """Rebuild the bubbles after the branch on screen changed"""
+        self.unload()
+        self.load()
+    
+    def switch_branch(self, node, step):
+        siblings = self.tree.siblings(node)
+        index = siblings.index(node) + step
+        if not 0 <= index < len(siblings):
+            return
+        self.tree.switch(siblings[index])
+        if self.journal:
+            self.journal.record_select(self.tree.current)
+        self.show_branch()
+    
+    def regenerate(self, node):
+        """Ask again for the reply `node`, keeping it as a sibling branch"""
+        if not self.client:
+            return
+        self.tree.select(node.parent)
+        if self.journal:
+            self.journal.record_select(node.parent)
+        self.show_branch()
+        self.start_task(self.get_ai_response())
+    
+    def edit_message(self, node):
+        """Load a user message into the input, sending it starts a new branch.
+
+        Its attachments come back as pending ones, so the edit is sent
+        with what the composer holds, not merged into the old content.
+        """
+        content = node.content
+        text = content.get('text', '') if isinstance(content, dict) else content
+        self.editing = node
+        self.clear_documents()
         self.current_image = None
+        if isinstance(content, dict):
+            for document in content.get('documents', []):
+                self.attach_document(document)
+            if content.get('image') is not None:
+                self.current_image = content['image']
+                self.add_message_bubble(MessageBubble("user", {"image": self.current_image}), Qt.AlignRight)
+        self.message_input.setText(text)
+        self.message_input.setPlaceholderText("Edit message...")
+        self.message_input.setFocus()
+    
+    def _on_scrolled(self, value):
+        # Older messages of a reloaded conversation are rebuilt on demand
+        if value == 0 and self.loaded and self.first_shown > 0:
+            self.load_earlier()
+    
+    def evict_earlier(self, keep, excess):
+        """Drop bubbles of the oldest messages more than `keep` pixels above the view.
+
+        They are rebuilt by load_earlier when scrolled back to. Stops once
+        about `excess` bytes are freed, returns the bytes freed.
+        """
+        if not self.loaded:
+            return 0
+        scrollbar = self.scroll_area.verticalScrollBar()
+        top = scrollbar.value()
+        old_maximum = scrollbar.maximum()
+        shown = len(self.message_history) - self.first_shown
+        freed = removed = 0
+        # Bubbles start with the history shown, a preview or pending replies follow
+        for bubble in self.bubbles()[:shown]:
+            if freed >= excess or top - bubble.geometry().bottom() <= keep:
+                break
+            freed += bubble.widget_bytes() + bubble.media_bytes()
+            self.messages_layout.removeWidget(bubble)
+            bubble.deleteLater()
+            removed += 1
+        if removed:
+            self.first_shown += removed
+            # Keep the message at the top of the view in place
+            QTimer.singleShot(0, lambda: scrollbar.setValue(top - (old_maximum - scrollbar.maximum())))
+        return freed
+    
+    def load_earlier(self):
+        scrollbar = self.scroll_area.verticalScrollBar()
+        old_maximum = scrollbar.maximum()
+        start = max(0, self.first_shown - RELOAD_BATCH)
+        for offset, message in enumerate(self.message_history[start:self.first_shown]):
+            bubble, alignment = self.bubble_for_message(message)
+            self.messages_layout.insertWidget(offset, bubble, alignment=alignment)
+        self.first_shown = start
+        # Keep the message that was at the top in place
+        QTimer.singleShot(0, lambda: scrollbar.setValue(scrollbar.maximum() - old_maximum))
     
     def add_image(self):
         file_path, _ = QFileDialog.getOpenFileName(
             self, "Select Image", "", "Images (*.png *.jpg *.jpeg *.bmp)"
         )
         if file_path:
-            base64_image = image_to_base64(file_path)
-            if base64_image:
-                self.current_image = base64_image
+            image_data = image_to_png_bytes(file_path)
+            if image_data:
+                self.current_image = Attachment(image_data, "image/png", "image")
+                self.governor.track(self.current_image)
                 
                 # Show preview
-                preview = MessageBubble("user", {"image_base64": base64_image})
+                preview = MessageBubble("user", {"image": self.current_image})
                 self.add_message_bubble(preview, Qt.AlignRight)
     
+    def add_document(self):
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Select Text File", "",
+            "Text files (*.txt *.md *.log *.csv *.json *.xml *.yaml *.yml *.py);;All files (*)"
+        )
+        if file_path:
+            self.start_task(self.load_document(file_path))
+    
+    async def load_document(self, path):
+        """Read a text file off the GUI thread and add it to the next message"""
+        self.document_button.setEnabled(False)
+        self.document_button.setText("⏳")
+        try:
+            loop = asyncio.get_running_loop()
+            attachment = await loop.run_in_executor(None, ingest_text_file, path)
+        except (OSError, ValueError) as e:
+            error_bubble = MessageBubble("assistant", f"Document error: {str(e)}")
+            self.add_message_bubble(error_bubble, Qt.AlignLeft)
+            return
+        finally:
+            self.document_button.setEnabled(True)
+            self.document_button.setText("📎")
+        self.attach_document(attachment)
+    
+    def add_pasted_text(self, text):
+        """Slot for Composer.largePaste, the text is sent as a document"""
+        attachment = text_attachment(text)
+        self.governor.track(attachment)
+        self.attach_document(attachment)
+    
+    def attach_document(self, attachment):
+        # The same file or paste twice is only sent once
+        if any(document.digest() == attachment.digest() for document in self.pending_documents):
+            return
+        self.pending_documents.append(attachment)
+        chip = DocumentChip(attachment)
+        chip.removeRequested.connect(self.remove_document)
+        self.document_chips_layout.insertWidget(self.document_chips_layout.count() - 1, chip)
+        self.document_chips.show()
+    
+    def remove_document(self, attachment):
+        self.pending_documents = [d for d in self.pending_documents if d is not attachment]
+        for i in range(self.document_chips_layout.count()):
+            chip = self.document_chips_layout.itemAt(i).widget()
+            if isinstance(chip, DocumentChip) and chip.attachment is attachment:
+                self.document_chips_layout.removeWidget(chip)
+                chip.deleteLater()
+                break
+        self.document_chips.setVisible(bool(self.pending_documents))
+    
+    def clear_documents(self):
+        for attachment in list(self.pending_documents):
+            self.remove_document(attachment)
+    
     def send_message(self):
         text = self.message_input.text().strip()
-        if not text and not self.current_image:
+        if not text and not self.current_image and not self.pending_documents:
             return
         
         # Create message content
         content = {"text": text} if text else {}
         if self.current_image:
-            content["image_base64"] = self.current_image
-        
-        # Add user message
-        user_bubble = MessageBubble("user", content)
-        self.add_message_bubble(user_bubble, Qt.AlignRight)
-        
-        # Add to history
-        self.message_history.append({"role": "user", "content": content})
+            content["image"] = self.current_image
+        if self.pending_documents:
+            content["documents"] = list(self.pending_documents)
+        
+        if self.editing is not None:
+            # The edit becomes a sibling of the original, sharing its prefix
+            edited = self.editing
+            self.editing = None
+            self.message_input.setPlaceholderText("Message...")
+            self.tree.select(edited.parent)
+            node = self.tree.add("user", content)
+            self.show_branch()
+        else:
+            # Add user message
+            node = self.tree.add("user", content)
+            user_bubble = MessageBubble("user", content)
+            self.add_branch_controls(user_bubble, node)
+            self.add_message_bubble(user_bubble, Qt.AlignRight)
+        if self.journal:
+            self.journal.record_message(node)
         
         # Clear input
         self.message_input.clear()
         self.current_image = None
+        self.clear_documents()
+        self.prewarmed_turn = False
         
         # Get AI response
-        asyncio.create_task(self.get_ai_response())
+        self.start_task(self.get_ai_response())
     
     def add_message_bubble(self, bubble, alignment):
         # Insert before spacer
@@ -190,62 +541,186 @@ class ChatArea(QWidget):
         bubble.adjustSize()
         self.messages_container.adjustSize()
         self.scroll_to_bottom()
+        self.governor.schedule()
+    
+    def bubbles(self):
+        """Message bubbles currently in the view, oldest first"""
+        result = []
+        for i in range(self.messages_layout.count()):
+            widget = self.messages_layout.itemAt(i).widget()
+            if isinstance(widget, MessageBubble):
+                result.append(widget)
+        return result
+    
+    def bubble_distances(self):
+        """Viewport height and each bubble's distance in pixels from the visible area"""
+        top = self.scroll_area.verticalScrollBar().value()
+        height = self.scroll_area.viewport().height()
+        bottom = top + height
+        distances = []
+        for bubble in self.bubbles():
+            geometry = bubble.geometry()
+            distance = max(0, top - geometry.bottom(), geometry.top() - bottom)
+            distances.append((bubble, distance))
+        return height, distances
 
 
         
-    async def get_ai_response(self):
-        # Add thinking message
-        thinking_bubble = MessageBubble("assistant", "Thinking...")
-        self.add_message_bubble(thinking_bubble, Qt.AlignLeft)
-        
+    async def get_ai_response(self, parent=None, reply_id=None, queued=False):
+        """Request a reply to `parent` (the branch on screen by default).
+
+        When the endpoint cannot be reached the request waits in the outbox
+        and fills the same bubble once it is back, `queued` resumes a
+        request left in the outbox by the last run.
+        """
+        # Shows a thinking bubble until the first chunk arrives
+        # The reply answers the branch as it is now, even if the user switches away
+        parent = parent or self.tree.current
+        reply = PendingReply(parent, reply_id or self.tree.new_id())
+        reply_id = reply.node_id
+        history = self.tree.messages(parent)
+        self.pending_replies.append(reply)
+        if queued:
+            reply.status = "Waiting for connection..."
+        self.show_reply(reply)
+        if self.journal:
+            self.journal.start_reply(reply_id, parent)
+        
+        def on_queued(error):
+            reply.status = "Waiting for connection..."
+            self.show_reply(reply)
+        
+        entry = {
+            "conversation": self.conversation_id,
+            "parent": parent.id,
+            "reply": reply_id,
+            "endpoint": self.current_model["endpoint"],
+            "model": self.current_model["name"],
+        }
         try:
-            full_response = ""
-            response_bubble = None
-            
-            # For streaming API
-            if hasattr(self.client, 'stream_response'):
-                async for chunk in self.client.stream_response(self.message_history):
-                    if not response_bubble:
-                        # Remove thinking bubble
-                        self.remove_message_bubble(thinking_bubble)
-                        
-                        # Create new bubble for actual response
-                        response_bubble = MessageBubble("assistant", chunk)
-                        self.add_message_bubble(response_bubble, Qt.AlignLeft)
-                    else:
-                        # Update existing bubble
-                        full_response += chunk
-                        response_bubble.update_content(full_response)
-                    
-                    # Add small delay to reduce flickering
-                    await asyncio.sleep(0.05)
-                    self.scroll_to_bottom()
-            else:
-                # Non-streaming fallback
-                response = await self.client.send_request(self.message_history)
-                self.remove_message_bubble(thinking_bubble)
-                response_bubble = MessageBubble("assistant", response)
-                self.add_message_bubble(response_bubble, Qt.AlignLeft)
-                full_response = response
+            await outbox.send(entry, lambda: self.receive_reply(reply, history), on_queued, queued=queued)
             
             # Add to history
-            self.message_history.append({"role": "assistant", "content": full_response})
+            node = self.tree.add("assistant", reply.text, parent=parent, node_id=reply_id)
+            if self.journal:
+                self.journal.end_reply(reply_id)
+            if reply.bubble is not None:
+                self.add_branch_controls(reply.bubble, node)
             
         except Exception as e:
-            # Remove thinking bubble
-            self.remove_message_bubble(thinking_bubble)
-            
             # Create full error message
             error_msg = f"Error: {str(e)}"
             # Ensure we can see the full error
             if len(error_msg) > 100:
                 error_msg = error_msg[:100] + "..."  # Truncate very long errors
                 
-            # Show error message
-            error_bubble = MessageBubble("assistant", error_msg)
-            self.add_message_bubble(error_bubble, Qt.AlignLeft)
+            # Show error message in place of the reply
+            reply.chunks = [error_msg]
+            self.show_reply(reply)
+            if self.journal:
+                self.journal.abort_reply(reply_id)
+        finally:
+            self.pending_replies.remove(reply)
+            
+        self.scroll_to_bottom()
+        self.compact_journal()
+
+    async def receive_reply(self, reply, history):
+        """Stream (or fetch) the reply text into `reply` and its bubble"""
+        reply_id = reply.node_id
+        started = time.monotonic()
+        # For streaming API
+        if self.client.supports_streaming:
+            async for chunk in self.client.stream_response(history):
+                first = not reply.chunks
+                reply.chunks.append(chunk)
+                if self.journal:
+                    self.journal.record_chunk(reply_id, chunk)
+                if first:
+                    self.log_time_to_first_token(started)
+                    self.show_reply(reply)
+                else:
+                    reply.unrendered.append(chunk)
+                    self.render_reply(reply)
             
+            if not reply.chunks:
+                # Stream ended without any text
+                reply.chunks.append("No response from model")
+                self.show_reply(reply)
+                if self.journal:
+                    self.journal.record_chunk(reply_id, reply.text)
+        else:
+            # Non-streaming fallback
+            response = await self.client.send_request(history)
+            self.log_time_to_first_token(started)
+            reply.chunks.append(response)
+            self.show_reply(reply)
+            if self.journal:
+                self.journal.record_chunk(reply_id, response)
+        
+        self.render_reply(reply, final=True)
+
+    @property
+    def conversation_id(self):
+        return self.journal.conversation_id if self.journal else str(id(self))
+
+    def resume_outbox(self):
+        """Restart the requests this conversation left queued in the outbox"""
+        for entry in outbox.entries_for(self.conversation_id):
+            parent = self.tree.get(entry["parent"])
+            if parent is None or not self.client:
+                outbox.remove(entry["key"])
+                continue
+            self.start_task(self.get_ai_response(parent, entry["reply"], queued=True))
+
+    def show_reply(self, reply):
+        """(Re)create the bubble of a pending reply, if its branch is on screen"""
+        if not self.loaded or not self.tree.on_branch(reply.parent):
+            return
+        text = reply.text
+        bubble = MessageBubble("assistant", text or reply.status)
+        reply.unrendered = []
+        reply.last_update = time.monotonic()
+        if reply.bubble is not None:
+            self.replace_message_bubble(reply.bubble, bubble)
+        else:
+            self.add_message_bubble(bubble, Qt.AlignLeft)
+        reply.bubble = bubble
+
+    def render_reply(self, reply, final=False):
+        """Push buffered chunks into the reply bubble, coalescing repaints"""
+        if reply.bubble is None:
+            # Unloaded, the full text is rendered when the view is shown again
+            reply.unrendered = []
+            return
+        if not final and time.monotonic() - reply.last_update < STREAM_UPDATE_INTERVAL:
+            return
+        if reply.unrendered:
+            # Reduce flickering without delaying the stream
+            reply.bubble.append_content("".join(reply.unrendered))
+            reply.unrendered = []
+        reply.last_update = time.monotonic()
+        if final:
+            reply.bubble.finish_content()
+        self.scroll_to_bottom()
+
+    def replace_message_bubble(self, old_bubble, new_bubble):
+        """Swap a bubble for another at the same position"""
+        index = self.messages_layout.indexOf(old_bubble)
+        if index < 0:
+            self.add_message_bubble(new_bubble, Qt.AlignLeft)
+            return
+        self.messages_layout.removeWidget(old_bubble)
+        old_bubble.deleteLater()
+        self.messages_layout.insertWidget(index, new_bubble, alignment=Qt.AlignLeft)
+        new_bubble.adjustSize()
+        self.messages_container.adjustSize()
         self.scroll_to_bottom()
+        self.governor.schedule()
+
+    def log_time_to_first_token(self, started):
+        self.last_ttft = time.monotonic() - started
+        logging.info(f"Time to first token ({self.current_model['name']}): {self.last_ttft * 1000:.0f} ms")
 
     def remove_message_bubble(self, bubble):
         """Remove a message bubble from the layout"""
@@ -325,21 +800,25 @@ class ChatArea(QWidget):
             return
             
         try:
-            # Convert to base64
-            base64_audio = audio_to_base64(self.audio_data, self.sample_rate)
+            # Convert to WAV, encoded only when a request is built
+            wav_data = audio_to_wav_bytes(self.audio_data, self.sample_rate)
             
             # Create message content
-            content = {"audio_base64": base64_audio}
+            content = {"audio": Attachment(wav_data, "audio/wav", "audio")}
+            self.governor.track(content["audio"])
+            
+            # Add to history
+            node = self.tree.add("user", content)
+            if self.journal:
+                self.journal.record_message(node)
             
             # Add user message (audio)
             user_bubble = MessageBubble("user", content)
+            self.add_branch_controls(user_bubble, node)
             self.add_message_bubble(user_bubble, Qt.AlignRight)
             
-            # Add to history
-            self.message_history.append({"role": "user", "content": content})
-            
             # Send to API
-            asyncio.create_task(self.get_ai_response())
+            self.start_task(self.get_ai_response())
         except Exception as e:
             print(f"Audio processing error: {str(e)}")
             error_bubble = MessageBubble("assistant", f"Audio error: {str(e)}")
@@ -1,80 +1,369 @@
-from PySide6.QtWidgets import QWidget, QTextEdit, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout
+from PySide6.QtWidgets import QWidget, QPlainTextEdit, QPushButton, QVBoxLayout, QHBoxLayout
+from PySide6.QtGui import QTextCursor, QTextCharFormat, QColor, QFont
 from PySide6.QtCore import QTimer
-from .api_client import OpenAIClient
+from .network_thread import create_client
+from .composer import Composer
+from .conversation_tree import ConversationTree
+from .outbox import outbox
 import asyncio
+import logging
+import time
+
+
+class TranscriptEntry:
+    """A message in the transcript, tracked by two cursors.
+
+    Qt shifts cursor positions when text before them changes, so the
+    entry can be replaced or extended without searching the document.
+    The text is kept too, so a pending reply survives an unloaded
+    transcript and is shown again by load().
+    """
+
+    def __init__(self, sender, text):
+        self.sender = sender
+        self.parts = [text]  # Streamed chunks, joined when the entry is shown again
+        self.start = self.end = None  # Cursors, None while not in the document
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def attach(self, document, start, end):
+        self.start = QTextCursor(document)
+        self.start.setPosition(start)
+        self.start.setKeepPositionOnInsert(True)  # Stays before text inserted at it
+        self.end = QTextCursor(document)
+        self.end.setPosition(end)
+
+    def detach(self):
+        self.start = self.end = None
+
+    def select(self):
+        cursor = QTextCursor(self.start)
+        cursor.setPosition(self.end.position(), QTextCursor.KeepAnchor)
+        return cursor
+
+
+def message_text(content):
+    """Text shown for a history entry, attachments are not rendered here"""
+    if isinstance(content, dict):
+        return content.get("text", "")
+    return content
+
 
 class ChatWidget(QWidget):
-    def __init__(self):
+    """Lightweight chat view for weak machines.
+
+    Text only, rendered into a single QPlainTextEdit. Messages are appended
+    and replaced through cursor edits, and the oldest blocks are trimmed
+    once the transcript grows past `max_blocks`.
+    """
+
+    def __init__(self, max_blocks=5000):
         super().__init__()
+        self.setObjectName("chatArea")
         self.current_model = None
-        self.message_history = []
-        
+        self.client = None
+        self.tree = ConversationTree()  # Only the branch on screen is shown here
+        self.max_blocks = max_blocks
+        self.pending = []  # Entries of replies still being written
+        self.prewarmed_turn = False
+        self.last_ttft = None
+        self.tasks = set()  # In-flight requests of this conversation
+        self.loaded = True  # False while the transcript is unloaded
+        self.journal = None  # ConversationJournal, replayed after a restart
+
         # Create UI
         layout = QVBoxLayout(self)
-        
+
         # Chat display
-        self.chat_display = QTextEdit()
+        self.chat_display = QPlainTextEdit()
         self.chat_display.setReadOnly(True)
+        self.chat_display.setUndoRedoEnabled(False)  # No undo history to grow
+        self.document = self.chat_display.document()
         layout.addWidget(self.chat_display, 1)
-        
+
+        # Formats for the sender prefixes
+        self.prefix_formats = {}
+        for sender, color in (("user", "#6ea8fe"), ("assistant", "#4CAF50"), ("system", "#858585")):
+            fmt = QTextCharFormat()
+            fmt.setForeground(QColor(color))
+            fmt.setFontWeight(QFont.Bold)
+            self.prefix_formats[sender] = fmt
+        self.text_format = QTextCharFormat()
+
         # Input area
         input_layout = QHBoxLayout()
-        self.message_input = QLineEdit()
+        self.message_input = Composer(paste_limit=None)  # Text only, pastes stay in the input
+        self.message_input.setPlaceholderText("Message...")
         self.send_button = QPushButton("Send")
         input_layout.addWidget(self.message_input, 1)
         input_layout.addWidget(self.send_button)
         layout.addLayout(input_layout)
-        
+
         # Connections
         self.send_button.clicked.connect(self.send_message)
-        self.message_input.returnPressed.connect(self.send_message)
-    
+        self.message_input.submitted.connect(self.send_message)
+        self.message_input.textEdited.connect(self._on_input_edited)
+
     def set_current_model(self, model_config):
         self.current_model = model_config
-        self.client = OpenAIClient(model_config)
-        self.chat_display.append(f"\n=== Switched to: {model_config['name']} ===")
-    
+        self.client = create_client(model_config)
+        self.add_message("system", f"=== Switched to: {model_config['name']} ===")
+        if self.journal:
+            self.journal.record_model(model_config)
+        self.start_prewarm()
+
+    def update_model_config(self, model_config):
+        """Apply an edited config for the current model, keeping the chat"""
+        self.current_model = model_config
+        self.client = create_client(model_config)
+        self.start_prewarm()
+
+    def start_prewarm(self):
+        if not self.current_model:
+            return
+        self.client.prewarm()
+
+    def _on_input_edited(self, text):
+        if text and not self.prewarmed_turn:
+            self.prewarmed_turn = True
+            self.start_prewarm()
+
+    def clear_chat(self):
+        # Replies still streaming belong to the old chat, stop them before
+        # their entries' cursors write into the cleared document
+        self.cancel_tasks()
+        outbox.drop(self.conversation_id)
+        self.chat_display.clear()
+        self.tree = ConversationTree()
+        self.pending = []
+        if self.journal:
+            self.journal.record_clear()
+
+    @property
+    def message_history(self):
+        return self.tree.messages()
+
+    def attach_journal(self, journal):
+        self.journal = journal
+
+    def restore(self, model_config, tree):
+        """Rebuild a conversation replayed from its journal"""
+        if model_config:
+            self.update_model_config(model_config)
+        self.tree = tree
+        for message in tree.messages():
+            self.add_message(message["role"], message_text(message["content"]))
+
+    def journal_snapshot(self):
+        """State for journal compaction, None while a reply is streaming"""
+        if self.pending:
+            return None
+        return (self.current_model["name"] if self.current_model else None), self.tree
+
+    def compact_journal(self, force=False):
+        if self.journal and (force or self.journal.needs_compaction()):
+            asyncio.ensure_future(self.journal.compact(self.journal_snapshot))
+
     def send_message(self):
         message = self.message_input.text().strip()
         if not message or not self.current_model:
             return
-        
+
         self.message_input.clear()
+        self.prewarmed_turn = False
         self.add_message("user", message)
-        
+        node = self.tree.add("user", message)
+        if self.journal:
+            self.journal.record_message(node)
+
         # Schedule async task
-        asyncio.create_task(self.get_ai_response(message))
-    
-    async def get_ai_response(self, user_message):
+        self.start_task(self.get_ai_response())
+
+    def start_task(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def cancel_tasks(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    def close_conversation(self):
+        self.cancel_tasks()
+        outbox.drop(self.conversation_id)
+
+    def unload(self):
+        """Drop the transcript text, keeping the tree and pending replies"""
+        if not self.loaded:
+            return
+        for entry in self.pending:
+            entry.detach()
+        self.chat_display.clear()
+        self.loaded = False
+
+    def load(self):
+        """Rebuild the transcript of the branch on screen from the tree"""
+        if self.loaded:
+            return
+        self.loaded = True
+        for message in self.tree.messages():
+            self.add_message(message["role"], message_text(message["content"]))
+        for entry in self.pending:
+            self.show_entry(entry)
+
+    async def get_ai_response(self, parent=None, reply_id=None, queued=False):
         # Add temporary "Thinking..." message
-        self.add_message("assistant", "Thinking...")
-        self.thinking_message_id = self.chat_display.toPlainText().rfind("Thinking...")
-        
+        entry = self.add_message("assistant", "Waiting for connection..." if queued else "Thinking...")
+        self.pending.append(entry)
+        parent = parent or self.tree.current
+        reply_id = reply_id or self.tree.new_id()
+        history = self.tree.messages(parent)
+        if self.journal:
+            self.journal.start_reply(reply_id, parent)
+
+        async def receive():
+            started = time.monotonic()
+            response = ""
+            if self.client.supports_streaming:
+                async for chunk in self.client.stream_response(history):
+                    if not response:
+                        self.log_time_to_first_token(started)
+                        self.replace_message(entry, chunk)
+                    else:
+                        self.append_to_message(entry, chunk)
+                    response += chunk
+                    if self.journal:
+                        self.journal.record_chunk(reply_id, chunk)
+                if not response:
+                    response = "No response from model"
+                    self.replace_message(entry, response)
+                    if self.journal:
+                        self.journal.record_chunk(reply_id, response)
+            else:
+                response = await self.client.send_request(history)
+                self.log_time_to_first_token(started)
+                self.replace_message(entry, response)
+                if self.journal:
+                    self.journal.record_chunk(reply_id, response)
+            return response
+
+        # Unreachable endpoints queue the request in the outbox, it fills this entry later
+        request = {
+            "conversation": self.conversation_id,
+            "parent": parent.id,
+            "reply": reply_id,
+            "endpoint": self.current_model["endpoint"],
+            "model": self.current_model["name"],
+        }
         try:
-            self.message_history.append({"role": "user", "content": user_message})
-            response = await self.client.send_request(self.message_history)
-            self.message_history.append({"role": "assistant", "content": response})
-            
-            # Update UI with actual response
-            self.update_last_message(response)
+            response = await outbox.send(
+                request, receive, lambda error: self.replace_message(entry, "Waiting for connection..."), queued=queued
+            )
+            self.tree.add("assistant", response, parent=parent, node_id=reply_id)
+            if self.journal:
+                self.journal.end_reply(reply_id)
         except Exception as e:
-            self.update_last_message(f"Error: {str(e)}")
-    
+            self.replace_message(entry, f"Error: {str(e)}")
+            if self.journal:
+                self.journal.abort_reply(reply_id)
+        finally:
+            # clear_chat cancels the task and drops the entry itself
+            if entry in self.pending:
+                self.pending.remove(entry)
+            self.trim_blocks()
+        self.compact_journal()
+
+    @property
+    def conversation_id(self):
+        return self.journal.conversation_id if self.journal else str(id(self))
+
+    def resume_outbox(self):
+        """Restart the requests this conversation left queued in the outbox"""
+        for request in outbox.entries_for(self.conversation_id):
+            parent = self.tree.get(request["parent"])
+            if parent is None or not self.client:
+                outbox.remove(request["key"])
+                continue
+            self.start_task(self.get_ai_response(parent, request["reply"], queued=True))
+
+    def log_time_to_first_token(self, started):
+        self.last_ttft = time.monotonic() - started
+        logging.info(f"Time to first token ({self.current_model['name']}): {self.last_ttft * 1000:.0f} ms")
+
     def add_message(self, sender, text):
-        prefix = "You: " if sender == "user" else "AI: "
-        self.chat_display.append(f"{prefix}{text}")
-    
+        """Append a message as new blocks, returns its TranscriptEntry"""
+        entry = TranscriptEntry(sender, text)
+        if self.loaded:
+            self.show_entry(entry)
+        return entry
+
+    def show_entry(self, entry):
+        """Insert an entry at the end of the document and track it"""
+        # The document always ends with an empty block, so new messages are
+        # inserted after the end cursor of a reply that is still streaming
+        cursor = QTextCursor(self.document)
+        cursor.movePosition(QTextCursor.End)
+
+        prefix = {"user": "You: ", "assistant": "AI: "}.get(entry.sender, "")
+        if prefix:
+            cursor.insertText(prefix, self.prefix_formats[entry.sender])
+            start = cursor.position()
+            cursor.insertText(entry.text, self.text_format)
+        else:
+            start = cursor.position()
+            cursor.insertText(entry.text, self.prefix_formats[entry.sender])
+        end = cursor.position()
+        cursor.insertBlock()
+
+        entry.attach(self.document, start, end)
+        self.trim_blocks()
+        self.scroll_to_bottom()
+
+    def replace_message(self, entry, new_text):
+        """Replace the text of an entry in place"""
+        entry.parts = [new_text]
+        if entry.start is None:
+            return
+        cursor = entry.select()
+        cursor.insertText(new_text, self.text_format)
+        self.scroll_to_bottom()
+
+    def append_to_message(self, entry, text):
+        """Stream more text into an entry, cost depends only on the chunk"""
+        entry.parts.append(text)
+        if entry.start is None:
+            return
+        cursor = QTextCursor(entry.end)
+        cursor.insertText(text, self.text_format)
+        self.scroll_to_bottom()
+
     def update_last_message(self, new_text):
-        # Get current text
-        current_text = self.chat_display.toPlainText()
-        
-        # Find position of "Thinking..." message
-        if hasattr(self, 'thinking_message_id') and self.thinking_message_id != -1:
-            # Replace "Thinking..." with actual response
-            new_text = current_text[:self.thinking_message_id] + f"AI: {new_text}"
-            self.chat_display.setPlainText(new_text)
-        
-        # Scroll to bottom
-        self.chat_display.verticalScrollBar().setValue(
-            self.chat_display.verticalScrollBar().maximum()
-        )
\ No newline at end of file
+        if self.pending:
+            self.replace_message(self.pending[-1], new_text)
+
+    def trim_blocks(self):
+        """Drop the oldest blocks once the transcript exceeds max_blocks"""
+        excess = self.document.blockCount() - self.max_blocks
+        if excess <= 0:
+            return
+
+        # Never cut into a reply that is still streaming
+        shown = [e for e in self.pending if e.start is not None]
+        limit = min((e.start.block().blockNumber() for e in shown), default=excess)
+        excess = min(excess, limit)
+        if excess <= 0:
+            return
+
+        cursor = QTextCursor(self.document)
+        cursor.movePosition(QTextCursor.Start)
+        cursor.movePosition(QTextCursor.NextBlock, QTextCursor.KeepAnchor, excess)
+        cursor.removeSelectedText()
+
+    def scroll_to_bottom(self):
+        # Only follow the stream when the user has not scrolled up
+        scrollbar = self.chat_display.verticalScrollBar()
+        if scrollbar.value() >= scrollbar.maximum() - 4:
+            QTimer.singleShot(0, lambda: scrollbar.setValue(scrollbar.maximum()))
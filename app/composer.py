@@ -0,0 +1,107 @@
+from PySide6.QtWidgets import QPlainTextEdit, QFrame, QHBoxLayout, QLabel, QPushButton
+from PySide6.QtCore import Qt, QEvent, Signal
+from PySide6.QtGui import QTextCursor
+
+from .diagnostics import format_bytes
+
+MAX_LINES = 8  # The composer grows with its text up to this many lines, then scrolls
+PASTE_LIMIT = 10000  # Pastes longer than this many characters become a document
+PREVIEW_CHARS = 600  # Text shown in the tooltip of a document chip
+
+
+class Composer(QPlainTextEdit):
+    """Multi-line message input.
+
+    Enter sends and Shift+Enter starts a new line. `text()`, `setText()`
+    and `textEdited` keep the QLineEdit interface the chat views were
+    written against. Large pastes are handed to the view through
+    `largePaste` instead of being laid out in the input.
+    """
+    submitted = Signal()
+    textEdited = Signal(str)  # Only for edits by the user, like QLineEdit
+    largePaste = Signal(str)
+
+    def __init__(self, paste_limit=PASTE_LIMIT, parent=None):
+        super().__init__(parent)
+        self.setObjectName("composer")
+        self.paste_limit = paste_limit  # None keeps every paste in the input
+        self.setTabChangesFocus(True)
+        self.setLineWrapMode(QPlainTextEdit.WidgetWidth)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self._setting_text = False
+        self.document().contentsChanged.connect(self._fit_height)
+        self.textChanged.connect(self._on_text_changed)
+        self._fit_height()
+
+    def text(self):
+        return self.toPlainText()
+
+    def setText(self, text):
+        self._setting_text = True
+        try:
+            self.setPlainText(text)
+        finally:
+            self._setting_text = False
+        self.moveCursor(QTextCursor.End)
+
+    def keyPressEvent(self, event):
+        if event.key() in (Qt.Key_Return, Qt.Key_Enter) and not event.modifiers() & Qt.ShiftModifier:
+            self.submitted.emit()
+            return
+        super().keyPressEvent(event)
+
+    def insertFromMimeData(self, source):
+        if self.paste_limit is not None and source.hasText():
+            text = source.text()
+            if len(text) > self.paste_limit:
+                self.largePaste.emit(text)
+                return
+        super().insertFromMimeData(source)
+
+    def _on_text_changed(self):
+        if not self._setting_text:
+            self.textEdited.emit(self.toPlainText())
+
+    def _fit_height(self):
+        # The plain text layout measures document height in lines
+        lines = max(1, min(int(self.document().size().height()), MAX_LINES))
+        margins = self.contentsMargins()
+        frame = int(self.document().documentMargin() * 2) + margins.top() + margins.bottom()
+        self.setFixedHeight(self.fontMetrics().lineSpacing() * lines + frame)
+
+
+class DocumentChip(QFrame):
+    """Document waiting to be sent, shown above the composer with a remove button"""
+    removeRequested = Signal(object)
+
+    def __init__(self, attachment, parent=None):
+        super().__init__(parent)
+        self.setObjectName("documentChip")
+        self.attachment = attachment
+        row = QHBoxLayout(self)
+        row.setContentsMargins(8, 2, 4, 2)
+        row.setSpacing(4)
+
+        label = QLabel(f"📄 {document_summary(attachment)}")
+        label.setObjectName("documentChipLabel")
+        row.addWidget(label)
+
+        remove_button = QPushButton("×")
+        remove_button.setToolTip("Remove")
+        remove_button.setFixedSize(20, 20)
+        remove_button.clicked.connect(lambda: self.removeRequested.emit(self.attachment))
+        row.addWidget(remove_button)
+
+    def event(self, event):
+        # The preview is only read from the document when it is hovered
+        if event.type() == QEvent.ToolTip and not self.toolTip():
+            self.setToolTip(self.attachment.preview(PREVIEW_CHARS))
+        return super().event(event)
+
+
+def document_summary(attachment):
+    """Chip text of a document, like "notes.txt · 1.2 MB · 340 lines" """
+    parts = [attachment.filename, format_bytes(attachment.size)]
+    if attachment.line_count:
+        parts.append(f"{attachment.line_count:,} lines")
+    return " · ".join(parts)
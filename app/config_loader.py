@@ -1,13 +1,68 @@
 import json
 import os
+import sys
 
-def load_models_config():
-    with open('models.json', 'r') as f:
+CONFIG_FILENAME = 'models.json'
+SETTINGS_FILENAME = 'settings.json'
+
+# App-wide options, settings.json overrides any of them
+DEFAULT_SETTINGS = {
+    "chat_view": "bubbles",  # "lite" uses the plain text ChatWidget on weak machines
+    "lite_max_blocks": 5000,  # Oldest transcript blocks are trimmed past this
+    "data_dir": None,  # Defaults to ~/.notgpt
+    "memory_budget_mb": 256,  # Media and widgets above this are evicted or spilled to disk
+    "tab_unload_after": 60,  # Seconds before a background tab drops its widgets
+    "network_thread": False,  # Run API requests on their own event loop, off the GUI thread
+    "gateway_host": "127.0.0.1",  # Where `main.py --gateway` listens
+    "gateway_port": 8765,
+}
+
+def env_key_name(model_name):
+    """Environment variable holding the API key for a model entry"""
+    return f"{model_name.upper().replace(' ', '_')}_API_KEY"
+
+def api_key_for(model):
+    """API key from the entry itself or from its environment variable"""
+    return model.get('api_key', '') or os.getenv(env_key_name(model['name']), '')
+
+def find_config_file(filename):
+    """Locate a config file in the working directory or next to the app"""
+    if os.path.exists(filename):
+        return os.path.abspath(filename)
+
+    # Frozen builds ship the config files next to the executable
+    if getattr(sys, 'frozen', False):
+        app_dir = os.path.dirname(sys.executable)
+    else:
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(app_dir, filename)
+
+def find_models_config():
+    return find_config_file(CONFIG_FILENAME)
+
+def load_settings(path=None):
+    """App settings with defaults filled in, settings.json is optional"""
+    settings = dict(DEFAULT_SETTINGS)
+    path = path or find_config_file(SETTINGS_FILENAME)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            settings.update(json.load(f))
+    return settings
+
+def data_dir(settings, *parts):
+    """Folder under the app's data directory, created on first use"""
+    root = settings.get("data_dir") or os.path.join(os.path.expanduser("~"), ".notgpt")
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def load_models_config(path=None):
+    with open(path or find_models_config(), 'r') as f:
         models = json.load(f)
-    
+
     # Set environment variables for API keys
     for model in models:
         if model.get('api_key'):
-            os.environ[f"{model['name'].upper().replace(' ', '_')}_API_KEY"] = model['api_key']
-    
-    return models
\ No newline at end of file
+            os.environ[env_key_name(model['name'])] = model['api_key']
+
+    return models
@@ -0,0 +1,117 @@
+class Message(dict):
+    """History entry handed to the API client.
+
+    A plain {"role", "content"} dict that also knows its tree node and
+    caches the serialized request fragment of each provider adapter, so a
+    prefix shared by several branches is serialized once.
+    """
+    __slots__ = ("node", "fragments")
+
+    def __init__(self, node, role, content):
+        super().__init__(role=role, content=content)
+        self.node = node
+        self.fragments = {}
+
+
+class MessageNode:
+    __slots__ = ("id", "parent", "children", "active", "message")
+
+    def __init__(self, node_id, parent, role=None, content=None):
+        self.id = node_id
+        self.parent = parent
+        self.children = []
+        self.active = None  # Child on the branch last shown
+        self.message = Message(self, role, content) if role else None
+
+    @property
+    def role(self):
+        return self.message["role"]
+
+    @property
+    def content(self):
+        return self.message["content"]
+
+
+class ConversationTree:
+    """Conversation stored as a tree of messages.
+
+    Regenerating a reply or editing a message adds a sibling node, every
+    branch shares the nodes of its common prefix. `current` is the last
+    node of the branch on screen, the history sent with a request is the
+    path from the root to it.
+    """
+
+    def __init__(self):
+        self.root = MessageNode(0, None)
+        self.nodes = {0: self.root}
+        self.current = self.root
+        self.next_id = 1
+
+    def new_id(self):
+        node_id = self.next_id
+        self.next_id += 1
+        return node_id
+
+    def get(self, node_id):
+        return self.nodes.get(node_id)
+
+    def add(self, role, content, parent=None, node_id=None):
+        """Add a message under `parent` (the current node by default).
+
+        The branch on screen only moves to the new node when it extends
+        it, a reply finishing on another branch stays in the background.
+        """
+        parent = parent or self.current
+        if node_id is None:
+            node_id = self.new_id()
+        else:
+            self.next_id = max(self.next_id, node_id + 1)
+        node = MessageNode(node_id, parent, role, content)
+        self.nodes[node_id] = node
+        parent.children.append(node)
+        if parent is self.current:
+            parent.active = node
+            self.current = node
+        return node
+
+    def path(self, node=None):
+        """Nodes from the first message down to `node`, oldest first"""
+        node = node or self.current
+        path = []
+        while node is not self.root:
+            path.append(node)
+            node = node.parent
+        path.reverse()
+        return path
+
+    def messages(self, node=None):
+        return [n.message for n in self.path(node)]
+
+    def select(self, node):
+        """Make `node` the end of the branch on screen"""
+        self.current = node
+        while node.parent is not None and node.parent.active is not node:
+            node.parent.active = node
+            node = node.parent
+
+    def switch(self, node):
+        """Show the branch through `node`, down to its last active message"""
+        while node.active is not None:
+            node = node.active
+        self.select(node)
+
+    def siblings(self, node):
+        return node.parent.children
+
+    def on_branch(self, node):
+        """Whether `node` lies on the branch on screen"""
+        walk = self.current
+        while walk is not None:
+            if walk is node:
+                return True
+            walk = walk.parent
+        return False
+
+    def all_nodes(self):
+        """Every message node, parents before children"""
+        return [self.nodes[node_id] for node_id in sorted(self.nodes) if node_id]
@@ -0,0 +1,79 @@
+from PySide6.QtWidgets import QWidget, QFormLayout, QLabel
+
+
+def format_bytes(size):
+    """Human readable byte count"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def format_count(count):
+    """Token count like 950, 12.3k or 4.1M"""
+    if count < 1000:
+        return str(count)
+    if count < 1000000:
+        return f"{count / 1000:.1f}k"
+    return f"{count / 1000000:.1f}M"
+
+
+class DiagnosticsPanel(QWidget):
+    """Small key/value readout at the bottom of the sidebar"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setObjectName("diagnostics")
+        self.layout = QFormLayout(self)
+        self.layout.setContentsMargins(15, 8, 15, 12)
+        self.layout.setSpacing(2)
+        self.values = {}  # key -> value label
+
+    def set_value(self, key, text, tooltip=None):
+        label = self.values.get(key)
+        if label is None:
+            label = QLabel()
+            label.setObjectName("diagnosticsValue")
+            name = QLabel(key)
+            name.setObjectName("diagnosticsKey")
+            self.layout.addRow(name, label)
+            self.values[key] = label
+        label.setText(text)
+        if tooltip:
+            label.setToolTip(tooltip)
+
+    def show_memory_usage(self, usage):
+        """Slot for MemoryGovernor.usageChanged"""
+        self.set_value(
+            "Memory",
+            f"{format_bytes(usage['total'])} / {format_bytes(usage['budget'])}",
+            tooltip=(
+                f"Attachments in memory: {format_bytes(usage['attachments'])}\n"
+                f"Spilled to disk: {format_bytes(usage['spilled'])}\n"
+                f"Decoded media: {format_bytes(usage['media'])}\n"
+                f"Message widgets: {format_bytes(usage['widgets'])}"
+            )
+        )
+
+    def show_model_usage(self, name, rollup, days):
+        """Speed, tokens and cost of the selected model from the usage store"""
+        if rollup is None:
+            for key in ("Speed", "Tokens", "Cost"):
+                self.set_value(key, "–", tooltip=f"No requests to {name} in the last {days} days")
+            return
+        window = f"{name}, last {days} days, {rollup.requests} requests"
+        speed = rollup.tokens_per_second
+        first_token = rollup.average_first_token
+        self.set_value(
+            "Speed",
+            f"{speed:.1f} tok/s" if speed is not None else "–",
+            tooltip=f"{window}\nFirst token after {first_token:.2f} s on average" if first_token is not None
+            else f"{window}\nNo streamed requests to time the first token"
+        )
+        self.set_value(
+            "Tokens",
+            f"{format_count(rollup.prompt_tokens)} in / {format_count(rollup.completion_tokens)} out",
+            tooltip=f"{window}\nPrompt tokens served from cache: {format_count(rollup.cached_tokens)}"
+        )
+        self.set_value("Cost", f"${rollup.cost:.2f}", tooltip=f"{window}\nFrom the price in models.json")
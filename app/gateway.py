@@ -0,0 +1,344 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+import weakref
+
+import httpx
+
+from . import http_pool
+from .api_client import EndpointError, EndpointTimeout, EndpointUnreachable, OpenAIClient
+from .config_loader import find_models_config, load_models_config
+
+READ_TIMEOUT = 120  # Seconds an idle keep-alive connection is held open
+MAX_BODY_SIZE = 64 * 1024 * 1024  # Request bodies above this are refused with 413
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error", 502: "Bad Gateway",
+           504: "Gateway Timeout"}
+
+_answered = weakref.WeakSet()  # Writers whose response head went out for the current request
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, code=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+class Gateway:
+    """Local OpenAI-compatible endpoint in front of the models.json entries.
+
+    Requests are routed by model name (the entry's `name` or its upstream
+    `model_name`) and sent through OpenAIClient on the shared HTTP pool, so
+    every local tool reuses the same connections and keys. OpenAI-format
+    upstreams are passed through byte for byte, other formats are
+    translated into chat completion chunks.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or find_models_config())
+        self.mtime = None
+        self.models = {}  # name or model_name -> config
+        self.clients = {}  # entry name -> OpenAIClient
+
+    def _refresh(self):
+        # Headless stand-in for the registry's file watcher
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+        self.mtime = mtime
+        self.models = {}
+        self.clients = {}
+        for model in load_models_config(self.path):
+            self.models.setdefault(model.get("model_name"), model)
+            self.models[model["name"]] = model
+        self.models.pop(None, None)
+        logging.info(f"Gateway routing {len(self.models)} model names from {self.path}")
+
+    def client_for(self, name):
+        self._refresh()
+        model = self.models.get(name)
+        if model is None:
+            raise HttpError(404, f"The model '{name}' does not exist", code="model_not_found")
+        client = self.clients.get(model["name"])
+        if client is None:
+            client = self.clients[model["name"]] = OpenAIClient(model)
+        return client
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logging.info(f"Gateway listening on http://{host}:{port}/v1")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await http_pool.close_clients()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), READ_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    return
+                except HttpError as e:
+                    await send_error(writer, e)
+                    return
+                except asyncio.LimitOverrunError:
+                    await send_error(writer, HttpError(413, "Request head too large"))
+                    return
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                _answered.discard(writer)
+                try:
+                    await self.dispatch(writer, method, path, body)
+                except HttpError as e:
+                    await send_error(writer, e)
+                except (ConnectionError, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    logging.exception(f"Gateway {method} {path} failed")
+                    if writer in _answered:
+                        return  # Too late for a status, closing cuts the response short
+                    await send_error(writer, HttpError(500, f"Gateway error: {e}", code="internal_error"))
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            pass  # Client went away
+        finally:
+            writer.close()
+
+    async def dispatch(self, writer, method, path, body):
+        path = path.split("?", 1)[0].rstrip("/")
+        if path == "/v1/models":
+            if method != "GET":
+                raise HttpError(405, "Use GET")
+            await send_json(writer, 200, self.list_models())
+        elif path == "/v1/chat/completions":
+            if method != "POST":
+                raise HttpError(405, "Use POST")
+            try:
+                payload = json.loads(body)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                raise HttpError(400, "Request body is not valid JSON")
+            if not isinstance(payload, dict) or not isinstance(payload.get("messages", []), list):
+                raise HttpError(400, "Request body must be an object with a messages list")
+            await self.chat_completions(writer, payload)
+        else:
+            raise HttpError(404, f"Unknown path {path}")
+
+    def list_models(self):
+        self._refresh()
+        names = sorted({model["name"] for model in self.models.values()})
+        return {
+            "object": "list",
+            "data": [{"id": name, "object": "model", "owned_by": "notgpt"} for name in names],
+        }
+
+    async def chat_completions(self, writer, payload):
+        client = self.client_for(payload.get("model"))
+        started = time.monotonic()
+        if client.api_format != "openai":
+            sent = await self.translate(writer, client, payload)
+        else:
+            sent = await self.forward(writer, client, payload)
+        logging.info(
+            f"Gateway {client.config['name']}: {sent} bytes in {(time.monotonic() - started) * 1000:.0f} ms"
+        )
+
+    async def forward(self, writer, client, payload):
+        """Pass the upstream response through chunk by chunk"""
+        sent = 0
+        head_sent = False
+        try:
+            async with client.passthrough(payload) as response:
+                content_type = response.headers.get("content-type", "application/json")
+                await send_head(writer, response.status_code, content_type)
+                head_sent = True
+                async for chunk in response.aiter_bytes():
+                    sent += len(chunk)
+                    await send_chunk(writer, chunk)
+        except httpx.RequestError as e:
+            if head_sent:
+                # Too late for a status, drop the connection so the client sees a cut stream
+                raise ConnectionAbortedError(str(e))
+            raise HttpError(502, f"Upstream error: {e}", code="upstream_error")
+        await send_chunk(writer, b"")
+        return sent
+
+    async def translate(self, writer, client, payload):
+        """Wrap a non-OpenAI upstream in chat completion responses"""
+        messages = [
+            {"role": message.get("role", "user"), "content": message_text(message.get("content"))}
+            for message in payload.get("messages", []) if isinstance(message, dict)
+        ]
+        max_tokens = payload.get("max_tokens") or 1500
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = payload.get("model")
+
+        if not payload.get("stream"):
+            try:
+                text = await client.send_request(messages, max_tokens)
+            except (EndpointUnreachable, EndpointError) as e:
+                raise HttpError(502, f"Upstream error: {e}", code="upstream_error")
+            except EndpointTimeout as e:
+                raise HttpError(504, f"Upstream timeout: {e}", code="upstream_timeout")
+            data = {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+            }
+            return await send_json(writer, 200, data)
+
+        sent = 0
+        stream = client.stream_response(messages, max_tokens)
+        try:
+            try:
+                # Connect errors surface before the first chunk, while a status can still be sent
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except (EndpointUnreachable, EndpointError) as e:
+                raise HttpError(502, f"Upstream error: {e}", code="upstream_error")
+            except EndpointTimeout as e:
+                raise HttpError(504, f"Upstream timeout: {e}", code="upstream_timeout")
+            await send_head(writer, 200, "text/event-stream")
+            if first:
+                sent += await send_event(writer, completion_id, model, {"content": first})
+            try:
+                async for text in stream:
+                    sent += await send_event(writer, completion_id, model, {"content": text})
+            except (EndpointTimeout, EndpointError) as e:
+                # Too late for a status, drop the connection so the client sees a cut stream
+                raise ConnectionAbortedError(str(e))
+            sent += await send_event(writer, completion_id, model, {}, finish_reason="stop")
+            await send_chunk(writer, b"data: [DONE]\n\n")
+            await send_chunk(writer, b"")
+        finally:
+            # A client that went away must not leave the upstream stream open
+            await stream.aclose()
+        return sent
+
+
+def message_text(content):
+    """Text of an OpenAI message content, string or list of parts"""
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return content or ""
+
+
+async def read_request(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if "content-length" in headers:
+        length = parse_size(headers["content-length"], 10)
+        body = await reader.readexactly(length)
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        parts = []
+        total = 0
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:  # Size line over the stream limit
+                raise HttpError(400, "Malformed chunk size")
+            size = parse_size(line.split(b";")[0].decode("latin-1"), 16)
+            total += size
+            if total > MAX_BODY_SIZE:
+                raise HttpError(413, f"Request body over {MAX_BODY_SIZE} bytes")
+            data = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            parts.append(data[:-2])
+        body = b"".join(parts)
+    elif method == "POST":
+        raise HttpError(411, "Content-Length or chunked encoding required")
+    else:
+        body = b""
+    return method, target, headers, body
+
+
+def parse_size(value, base):
+    """Content-Length or chunk size, HttpError when malformed or too large"""
+    text = value.strip()
+    # int() alone would take signs, underscores and whitespace
+    if not text or text.strip("0123456789abcdefABCDEF" if base == 16 else "0123456789"):
+        raise HttpError(400, f"Malformed length {text[:20]!r}")
+    size = int(text, base)
+    if size > MAX_BODY_SIZE:
+        raise HttpError(413, f"Request body over {MAX_BODY_SIZE} bytes")
+    return size
+
+
+async def send_head(writer, status, content_type):
+    _answered.add(writer)
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        "Cache-Control: no-cache\r\n"
+        "Transfer-Encoding: chunked\r\n\r\n".encode("latin-1")
+    )
+    await writer.drain()
+
+
+async def send_chunk(writer, data):
+    """One chunked-encoding frame, an empty one ends the body"""
+    writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+    await writer.drain()  # Slow clients push back on the upstream read
+
+
+async def send_event(writer, completion_id, model, delta, finish_reason=None):
+    event = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+    await send_chunk(writer, data)
+    return len(data)
+
+
+async def send_json(writer, status, data):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    _answered.add(writer)
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    return len(body)
+
+
+async def send_error(writer, error):
+    await send_json(writer, error.status, {
+        "error": {"message": str(error), "type": "invalid_request_error", "code": error.code}
+    })
+
+
+def run_gateway(host, port, path=None):
+    """Blocking entry point for `main.py --gateway`, no Qt involved"""
+    try:
+        asyncio.run(Gateway(path).serve(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import socket
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+try:
+    import httpcore
+except ImportError:  # httpx always ships it, but keep the pool usable without
+    httpcore = None
+
+DNS_TTL = 300  # Seconds a resolved address is reused
+KEEPALIVE_EXPIRY = 90  # Idle pooled connections survive long enough to be reused
+
+_clients = {}  # (event loop, verify) -> httpx.AsyncClient
+_dns_cache = {}  # (host, port) -> (resolved_at, addresses)
+
+
+def origin_of(url):
+    """Scheme, host and port of a URL, filling in default ports"""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return parts.scheme, parts.hostname, port
+
+
+def api_url(endpoint, route):
+    """URL of `route` under the /v1 root of an endpoint, like /v1/models.
+
+    The root is matched on whole path segments, so /v10 or /api/v1beta
+    are not taken for it. Endpoints without one get /v1 appended.
+    """
+    parts = urlsplit(endpoint)
+    segments = parts.path.rstrip('/').split('/')
+    if 'v1' in segments:
+        segments = segments[:segments.index('v1') + 1]
+    else:
+        segments.append('v1')
+    return urlunsplit((parts.scheme, parts.netloc, '/'.join(segments + [route]), '', ''))
+
+
+async def resolve(host, port):
+    """Addresses of a host through the shared DNS cache, in getaddrinfo order"""
+    key = (host, port)
+    cached = _dns_cache.get(key)
+    if cached and time.monotonic() - cached[0] < DNS_TTL:
+        return cached[1]
+
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    # localhost may list ::1 before 127.0.0.1, keep every family to fall back on
+    addresses = list(dict.fromkeys(info[4][0] for info in infos)) or [host]
+    _dns_cache[key] = (time.monotonic(), addresses)
+    return addresses
+
+
+def forget(host, port):
+    """Drop a cached resolution, the next connect asks the resolver again"""
+    _dns_cache.pop((host, port), None)
+
+
+if httpcore is not None:
+    class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+        """Connects through the shared DNS cache.
+
+        Each cached address is tried in turn, like the resolver fallback
+        the backend would do on its own. TLS still uses the original host
+        name for SNI and certificate checks, only the TCP connect goes to
+        the cached address.
+        """
+
+        def __init__(self, backend):
+            self.backend = backend
+
+        async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+            try:
+                addresses = await resolve(host, port)
+            except OSError:
+                addresses = [host]  # Let the backend report the resolution error
+            error = None
+            for address in addresses:
+                try:
+                    return await self.backend.connect_tcp(
+                        address, port, timeout=timeout,
+                        local_address=local_address, socket_options=socket_options
+                    )
+                except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                    error = e
+            # The host may have moved, resolve again next time
+            forget(host, port)
+            raise error
+
+        async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+            return await self.backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+        async def sleep(self, seconds):
+            await self.backend.sleep(seconds)
+
+    class CachingTransport(httpx.AsyncHTTPTransport):
+        """httpx transport over a pool that connects through the DNS cache.
+
+        The pool is built here with httpcore's network_backend argument,
+        httpx takes care of mapping requests and errors as usual.
+        """
+
+        def __init__(self, verify, limits):
+            self._pool = httpcore.AsyncConnectionPool(
+                ssl_context=httpx.create_ssl_context(verify=verify),
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry,
+                network_backend=CachingNetworkBackend(httpcore.AnyIOBackend()),
+            )
+
+
+def _make_transport(verify):
+    limits = httpx.Limits(max_keepalive_connections=20, keepalive_expiry=KEEPALIVE_EXPIRY)
+    if httpcore is None:
+        logging.debug("DNS cache not installed, using the system resolver")
+        return httpx.AsyncHTTPTransport(verify=verify, limits=limits)
+    return CachingTransport(verify, limits)
+
+
+def get_client(verify=False):
+    """Shared AsyncClient for the running event loop.
+
+    Clients are bound to the loop they were created on, so each loop gets
+    its own pool.
+    """
+    loop = asyncio.get_running_loop()
+    key = (loop, verify)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(transport=_make_transport(verify))
+        _clients[key] = client
+    return client
+
+
+async def close_clients():
+    """Close every pooled client owned by the running loop"""
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _clients if key[0] is loop]:
+        await _clients.pop(key).aclose()
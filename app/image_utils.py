@@ -4,8 +4,8 @@ import base64
 import requests
 from io import BytesIO
 
-def image_to_base64(image_path, max_size=512):
-    """Convert image to base64 string with resizing"""
+def image_to_png_bytes(image_path, max_size=512):
+    """Load an image as PNG bytes with resizing"""
     pixmap = QPixmap(image_path)
     if pixmap.isNull():
         return None
@@ -20,7 +20,14 @@ def image_to_base64(image_path, max_size=512):
     buffer.open(QIODevice.WriteOnly)
     image.save(buffer, "PNG")
     buffer.close()
-    return base64.b64encode(buffer.data()).decode('utf-8')
+    return bytes(buffer.data())
+
+def image_to_base64(image_path, max_size=512):
+    """Convert image to base64 string with resizing"""
+    data = image_to_png_bytes(image_path, max_size)
+    if data is None:
+        return None
+    return base64.b64encode(data).decode('utf-8')
 
 def base64_to_pixmap(base64_str):
     """Convert base64 string to QPixmap"""
@@ -0,0 +1,421 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from .attachments import Attachment, content_attachments
+from .conversation_tree import ConversationTree
+
+FLUSH_INTERVAL = 0.25  # Seconds records are batched before one write and fsync
+COMPACT_AFTER = 2000  # Records appended since the last compaction
+COLLECT_DELAY = 5.0  # Seconds compactions and deletions are batched before blobs are collected
+
+
+class ConversationJournal:
+    """Append-only log of one conversation.
+
+    Records are buffered and written by a background thread with a single
+    fsync per batch (group commit), so streaming never waits on the disk.
+    Consecutive chunks of the same reply are merged before they are written.
+    Messages are tree nodes referencing their parent, so branches share
+    the records of their common prefix.
+
+    Blobs are shared by the journals of a JournalStore, which collects
+    those no journal references after compactions and deletions.
+    """
+
+    def __init__(self, path, blob_dir, store=None):
+        self.path = path
+        self.blob_dir = blob_dir
+        self.store = store
+        self.conversation_id = os.path.splitext(os.path.basename(path))[0]
+        self.buffer = []  # Records waiting for the next flush
+        self.records_since_compact = 0
+        self.deleted = False
+        self._file = None
+        self._flush_handle = None
+        self._lock = asyncio.Lock()
+        # Held by the worker thread while it writes, so close() waits for it
+        self._write_lock = threading.Lock()
+        # Blobs are written and referenced under the store's lock, never in
+        # between a collection's scan and its deletes
+        self._blob_lock = store.blob_lock if store else threading.Lock()
+
+    # Recording
+
+    def record_model(self, model_config):
+        self._append({"op": "model", "name": model_config["name"]})
+
+    def record_clear(self):
+        self._append({"op": "clear"})
+
+    def record_message(self, node):
+        # Attachments are written as blobs when the record is flushed
+        self._append(self._node_record(node))
+
+    def record_select(self, node):
+        """The branch on screen now ends at `node`"""
+        self._append({"op": "select", "id": node.id})
+
+    def start_reply(self, reply_id, parent):
+        """Open a reply, `reply_id` becomes the id of its node once it ends"""
+        self._append({"op": "start", "reply": reply_id, "parent": parent.id})
+
+    def record_chunk(self, reply_id, text):
+        last = self.buffer[-1] if self.buffer else None
+        if last and last["op"] == "chunk" and last["reply"] == reply_id:
+            last["text"] += text
+            return
+        self._append({"op": "chunk", "reply": reply_id, "text": text})
+
+    def end_reply(self, reply_id):
+        self._append({"op": "end", "reply": reply_id})
+
+    def abort_reply(self, reply_id):
+        self._append({"op": "abort", "reply": reply_id})
+
+    def _append(self, record):
+        self.buffer.append(record)
+        self.records_since_compact += 1
+        if self._flush_handle is None:
+            loop = asyncio.get_event_loop()
+            self._flush_handle = loop.call_later(FLUSH_INTERVAL, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write buffered records and fsync them off the event loop"""
+        async with self._lock:
+            if not self.buffer:
+                return
+            records, self.buffer = self.buffer, []
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._write, records)
+            except OSError as e:
+                logging.error(f"Journal write failed for {self.path}: {e}")
+
+    def _serialize(self, records):
+        lines = []
+        for record in records:
+            if "content" in record:
+                record = dict(record, content=self._encode_content(record["content"]))
+            lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        return "".join(lines)
+
+    def _write(self, records):
+        """Runs in a worker thread, one fsync for the whole batch"""
+        with self._write_lock:
+            if self.deleted:
+                return
+            with self._blob_lock:
+                lines = self._serialize(records)
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(lines)
+                self._file.flush()
+            os.fsync(self._file.fileno())
+
+    @staticmethod
+    def _node_record(node):
+        return {"op": "message", "id": node.id, "parent": node.parent.id, "role": node.role, "content": node.content}
+
+    def close(self):
+        """Flush synchronously, used on shutdown.
+
+        A batch the worker thread is still writing is finished first, the
+        buffer is written after it.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.buffer:
+            records, self.buffer = self.buffer, []
+            self._write(records)
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def delete(self):
+        """Drop the journal of a closed conversation"""
+        self.deleted = True
+        self.buffer = []
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        if self.store:
+            self.store.schedule_collect()
+
+    # Content encoding
+
+    def _encode_content(self, content):
+        if not isinstance(content, dict):
+            return content
+        encoded = {
+            key: value for key, value in content.items()
+            if key != "documents" and not isinstance(value, Attachment)
+        }
+        for attachment in content_attachments(content):
+            # Blobs live next to spilled attachments, named by digest
+            attachment.save_to(self.blob_dir)
+            blob = {"blob": attachment.digest(), "mime": attachment.mime}
+            if attachment.kind == "document":
+                blob.update(filename=attachment.filename, encoding=attachment.encoding, lines=attachment.line_count)
+                encoded.setdefault("documents", []).append(blob)
+                continue
+            encoded[attachment.kind] = blob
+            encoded.pop(f"{attachment.kind}_base64", None)
+        return encoded
+
+    def _decode_content(self, content):
+        if not isinstance(content, dict):
+            return content
+        decoded = dict(content)
+        for key, value in content.items():
+            if isinstance(value, dict) and "blob" in value:
+                attachment = self._load_blob(value, key)
+                if attachment is not None:
+                    decoded[key] = attachment
+                else:
+                    del decoded[key]
+        if "documents" in content:
+            documents = [self._load_blob(value, "document") for value in content["documents"]]
+            decoded["documents"] = [attachment for attachment in documents if attachment is not None]
+        return decoded
+
+    def _load_blob(self, value, kind):
+        path = os.path.join(self.blob_dir, value["blob"])
+        if not os.path.exists(path):
+            logging.warning(f"Journal blob {value['blob']} is missing, dropping the {kind}")
+            return None
+        attachment = Attachment.from_file(
+            path, value["mime"], kind, filename=value.get("filename"), encoding=value.get("encoding")
+        )
+        attachment._digest = value["blob"]  # Named by digest, no need to hash it again
+        attachment.line_count = value.get("lines")
+        return attachment
+
+    # Replay and compaction
+
+    def replay(self):
+        """Rebuild (model name, ConversationTree) from the log.
+
+        Replies cut off by a crash keep the text streamed so far.
+        """
+        model_name = None
+        tree = ConversationTree()
+        replies = {}  # reply id -> (parent id, chunks) of replies not yet ended
+        if not os.path.exists(self.path):
+            return model_name, tree
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Torn final write
+                op = record.get("op")
+                if op == "model":
+                    model_name = record["name"]
+                elif op == "clear":
+                    tree = ConversationTree()
+                    replies = {}
+                elif op in ("user", "message"):
+                    # Records without ids extend the branch on screen
+                    tree.add(
+                        record.get("role", "user"),
+                        self._decode_content(record["content"]),
+                        parent=tree.get(record.get("parent")),
+                        node_id=record.get("id"),
+                    )
+                elif op == "select" and tree.get(record["id"]):
+                    tree.select(tree.get(record["id"]))
+                elif op == "start":
+                    replies[record["reply"]] = (record.get("parent"), [])
+                    tree.next_id = max(tree.next_id, record["reply"] + 1)
+                elif op == "chunk" and record["reply"] in replies:
+                    replies[record["reply"]][1].append(record["text"])
+                elif op == "end" and record["reply"] in replies:
+                    self._replay_reply(tree, record["reply"], *replies.pop(record["reply"]))
+                elif op == "abort":
+                    replies.pop(record.get("reply"), None)
+
+        for reply_id, (parent_id, chunks) in replies.items():
+            if chunks:
+                self._replay_reply(tree, reply_id, parent_id, chunks)
+        return model_name, tree
+
+    @staticmethod
+    def _replay_reply(tree, reply_id, parent_id, chunks):
+        parent = tree.get(parent_id) if parent_id is not None else None
+        tree.add("assistant", "".join(chunks), parent=parent, node_id=reply_id)
+
+    async def compact(self, snapshot):
+        """Rewrite the log as one record per message, in the background.
+
+        `snapshot` is called once pending writes are done and returns the
+        current (model name, ConversationTree), or None while a reply is
+        streaming. The snapshot supersedes every buffered record.
+        """
+        async with self._lock:
+            state = snapshot()
+            if state is None or self.deleted:
+                return
+            model_name, tree = state
+            records = []
+            if model_name:
+                records.append({"op": "model", "name": model_name})
+            records.extend(self._node_record(node) for node in tree.all_nodes())
+            if tree.current is not tree.root:
+                records.append({"op": "select", "id": tree.current.id})
+            self.buffer = []
+            self.records_since_compact = 0
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._rewrite, records)
+            except OSError as e:
+                logging.error(f"Journal compaction failed for {self.path}: {e}")
+                return
+        # Blobs of messages the snapshot dropped are no longer referenced
+        if self.store:
+            self.store.schedule_collect()
+
+    def _rewrite(self, records):
+        with self._write_lock:
+            if self.deleted:
+                return
+            temp_path = self.path + ".tmp"
+            with self._blob_lock:
+                lines = self._serialize(records)
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                os.replace(temp_path, self.path)
+
+    def needs_compaction(self):
+        return self.records_since_compact >= COMPACT_AFTER
+
+
+class JournalStore:
+    """Folder of conversation journals and the blobs they share.
+
+    `in_use` returns the names of files in the blob folder that live
+    attachments still read from, such as spilled ones. Those are kept by
+    collections even when no journal references them yet.
+    """
+
+    def __init__(self, folder, blob_dir, in_use=None):
+        self.folder = folder
+        self.blob_dir = blob_dir
+        self.in_use = in_use
+        self.blob_lock = threading.Lock()
+        self._collect_handle = None
+
+    def create(self):
+        return self.open(uuid.uuid4().hex)
+
+    def open(self, conversation_id):
+        return ConversationJournal(os.path.join(self.folder, f"{conversation_id}.jsonl"), self.blob_dir, self)
+
+    # Blob collection
+
+    def schedule_collect(self):
+        if self._collect_handle is None:
+            loop = asyncio.get_event_loop()
+            self._collect_handle = loop.call_later(COLLECT_DELAY, self._start_collect)
+
+    def _start_collect(self):
+        self._collect_handle = None
+        asyncio.ensure_future(self.collect_blobs())
+
+    def close(self):
+        """Collect synchronously once the journals are closed, used on shutdown.
+
+        No attachment reads from the folder any more, so spilled files go
+        too unless a journal references them.
+        """
+        if self._collect_handle is not None:
+            self._collect_handle.cancel()
+            self._collect_handle = None
+        try:
+            self._collect(set(), float("inf"))
+        except OSError as e:
+            logging.error(f"Blob collection failed in {self.blob_dir}: {e}")
+
+    async def collect_blobs(self):
+        """Delete blobs no journal references, off the event loop"""
+        started = time.time()
+        keep = set(self.in_use()) if self.in_use else set()
+        loop = asyncio.get_running_loop()
+        try:
+            removed = await loop.run_in_executor(None, self._collect, keep, started)
+        except OSError as e:
+            logging.error(f"Blob collection failed in {self.blob_dir}: {e}")
+            return
+        if removed:
+            logging.info(f"Removed {removed} unreferenced blobs from {self.blob_dir}")
+
+    def _collect(self, keep, started):
+        """Files written since `started` are kept, they may be spilled after `keep` was taken"""
+        removed = 0
+        with self.blob_lock:
+            referenced = set(keep)
+            for name in os.listdir(self.folder):
+                if name.endswith(".jsonl"):
+                    referenced.update(self._blob_references(os.path.join(self.folder, name)))
+            for name in os.listdir(self.blob_dir):
+                if name in referenced:
+                    continue
+                path = os.path.join(self.blob_dir, name)
+                try:
+                    if os.path.getmtime(path) >= started - 1:
+                        continue
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    @staticmethod
+    def _blob_references(path):
+        """Blob names referenced by the message records of one journal"""
+        names = set()
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return names  # Deleted since it was listed
+        with f:
+            for line in f:
+                if '"blob"' not in line:
+                    continue
+                try:
+                    content = json.loads(line).get("content")
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(content, dict):
+                    continue
+                for value in list(content.values()) + content.get("documents", []):
+                    if isinstance(value, dict) and "blob" in value:
+                        names.add(value["blob"])
+        return names
+
+    def existing(self):
+        """Journals left by the previous run, oldest first"""
+        paths = [
+            os.path.join(self.folder, name)
+            for name in os.listdir(self.folder) if name.endswith(".jsonl")
+        ]
+        paths.sort(key=os.path.getmtime)
+        return [self.open(os.path.splitext(os.path.basename(path))[0]) for path in paths]
@@ -1,11 +1,19 @@
-from PySide6.QtWidgets import QMainWindow, QHBoxLayout, QWidget, QSplitter
+from PySide6.QtWidgets import QMainWindow, QHBoxLayout, QWidget, QSplitter, QTabWidget, QPushButton
 from PySide6.QtCore import QTimer
 from .sidebar import Sidebar
 from .chat_area import ChatArea
+from .chat_widget import ChatWidget
+from .outbox import outbox
+import time
+
+UNLOAD_CHECK_INTERVAL = 15000  # ms between sweeps for inactive tabs
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, settings=None, journals=None):
         super().__init__()
+        self.settings = settings or {}
+        self.journals = journals  # JournalStore, conversations survive restarts
+        self.registry = None
         self.setWindowTitle("Not GPT")
         self.resize(1200, 800)
         
@@ -25,20 +33,151 @@ class MainWindow(QMainWindow):
         self.sidebar = Sidebar()
         splitter.addWidget(self.sidebar)
         
-        # Chat area
-        self.chat_area = ChatArea()
-        splitter.addWidget(self.chat_area)
+        # One tab per conversation, all sharing the event loop and HTTP pool
+        self.tabs = QTabWidget()
+        self.tabs.setObjectName("conversationTabs")
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.setDocumentMode(True)
+        new_tab_button = QPushButton("+")
+        new_tab_button.setObjectName("newTabButton")
+        new_tab_button.setToolTip("New conversation")
+        new_tab_button.clicked.connect(lambda: self.new_conversation())
+        self.tabs.setCornerWidget(new_tab_button)
+        splitter.addWidget(self.tabs)
         
         # Set splitter sizes
         splitter.setSizes([250, 750])
         
+        # Tabs left in the background drop their widgets after a while
+        self.inactive_since = {}  # view -> time it was last hidden
+        self.active_view = None
+        self.unload_timer = QTimer(self)
+        self.unload_timer.setInterval(UNLOAD_CHECK_INTERVAL)
+        self.unload_timer.timeout.connect(self.unload_inactive_tabs)
+        self.unload_timer.start()
+        
+        self.tabs.currentChanged.connect(self._on_tab_changed)
+        self.tabs.tabCloseRequested.connect(self.close_conversation)
+        
         # Connect signals
-        self.sidebar.modelSelected.connect(self.chat_area.set_current_model)
+        self.sidebar.modelSelected.connect(self.set_current_model)
         #self.sidebar.addImageRequested.connect(self.chat_area.add_image)  # Connect to chat area
 
+    @property
+    def chat_area(self):
+        """View of the active conversation"""
+        return self.tabs.currentWidget()
+
+    def create_view(self):
+        # The lite view trades bubbles and media for a cheap transcript
+        if self.settings.get("chat_view") == "lite":
+            return ChatWidget(max_blocks=self.settings.get("lite_max_blocks", 5000))
+        return ChatArea()
+
+    def new_conversation(self, model_config=None):
+        """Open a conversation tab, using the sidebar's model by default"""
+        view = self.create_view()
+        if self.journals:
+            view.attach_journal(self.journals.create())
+        index = self.tabs.addTab(view, "New chat")
+        model_config = model_config or self.sidebar.current_model()
+        if model_config:
+            view.set_current_model(model_config)
+            self.tabs.setTabText(index, model_config["name"])
+        self.tabs.setCurrentIndex(index)
+        view.message_input.setFocus()
+        return view
+
+    def restore_conversations(self):
+        """Reopen the conversations journaled by the last run, or start a new one"""
+        journals = self.journals.existing() if self.journals else []
+        for journal in journals:
+            model_name, tree = journal.replay()
+            model_config = self.registry.get(model_name) if self.registry and model_name else None
+            view = self.create_view()
+            view.attach_journal(journal)
+            view.restore(model_config, tree)
+            self.tabs.addTab(view, model_config["name"] if model_config else "New chat")
+            # The replayed log is rewritten as a snapshot once the loop runs
+            view.compact_journal(force=True)
+        # Requests that were waiting for their endpoint wait again
+        outbox.prune({journal.conversation_id for journal in journals})
+        for index in range(self.tabs.count()):
+            QTimer.singleShot(0, self.tabs.widget(index).resume_outbox)
+        if self.tabs.count() == 0:
+            self.new_conversation()
+        else:
+            self.tabs.setCurrentIndex(self.tabs.count() - 1)
+
+    def close_conversation(self, index):
+        view = self.tabs.widget(index)
+        if view is None:
+            return
+        view.close_conversation()
+        if view.journal:
+            view.journal.delete()
+        self.tabs.removeTab(index)
+        self.inactive_since.pop(view, None)
+        if view is self.active_view:
+            self.active_view = None
+        view.deleteLater()
+        if self.tabs.count() == 0:
+            self.new_conversation()
+
+    def set_current_model(self, model_config):
+        view = self.chat_area
+        if view is None:
+            self.new_conversation(model_config)
+            return
+        view.set_current_model(model_config)
+        self.tabs.setTabText(self.tabs.currentIndex(), model_config["name"])
+
+    def update_model_configs(self, models):
+        """Apply edited entries to every conversation using them"""
+        by_name = {model["name"]: model for model in models}
+        for index in range(self.tabs.count()):
+            view = self.tabs.widget(index)
+            current = view.current_model
+            if current and current["name"] in by_name:
+                view.update_model_config(by_name[current["name"]])
+
+    def _on_tab_changed(self, index):
+        if self.active_view is not None:
+            self.inactive_since[self.active_view] = time.monotonic()
+        view = self.tabs.widget(index)
+        self.active_view = view
+        if view is None:
+            return
+        self.inactive_since.pop(view, None)
+        view.load()
+        self.sidebar.show_model(view.current_model["name"] if view.current_model else None)
+
+    def unload_inactive_tabs(self):
+        delay = self.settings.get("tab_unload_after", 60)
+        now = time.monotonic()
+        for view, since in list(self.inactive_since.items()):
+            if view is not self.active_view and view.loaded and now - since >= delay:
+                view.unload()
+
+    def attach_registry(self, registry):
+        """Keep the sidebar in sync with models.json while the app runs"""
+        self.registry = registry
+        registry.modelsAdded.connect(self.sidebar.add_models)
+        registry.modelsRemoved.connect(self.sidebar.remove_models)
+        registry.modelsUpdated.connect(self.sidebar.update_models)
+        registry.modelsUpdated.connect(self.update_model_configs)
+
+    def closeEvent(self, event):
+        # Write out whatever the journals still buffer
+        for index in range(self.tabs.count()):
+            view = self.tabs.widget(index)
+            if view.journal:
+                view.journal.close()
+        super().closeEvent(event)
 
     def showEvent(self, event):
         """Focus on input field when window is shown"""
         super().showEvent(event)
         # Use a timer to ensure this happens after UI is fully rendered
-        QTimer.singleShot(100, self.chat_area.message_input.setFocus)
\ No newline at end of file
+        QTimer.singleShot(100, self.chat_area.message_input.setFocus)
@@ -0,0 +1,303 @@
+import re
+
+from PySide6.QtWidgets import QWidget, QSizePolicy, QApplication, QMenu
+from PySide6.QtGui import (
+    QTextDocument, QTextCursor, QPainter, QAbstractTextDocumentLayout, QPalette, QColor, QFontDatabase,
+)
+from PySide6.QtCore import Qt, QSize, QRectF
+
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+HEADING_RE = re.compile(r"^ {0,3}#{1,6}(\s|$)")
+RULE_RE = re.compile(r"^ {0,3}([-*_])(\s*\1){2,}\s*$")
+LIST_RE = re.compile(r"^ {0,3}([-*+]|\d{1,9}[.)])(\s|$)")
+
+
+def line_kind(line):
+    """"list" or "paragraph" for lines opening such a block, None for any other"""
+    if LIST_RE.match(line):
+        return "list"
+    if (not line.strip() or line.startswith("    ") or FENCE_RE.match(line) or HEADING_RE.match(line)
+            or line.lstrip()[0] in ">|<" or "|" in line):
+        return None
+    return "paragraph"
+
+
+class MarkdownBlockParser:
+    """Splits streamed Markdown into top-level blocks as they complete.
+
+    Only the trailing partial line and the open block are kept as text,
+    so each feed costs time proportional to the chunk, not the answer.
+    """
+
+    def __init__(self):
+        self.partial_line = ""
+        self.lines = []  # Complete lines of the open block
+        self.fence = None  # Opening fence marker while inside a code block
+        self.items = 0  # Complete lines of the open block starting a list item
+
+    def feed(self, text):
+        """Consume a chunk, returns the source of blocks it closed"""
+        closed = []
+        text = self.partial_line + text
+        *complete, self.partial_line = text.split("\n")
+        for line in complete:
+            self._add_line(line, closed)
+        return closed
+
+    def finish(self):
+        """Close whatever is still open at the end of the answer"""
+        closed = []
+        if self.partial_line:
+            self._add_line(self.partial_line, closed)
+            self.partial_line = ""
+        self._close(closed)
+        self.fence = None
+        return closed
+
+    @property
+    def open_source(self):
+        """Markdown of the unfinished block, including the partial line"""
+        if not self.lines:
+            return self.partial_line
+        if not self.partial_line:
+            return "\n".join(self.lines)
+        return "\n".join(self.lines) + "\n" + self.partial_line
+
+    @property
+    def open_shape(self):
+        """Kind and item count of an open paragraph or list, None for other blocks.
+
+        While the shape stays the same a chunk only adds text to the open
+        block, so the view can append it instead of parsing again.
+        """
+        if self.fence:
+            return None
+        kind = line_kind(self.lines[0] if self.lines else self.partial_line)
+        if kind is None:
+            return None
+        return kind, self.items + bool(LIST_RE.match(self.partial_line))
+
+    @property
+    def code_source(self):
+        """Text fed after the opening fence of an open code block, None outside one"""
+        if not self.fence:
+            return None
+        return "".join(line + "\n" for line in self.lines[1:]) + self.partial_line
+
+    def _add_line(self, line, closed):
+        if self.fence:
+            self.lines.append(line)
+            stripped = line.strip()
+            if stripped.startswith(self.fence) and not stripped.strip(self.fence[0]):
+                self.fence = None
+                self._close(closed)
+            return
+
+        fence = FENCE_RE.match(line)
+        if fence:
+            self._close(closed)
+            self.fence = fence.group(1)
+            self.lines.append(line)
+        elif not line.strip():
+            self._close(closed)
+        elif HEADING_RE.match(line) or RULE_RE.match(line):
+            # Single line blocks
+            self._close(closed)
+            closed.append(line)
+        else:
+            self.lines.append(line)
+            self.items += bool(LIST_RE.match(line))
+
+    def _close(self, closed):
+        if self.lines:
+            closed.append("\n".join(self.lines))
+            self.lines = []
+        self.items = 0
+
+
+class MarkdownView(QWidget):
+    """Renders streamed Markdown as a stack of cached text documents.
+
+    Closed blocks are laid out once and only repainted. Chunks are appended
+    as plain text to an open code block, paragraph or list item, which is
+    parsed as Markdown again only when it closes or its kind changes, so
+    a long block streams in linear time. Other open blocks are re-parsed
+    on every chunk. A width change relayouts every block.
+    """
+    BLOCK_SPACING = 6
+
+    def __init__(self, text="", max_width=600, parent=None):
+        super().__init__(parent)
+        self.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Minimum)
+        self.setAttribute(Qt.WA_TranslucentBackground)
+        self.max_width = max_width
+        self.parser = MarkdownBlockParser()
+        self.chunks = []  # Raw text as received, for copying
+        self.fed_length = 0
+        self.finished = False
+        self.documents = []  # Laid out documents of closed blocks
+        self.open_document = None
+        self.open_code = False  # The open document is a plain text code block
+        self.open_shape = None  # Parser shape the open document was parsed with
+        self.layout_width = None
+        self.content_height = 0
+        self.ideal_width = 0  # Widest closed block at its natural width
+
+        if text:
+            self.append(text)
+
+    def source(self):
+        return "".join(self.chunks)
+
+    def append(self, text):
+        """Add a streamed chunk"""
+        self.chunks.append(text)
+        self.fed_length += len(text)
+        closed = self.parser.feed(text)
+        for block in closed:
+            self._add_closed(block)
+        if self.open_code and not closed and self.parser.fence:
+            # Still inside the same code block, which grew by exactly `text`
+            self._append_code(text)
+            return
+        shape = self.parser.open_shape
+        if self.open_document is not None and not closed and shape is not None and shape == self.open_shape:
+            # Same paragraph or list item, soft line breaks render as spaces
+            self._append_text(text.replace("\n", " "))
+            return
+        self._update_open()
+
+    def finish(self):
+        self.finished = True
+        for block in self.parser.finish():
+            self._add_closed(block)
+        self._update_open()
+
+    def set_text(self, text):
+        """Replace the whole content, used when a reply is rewritten"""
+        self.parser = MarkdownBlockParser()
+        self.chunks = []
+        self.fed_length = 0
+        self.finished = False
+        self.documents = []
+        self.open_document = None
+        self.open_code = False
+        self.open_shape = None
+        self.content_height = 0
+        self.ideal_width = 0
+        self.append(text)
+
+    def _make_document(self, source):
+        document = QTextDocument()
+        document.setDefaultFont(self.font())
+        document.setDocumentMargin(0)
+        document.setMarkdown(source)
+        document.setTextWidth(self._width())
+        return document
+
+    def _add_closed(self, source):
+        document = self._make_document(source)
+        self.documents.append(document)
+        self.content_height += document.size().height() + self.BLOCK_SPACING
+        self.ideal_width = max(self.ideal_width, document.idealWidth())
+
+    def _update_open(self):
+        code = self.parser.code_source
+        self.open_code = code is not None
+        self.open_shape = self.parser.open_shape
+        if self.open_code:
+            self.open_document = self._make_code_document(code)
+        else:
+            source = self.parser.open_source
+            self.open_document = self._make_document(source) if source.strip() else None
+        self.updateGeometry()
+        self.update()
+
+    def _make_code_document(self, code):
+        document = QTextDocument()
+        document.setDefaultFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        document.setDocumentMargin(0)
+        document.setPlainText(code)
+        document.setTextWidth(self._width())
+        return document
+
+    def _append_code(self, text):
+        # Only the blocks touched by the insert are laid out again
+        cursor = QTextCursor(self.open_document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.updateGeometry()
+        self.update()
+
+    def _append_text(self, text):
+        # Inline Markdown in the added text is rendered once the block is parsed
+        cursor = QTextCursor(self.open_document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text, cursor.blockCharFormat())
+        self.updateGeometry()
+        self.update()
+
+    def _width(self):
+        if self.layout_width is None:
+            return self.max_width
+        return self.layout_width
+
+    def _relayout(self, width):
+        if width == self.layout_width:
+            return
+        self.layout_width = width
+        self.content_height = 0
+        for document in self.documents:
+            document.setTextWidth(width)
+            self.content_height += document.size().height() + self.BLOCK_SPACING
+        if self.open_document:
+            self.open_document.setTextWidth(width)
+        self.updateGeometry()
+
+    def _total_height(self):
+        height = self.content_height
+        if self.open_document:
+            height += self.open_document.size().height()
+        elif self.documents:
+            height -= self.BLOCK_SPACING
+        return int(height) + 1
+
+    def sizeHint(self):
+        ideal = self.ideal_width
+        if self.open_document:
+            ideal = max(ideal, self.open_document.idealWidth())
+        width = int(min(self.max_width, ideal + 1)) if ideal else self.max_width
+        return QSize(width, self._total_height())
+
+    def minimumSizeHint(self):
+        return QSize(50, self._total_height())
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._relayout(event.size().width())
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        context = QAbstractTextDocumentLayout.PaintContext()
+        context.palette.setColor(QPalette.Text, QColor("white"))
+        visible = event.rect()
+
+        y = 0.0
+        documents = self.documents + ([self.open_document] if self.open_document else [])
+        for document in documents:
+            height = document.size().height()
+            # Only blocks inside the exposed area are painted
+            if y + height >= visible.top() and y <= visible.bottom():
+                painter.save()
+                painter.translate(0, y)
+                context.clip = QRectF(0, 0, self.width(), height)
+                document.documentLayout().draw(painter, context)
+                painter.restore()
+            y += height + self.BLOCK_SPACING
+            if y > visible.bottom():
+                break
+
+    def contextMenuEvent(self, event):
+        menu = QMenu(self)
+        menu.addAction("Copy", lambda: QApplication.clipboard().setText(self.source()))
+        menu.exec(event.globalPos())
@@ -0,0 +1,166 @@
+import logging
+import os
+import weakref
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+KEEP_SCREENS = 2  # Bubbles within this many viewport heights keep decoded media
+ENFORCE_DELAY = 150  # Scrolling is debounced before media is evicted or restored
+
+
+class MemoryGovernor(QObject):
+    """Keeps conversation media and widgets within a memory budget.
+
+    Decoded images of bubbles far off screen are dropped and rebuilt when
+    scrolled back, and attachment bytes of old messages are spilled to disk
+    once the budget is exceeded. When that is not enough, bubbles of old
+    messages far above the visible area are removed and rebuilt once
+    scrolled back to. Sizes are estimates, not allocator numbers.
+
+    Spilled files are shared with the journal blobs, so once their
+    attachment is freed they are left to `collect`, which deletes only
+    files no journal references.
+    """
+    usageChanged = Signal(dict)
+    spilledReleased = Signal(str)  # Path of a freed spilled attachment, from any thread
+
+    def __init__(self, budget=256 * 1024 * 1024, parent=None):
+        super().__init__(parent)
+        self.budget = budget
+        self.spill_dir = None
+        self.collect = None  # Deletes unreferenced files of the spill folder
+        self.views = weakref.WeakSet()  # Chat views whose bubbles are governed
+        self.attachments = []  # Weak references, oldest first
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(ENFORCE_DELAY)
+        self.timer.timeout.connect(self.enforce)
+        self.spilledReleased.connect(self._on_spilled_released)
+
+    def configure(self, budget, spill_dir, collect=None):
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.collect = collect
+
+    def register_view(self, view):
+        self.views.add(view)
+
+    def track(self, attachment):
+        self.attachments.append(weakref.ref(attachment))
+        self.schedule()
+
+    def schedule(self):
+        self.timer.start()
+
+    def live_attachments(self):
+        alive = []
+        for ref in self.attachments:
+            attachment = ref()
+            if attachment is not None:
+                alive.append(attachment)
+        # Forget attachments of cleared chats
+        self.attachments = [weakref.ref(a) for a in alive]
+        return alive
+
+    def files_in_use(self):
+        """Names of the files live attachments read from, kept by blob collection"""
+        return {os.path.basename(a.path) for a in self.live_attachments() if not a.in_memory}
+
+    def usage(self):
+        attachments = spilled = media = widgets = 0
+        for attachment in self.live_attachments():
+            if attachment.in_memory:
+                attachments += attachment.size
+            else:
+                spilled += attachment.size
+        for view in list(self.views):
+            for bubble in view.bubbles():
+                media += bubble.media_bytes()
+                widgets += bubble.widget_bytes()
+        return {
+            "attachments": attachments,
+            "spilled": spilled,
+            "media": media,
+            "widgets": widgets,
+            "total": attachments + media + widgets,
+            "budget": self.budget,
+        }
+
+    def enforce(self):
+        far_bubbles = []
+        for view in list(self.views):
+            viewport_height, distances = view.bubble_distances()
+            keep = viewport_height * KEEP_SCREENS
+            for bubble, distance in distances:
+                if distance > keep:
+                    bubble.release_media()
+                else:
+                    bubble.restore_media()
+                    if distance > 0:
+                        far_bubbles.append((distance, bubble))
+
+        usage = self.usage()
+        if usage["total"] > self.budget:
+            self._spill_attachments(usage)
+            usage = self.usage()
+
+        # Still over budget, drop media of every off screen bubble, farthest first
+        if usage["total"] > self.budget:
+            for _, bubble in sorted(far_bubbles, key=lambda item: item[0], reverse=True):
+                usage["total"] -= bubble.media_bytes()
+                bubble.release_media()
+                if usage["total"] <= self.budget:
+                    break
+            usage = self.usage()
+
+        # Then drop the bubbles of old messages far above the visible area
+        if usage["total"] > self.budget:
+            excess = usage["total"] - self.budget
+            for view in list(self.views):
+                viewport_height, _ = view.bubble_distances()
+                excess -= view.evict_earlier(viewport_height * KEEP_SCREENS, excess)
+                if excess <= 0:
+                    break
+            usage = self.usage()
+
+        self.usageChanged.emit(usage)
+
+    def _spill_attachments(self, usage):
+        if not self.spill_dir:
+            return
+        excess = usage["total"] - self.budget
+        for attachment in self.live_attachments():
+            if excess <= 0:
+                break
+            if not attachment.in_memory:
+                continue
+            size = attachment.size
+            try:
+                attachment.spill(self.spill_dir)
+            except OSError as e:
+                logging.warning(f"Could not spill attachment to disk: {e}")
+                return
+            finalizer = weakref.finalize(attachment, self.spilledReleased.emit, attachment.path)
+            finalizer.atexit = False  # Left to the collection at shutdown
+            excess -= size
+
+    def _on_spilled_released(self, path):
+        if self.collect:
+            self.collect()
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_governor = None
+
+
+def get_governor():
+    """Shared governor, created once the Qt application exists"""
+    global _governor
+    if _governor is None:
+        _governor = MemoryGovernor()
+    return _governor
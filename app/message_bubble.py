@@ -1,13 +1,29 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QFrame, QSizePolicy
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFrame, QSizePolicy, QPushButton
 from PySide6.QtGui import QPixmap, QFontMetrics, QFont
-from PySide6.QtCore import Qt, QDateTime, QSize
+from PySide6.QtCore import Qt, QDateTime, QSize, Signal
 import base64
+from .attachments import content_attachments
+from .markdown_renderer import MarkdownView
+from .composer import document_summary
+
+DOCUMENT_PREVIEW_CHARS = 2000  # Start of a document shown when it is expanded
+DOCUMENT_PREVIEW_LINES = 20
+WIDGET_SIZE_MAX = (1 << 24) - 1  # QWIDGETSIZE_MAX, no maximum size
+
 
 class MessageBubble(QFrame):
+    regenerateRequested = Signal()
+    editRequested = Signal()
+    branchRequested = Signal(int)  # -1 for the previous sibling, 1 for the next
+    
     def __init__(self, message_type, content, parent=None):
         super().__init__(parent)
         self.setObjectName("messageBubble")
         self.setProperty("type", message_type)
+        self.message_type = message_type
+        self.markdown_view = None  # Assistant text is rendered as Markdown
+        self.image_labels = []  # (label, attachment), pixmaps can be dropped and rebuilt
+        self.text_length = 0
         
         # Set size policy to expand vertically
         self.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
@@ -38,10 +54,15 @@ class MessageBubble(QFrame):
             # Multimodal message (text + image)
             if content.get('text'):
                 self.add_text_label(content['text'])
-            if content.get('image_base64'):
-                self.add_image_label(content['image_base64'])
-            if content.get('audio_base64'):
-                self.add_audio_label(content['audio_base64'])
+            for attachment in content_attachments(content):
+                if attachment.kind == "image":
+                    self.add_image_label(attachment)
+                elif attachment.kind == "document":
+                    self.add_document_label(attachment)
+                else:
+                    self.add_audio_label(attachment)
+        elif self.message_type == "assistant":
+            self.add_markdown_view(content)
         else:
             # Text-only message
             self.add_text_label(content)
@@ -51,6 +72,7 @@ class MessageBubble(QFrame):
     
     def add_text_label(self, text):
         """Add text label to the bubble"""
+        self.text_length = len(text or "")
         text_label = QLabel(text)
         text_label.setWordWrap(True)
         text_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
@@ -74,12 +96,32 @@ class MessageBubble(QFrame):
         text_label.adjustSize()
 
     
-    def add_image_label(self, image_base64):
-        """Add image to the bubble"""
-        pixmap = QPixmap()
-        pixmap.loadFromData(base64.b64decode(image_base64))
+    def add_markdown_view(self, text):
+        """Add an incrementally rendered Markdown view to the bubble"""
+        parent_width = self.parent().width() if self.parent() else 600
+        max_width = min(parent_width * 0.8, 600)
+        self.markdown_view = MarkdownView(text or "", max_width=int(max_width))
+        self.markdown_view.setMaximumWidth(int(max_width))
+        self.layout.addWidget(self.markdown_view)
+    
+    def append_content(self, chunk):
+        """Stream a chunk into the bubble, re-rendering only the open block"""
+        if self.markdown_view is None:
+            return
+        self.markdown_view.append(chunk)
+        self.adjustSize()
+        self.updateGeometry()
+    
+    def finish_content(self):
+        """Close the last Markdown block once the reply is complete"""
+        if self.markdown_view is not None:
+            self.markdown_view.finish()
+            self.adjustSize()
+    
+    def add_image_label(self, image):
+        """Add image attachment to the bubble"""
         image_label = QLabel()
-        image_label.setPixmap(pixmap.scaled(300, 300, Qt.KeepAspectRatio))
+        image_label.setPixmap(self._load_preview(image))
         image_label.setObjectName("imagePreview")
         image_label.setStyleSheet("""
             background: transparent;
@@ -87,8 +129,46 @@ class MessageBubble(QFrame):
             margin: 0;
         """)
         self.layout.addWidget(image_label)
+        self.image_labels.append((image_label, image))
+    
+    def _load_preview(self, image):
+        pixmap = QPixmap()
+        pixmap.loadFromData(image.read_bytes())
+        return pixmap.scaled(300, 300, Qt.KeepAspectRatio)
+    
+    def release_media(self):
+        """Drop decoded images, keeping their space so the layout does not jump"""
+        for label, _ in self.image_labels:
+            pixmap = label.pixmap()
+            if pixmap is not None and not pixmap.isNull():
+                label.setFixedSize(label.size())
+                label.clear()
+    
+    def restore_media(self):
+        """Decode images again after release_media"""
+        for label, image in self.image_labels:
+            pixmap = label.pixmap()
+            if pixmap is None or pixmap.isNull():
+                label.setPixmap(self._load_preview(image))
+                # Undo the fixed size of release_media, the label follows its pixmap again
+                label.setMinimumSize(0, 0)
+                label.setMaximumSize(WIDGET_SIZE_MAX, WIDGET_SIZE_MAX)
     
-    def add_audio_label(self, audio_base64):
+    def media_bytes(self):
+        """Approximate memory held by decoded images"""
+        total = 0
+        for label, _ in self.image_labels:
+            pixmap = label.pixmap()
+            if pixmap is not None and not pixmap.isNull():
+                total += pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+        return total
+    
+    def widget_bytes(self):
+        """Rough estimate of the widgets and laid out text of the bubble"""
+        text_length = self.markdown_view.fed_length if self.markdown_view else self.text_length
+        return 16 * 1024 + text_length * 16
+    
+    def add_audio_label(self, audio):
         """Add audio player to the bubble"""
         audio_label = QLabel("🔊 Audio Message")
         audio_label.setStyleSheet("""
@@ -116,13 +196,95 @@ class MessageBubble(QFrame):
         play_button.setFixedSize(80, 30)
         
         # Store audio data in the button
-        play_button.audio_base64 = audio_base64
+        play_button.audio = audio
         
         # Connect the click event
-        play_button.clicked.connect(lambda: self.play_audio(play_button.audio_base64))
+        play_button.clicked.connect(lambda: self.play_audio(play_button.audio))
         
         self.layout.addWidget(play_button)
     
+    def add_document_label(self, document):
+        """Collapsed document: a header line, its start shown on demand.
+
+        Only the first lines are ever read into the bubble, a long log
+        would otherwise cost a full text layout.
+        """
+        frame = QFrame()
+        frame.setObjectName("documentView")
+        column = QVBoxLayout(frame)
+        column.setContentsMargins(0, 0, 0, 0)
+        column.setSpacing(2)
+        
+        header = QHBoxLayout()
+        title = QLabel(f"📄 {document_summary(document)}")
+        title.setObjectName("documentTitle")
+        toggle = QPushButton("Show")
+        toggle.setObjectName("documentToggle")
+        header.addWidget(title, 1)
+        header.addWidget(toggle)
+        column.addLayout(header)
+        
+        preview = QLabel()
+        preview.setObjectName("documentPreview")
+        preview.setTextFormat(Qt.PlainText)
+        preview.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        preview.setWordWrap(True)
+        preview.hide()
+        column.addWidget(preview)
+        
+        def toggle_preview():
+            if preview.isHidden():
+                if not preview.text():
+                    text = document.preview(DOCUMENT_PREVIEW_CHARS)
+                    lines = text.split("\n")
+                    more = len(text) >= DOCUMENT_PREVIEW_CHARS or len(lines) > DOCUMENT_PREVIEW_LINES
+                    preview.setText("\n".join(lines[:DOCUMENT_PREVIEW_LINES]) + ("\n…" if more else ""))
+                preview.show()
+                toggle.setText("Hide")
+            else:
+                preview.hide()
+                toggle.setText("Show")
+            self.adjustSize()
+        
+        toggle.clicked.connect(toggle_preview)
+        self.layout.addWidget(frame)
+    
+    def add_branch_controls(self, index, count):
+        """Regenerate/edit button and "‹ 2/3 ›" navigation between sibling branches"""
+        controls = QWidget()
+        controls.setObjectName("branchControls")
+        row = QHBoxLayout(controls)
+        row.setContentsMargins(0, 0, 0, 0)
+        row.setSpacing(4)
+        
+        if count > 1:
+            previous_button = QPushButton("‹")
+            previous_button.setEnabled(index > 0)
+            previous_button.clicked.connect(lambda: self.branchRequested.emit(-1))
+            next_button = QPushButton("›")
+            next_button.setEnabled(index < count - 1)
+            next_button.clicked.connect(lambda: self.branchRequested.emit(1))
+            position = QLabel(f"{index + 1}/{count}")
+            position.setObjectName("branchPosition")
+            row.addWidget(previous_button)
+            row.addWidget(position)
+            row.addWidget(next_button)
+        row.addStretch(1)
+        
+        if self.message_type == "assistant":
+            action = QPushButton("↻")
+            action.setToolTip("Regenerate")
+            action.clicked.connect(self.regenerateRequested.emit)
+        else:
+            action = QPushButton("✎")
+            action.setToolTip("Edit and resend")
+            action.clicked.connect(self.editRequested.emit)
+        row.addWidget(action)
+        
+        # Above the timestamp, which is always the last row
+        self.layout.insertWidget(max(0, self.layout.count() - 1), controls)
+        self.adjustSize()
+    
     def add_timestamp(self):
         """Add timestamp to the bubble"""
         timestamp = QDateTime.currentDateTime().toString("hh:mm AP")
@@ -140,6 +302,19 @@ class MessageBubble(QFrame):
     
     def update_content(self, new_content):
         """Update bubble content without recreating the entire bubble"""
+        if self.markdown_view is not None:
+            text = new_content.get('text', '') if isinstance(new_content, dict) else new_content
+            view = self.markdown_view
+            # Streamed text only grows, so feed just the new tail
+            if not view.finished and len(text) >= view.fed_length:
+                view.append(text[view.fed_length:])
+            else:
+                view.set_text(text)
+                view.finish()
+            self.adjustSize()
+            self.updateGeometry()
+            return
+        
         # Find the text label
         for i in range(self.layout.count()):
             item = self.layout.itemAt(i)
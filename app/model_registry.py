@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import time
+import httpx
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
+
+from .config_loader import api_key_for, find_models_config, load_models_config
+from .http_pool import api_url
+
+DISCOVERY_TTL = 300  # Seconds before /v1/models results are fetched again
+RELOAD_DELAY = 200  # Editors write files in several steps, wait for them to settle
+
+
+def models_url(endpoint):
+    """Derive the /v1/models URL from a chat completions endpoint"""
+    return api_url(endpoint, 'models')
+
+
+class ModelRegistry(QObject):
+    """Keeps the model list in sync with models.json and discovered endpoints.
+
+    Changes are reported per entry (keyed by name) so views can patch their
+    rows instead of rebuilding everything.
+    """
+    modelsAdded = Signal(list)
+    modelsRemoved = Signal(list)  # Names of removed entries
+    modelsUpdated = Signal(list)
+
+    def __init__(self, path=None, ttl=DISCOVERY_TTL, parent=None):
+        super().__init__(parent)
+        self.path = os.path.abspath(path or find_models_config())
+        self.ttl = ttl
+        self.models = {}  # name -> config, in display order
+        self.configured = []  # Entries as written in models.json
+        self.discovered = {}  # models url -> (fetched_at, [model ids])
+        self._discovery_task = None
+        self._stamp = None  # (mtime, size) of models.json when last read
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._on_file_changed)
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(RELOAD_DELAY)
+        self.reload_timer.timeout.connect(self.reload)
+
+    def load(self):
+        """Initial load, returns the full model list"""
+        self._stamp = self._file_stamp()
+        self.configured = load_models_config(self.path)
+        self.models = {model['name']: model for model in self._entries()}
+        self._watch()
+        return list(self.models.values())
+
+    def get(self, name):
+        return self.models.get(name)
+
+    def reload(self):
+        """Re-read models.json and report only the entries that changed"""
+        self._watch()
+        self._stamp = self._file_stamp()
+        try:
+            self.configured = load_models_config(self.path)
+        except (OSError, ValueError) as e:
+            # Half-written file, keep the previous entries until the next change
+            logging.warning(f"Could not reload {self.path}: {e}")
+            return
+        self._apply(self._entries())
+        self.discover()
+
+    def discover(self, force=False):
+        """Schedule a background refresh of every endpoint's /v1/models"""
+        if self._discovery_task and not self._discovery_task.done():
+            return self._discovery_task
+        self._discovery_task = asyncio.ensure_future(self.refresh_discovered(force))
+        return self._discovery_task
+
+    async def refresh_discovered(self, force=False):
+        # Several entries usually share one server, fetch each url once
+        urls = {}
+        for model in self.configured:
+            if model.get('endpoint'):
+                urls.setdefault(models_url(model['endpoint']), model)
+
+        now = time.monotonic()
+        stale = {
+            url: model for url, model in urls.items()
+            if force or url not in self.discovered or now - self.discovered[url][0] >= self.ttl
+        }
+        if stale:
+            async with httpx.AsyncClient(verify=False) as client:
+                await asyncio.gather(*(
+                    self._fetch_models(client, url, model) for url, model in stale.items()
+                ))
+            self._apply(self._entries())
+        return self.discovered
+
+    async def _fetch_models(self, client, url, model):
+        api_key = api_key_for(model)
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        try:
+            response = await client.get(url, headers=headers, timeout=10.0)
+            response.raise_for_status()
+            data = response.json().get('data', [])
+            ids = [item['id'] for item in data if isinstance(item, dict) and item.get('id')]
+        except (httpx.HTTPError, ValueError, AttributeError) as e:
+            # Failures are cached too so endpoints are not hammered, but keep
+            # the models found last time, one bad response should not drop them
+            logging.debug(f"Model discovery failed for {url}: {e}")
+            ids = self.discovered.get(url, (0, []))[1]
+        self.discovered[url] = (time.monotonic(), ids)
+
+    def _entries(self):
+        """Configured entries followed by models discovered for them"""
+        entries = []
+        for model in self.configured:
+            entries.append(model)
+            if not model.get('discover_models') or not model.get('endpoint'):
+                continue
+            _, ids = self.discovered.get(models_url(model['endpoint']), (0, []))
+            for model_id in ids:
+                if model_id == model.get('model_name'):
+                    continue
+                derived = dict(model, name=f"{model['name']} / {model_id}", model_name=model_id)
+                derived.pop('discover_models', None)
+                derived['discovered_from'] = model['name']
+                entries.append(derived)
+        return entries
+
+    def _apply(self, entries):
+        new_models = {}
+        for model in entries:
+            new_models.setdefault(model['name'], model)
+
+        removed = [name for name in self.models if name not in new_models]
+        added = [model for name, model in new_models.items() if name not in self.models]
+        updated = [
+            model for name, model in new_models.items()
+            if name in self.models and self.models[name] != model
+        ]
+        self.models = new_models
+
+        if removed:
+            self.modelsRemoved.emit(removed)
+        if added:
+            self.modelsAdded.emit(added)
+        if updated:
+            self.modelsUpdated.emit(updated)
+
+    def _watch(self):
+        # Atomic saves replace the file, which drops it from the watcher, so
+        # the folder is watched as well to pick it up again
+        folder = os.path.dirname(self.path)
+        if os.path.isdir(folder) and folder not in self.watcher.directories():
+            self.watcher.addPath(folder)
+        if os.path.exists(self.path) and self.path not in self.watcher.files():
+            self.watcher.addPath(self.path)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _on_file_changed(self, path):
+        self.reload_timer.start()
+
+    def _on_directory_changed(self, path):
+        # The folder also holds journals and other app data, only a
+        # replaced or recreated models.json is of interest
+        if self._file_stamp() != self._stamp:
+            self.reload_timer.start()
@@ -15,6 +15,27 @@ class ModelSelector(QComboBox):
         for model in models:
             self.addItem(model["name"], model)
     
+    def add_models(self, models):
+        self.model_configs = self.model_configs + list(models)
+        for model in models:
+            self.addItem(model["name"], model)
+    
+    def remove_models(self, names):
+        self.model_configs = [m for m in self.model_configs if m["name"] not in names]
+        for name in names:
+            index = self.findText(name)
+            if index >= 0:
+                self.removeItem(index)
+    
+    def update_models(self, models):
+        """Replace changed entries without touching the rest of the list"""
+        by_name = {model["name"]: model for model in models}
+        self.model_configs = [by_name.get(m["name"], m) for m in self.model_configs]
+        for name, model in by_name.items():
+            index = self.findText(name)
+            if index >= 0:
+                self.setItemData(index, model)
+    
     def _emit_model_changed(self, index):
         model_config = self.itemData(index)
         self.modelChanged.emit(model_config)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import asyncio
+import collections
+import logging
+import threading
+
+from . import http_pool
+from .api_client import OpenAIClient
+
+STREAM_QUEUE_SIZE = 64  # Chunks buffered for the GUI before the stream read waits
+
+
+class NetworkThread:
+    """Event loop in a background thread for the API client layer.
+
+    Socket reads then keep going while the Qt loop is busy with layout or
+    image decoding, and a slow network never stalls the GUI. The thread
+    owns its own pooled httpx clients.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="network", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_thread(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, coro):
+        """Run a coroutine on the network loop, returns a concurrent future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout=5):
+        try:
+            self.submit(http_pool.close_clients()).result(timeout)
+        except Exception as e:
+            logging.debug(f"Closing network clients failed: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+
+class ThreadedClient:
+    """OpenAIClient whose requests run on the network thread.
+
+    Awaited from the GUI loop like the plain client. Stream chunks come
+    back through a bounded queue, so a GUI that falls behind slows the
+    read instead of growing memory. The buffer is a thread-safe deque, so
+    socket reads only wait when it is full, never on the GUI loop itself.
+    Cancelling the caller cancels the request on the network loop.
+    """
+
+    def __init__(self, client, network):
+        self.client = client
+        self.network = network
+
+    def __getattr__(self, name):
+        # Config flags like supports_streaming come from the wrapped client
+        return getattr(self.client, name)
+
+    def prewarm(self):
+        """Prewarm the network loop's pool, the one requests will use"""
+        self.network.call(self.client.prewarm)
+
+    async def send_request(self, messages, max_tokens=1500):
+        future = self.network.submit(self.client.send_request(list(messages), max_tokens))
+        return await asyncio.wrap_future(future)
+
+    async def stream_response(self, messages, max_tokens=1500):
+        buffer = collections.deque()
+        space = threading.Semaphore(STREAM_QUEUE_SIZE)
+        ready = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        future = self.network.submit(
+            self._produce(lambda item: self._put(loop, buffer, space, ready, item), list(messages), max_tokens)
+        )
+        try:
+            while True:
+                if not buffer:
+                    ready.clear()
+                    if not buffer:  # Checked again, a put may have landed before the clear
+                        await ready.wait()
+                    continue
+                kind, value = buffer.popleft()
+                space.release()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            # Wake a producer waiting for space so it sees the cancellation
+            space.release(STREAM_QUEUE_SIZE)
+            future.cancel()
+
+    @staticmethod
+    async def _put(loop, buffer, space, ready, item):
+        """Runs on the network loop, only waits while the buffer is full"""
+        if not space.acquire(blocking=False):
+            await asyncio.get_running_loop().run_in_executor(None, space.acquire)
+        buffer.append(item)
+        loop.call_soon_threadsafe(ready.set)
+
+    async def _produce(self, put, messages, max_tokens):
+        """Runs on the network loop, feeds the GUI loop's buffer"""
+        try:
+            async for chunk in self.client.stream_response(messages, max_tokens):
+                await put(("chunk", chunk))
+        except Exception as e:
+            await put(("error", e))
+            return
+        await put(("done", None))
+
+
+_network = None
+
+
+def start_network_thread():
+    global _network
+    if _network is None:
+        _network = NetworkThread()
+        _network.start()
+    return _network
+
+
+def get_network_thread():
+    """The running network thread, None when requests use the GUI loop"""
+    return _network
+
+
+def stop_network_thread():
+    global _network
+    if _network is not None:
+        _network.stop()
+        _network = None
+
+
+def create_client(config):
+    """API client for a model, on the network thread when it is enabled"""
+    client = OpenAIClient(config)
+    if _network is None:
+        return client
+    return ThreadedClient(client, _network)
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from . import http_pool
+from .api_client import EndpointUnreachable
+
+DRAIN_CONCURRENCY = 2  # Queued requests resent at once per endpoint
+PROBE_TIMEOUT = 3.0  # Seconds a reachability probe waits for the TCP connect
+PROBE_BACKOFF = (1, 2, 5, 10, 30)  # Seconds between probes, the last repeats
+
+
+class AlreadyQueued(Exception):
+    """The same message already has a reply waiting for its endpoint"""
+
+
+def request_key(entry):
+    """Outbox key of a request, one per endpoint, conversation and message answered"""
+    return f"{entry['endpoint']}|{entry['conversation']}|{entry['parent']}"
+
+
+class Outbox:
+    """Requests that failed because their endpoint could not be reached.
+
+    Queued entries are kept in a small JSON file and survive restarts. They
+    are keyed by endpoint, conversation and the message they answer, so
+    asking again while offline does not queue a second request. One TCP
+    probe per endpoint detects when it is back. The queue then drains with
+    at most DRAIN_CONCURRENCY requests per endpoint.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}  # key -> entry dict
+        self.online = {}  # endpoint -> asyncio.Event, set while reachable
+        self.probes = {}  # endpoint -> probe task
+        self.slots = {}  # endpoint -> asyncio.Semaphore
+
+    def configure(self, path):
+        """Load the entries left by the last run"""
+        self.path = path
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = {entry["key"]: entry for entry in json.load(f)}
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Could not read the outbox {path}: {e}")
+
+    def entries_for(self, conversation):
+        return [entry for entry in self.entries.values() if entry["conversation"] == conversation]
+
+    def prune(self, conversations):
+        """Drop entries of conversations that no longer exist"""
+        stale = [key for key, entry in self.entries.items() if entry["conversation"] not in conversations]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self._save()
+
+    def drop(self, conversation):
+        """Forget the queued requests of a cleared or closed conversation"""
+        stale = [key for key, entry in self.entries.items() if entry["conversation"] == conversation]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self._save()
+
+    def add(self, entry):
+        """Queue `entry`, returns the entry already queued under its key if any"""
+        entry.setdefault("key", request_key(entry))
+        entry.setdefault("queued_at", time.time())
+        existing = self.entries.setdefault(entry["key"], entry)
+        if existing is entry:
+            self._save()
+        return existing
+
+    def remove(self, key):
+        if self.entries.pop(key, None) is not None:
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(list(self.entries.values()), f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not write the outbox {self.path}: {e}")
+
+    async def send(self, entry, attempt, on_queued, queued=False):
+        """Run `attempt()`, queueing and retrying it while the endpoint is unreachable.
+
+        `entry` describes the request for the outbox file, `on_queued` is
+        called once when it gets queued. With `queued` the entry comes from
+        the outbox file and waits for the endpoint before the first try.
+        Raises AlreadyQueued when another reply to the same message waits.
+        """
+        endpoint = entry["endpoint"]
+        owned = False  # The queued entry under the key is this request's
+        if queued:
+            self._queue(entry)
+            owned = True
+            self.mark_down(endpoint)
+        try:
+            while True:
+                try:
+                    if not queued:
+                        return await attempt()
+                    await self.online[endpoint].wait()
+                    async with self._slot(endpoint):
+                        return await attempt()
+                except EndpointUnreachable as e:
+                    logging.info(f"{endpoint} is unreachable, request queued: {e}")
+                    self.mark_down(endpoint)
+                    if not queued:
+                        self._queue(entry)
+                        owned = queued = True
+                        on_queued(e)
+        except (asyncio.CancelledError, GeneratorExit):
+            # Closed or shutting down, the entry stays in the file for the next run
+            owned = False
+            raise
+        finally:
+            if owned:
+                self.discard(entry)
+
+    def discard(self, entry):
+        """Remove `entry` unless its key now belongs to another reply"""
+        existing = self.entries.get(entry["key"])
+        if existing is not None and existing["reply"] == entry["reply"]:
+            self.remove(entry["key"])
+
+    def _queue(self, entry):
+        existing = self.add(entry)
+        # The entry of a resumed request is the one loaded from the file
+        if existing["reply"] != entry["reply"]:
+            raise AlreadyQueued(f"A reply to this message is already waiting for {entry['endpoint']}")
+
+    def _slot(self, endpoint):
+        if endpoint not in self.slots:
+            self.slots[endpoint] = asyncio.Semaphore(DRAIN_CONCURRENCY)
+        return self.slots[endpoint]
+
+    def mark_down(self, endpoint):
+        """Hold queued requests for `endpoint` until a probe connects"""
+        event = self.online.setdefault(endpoint, asyncio.Event())
+        event.clear()
+        probe = self.probes.get(endpoint)
+        if probe is None or probe.done():
+            self.probes[endpoint] = asyncio.ensure_future(self._probe(endpoint))
+
+    async def _probe(self, endpoint):
+        """TCP connect with backoff, nothing is sent"""
+        _, host, port = http_pool.origin_of(endpoint)
+        attempt = 0
+        while True:
+            try:
+                for address in await http_pool.resolve(host, port):
+                    try:
+                        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), PROBE_TIMEOUT)
+                        break
+                    except (OSError, asyncio.TimeoutError):
+                        continue
+                else:
+                    http_pool.forget(host, port)
+                    raise OSError(f"No address of {host}:{port} accepted the connection")
+                writer.close()
+                logging.info(f"{endpoint} is reachable again, draining the outbox")
+                self.online[endpoint].set()
+                return
+            except (OSError, asyncio.TimeoutError):
+                await asyncio.sleep(PROBE_BACKOFF[min(attempt, len(PROBE_BACKOFF) - 1)])
+                attempt += 1
+
+
+outbox = Outbox()
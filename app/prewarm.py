@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from . import http_pool
+from .config_loader import api_key_for
+from .providers import get_adapter
+from .request_body import encode_body
+
+WARM_FOR = http_pool.KEEPALIVE_EXPIRY - 10  # Skip prewarming while a pooled connection is still fresh
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def prewarm_options(config):
+    """Per-model prewarm settings from models.json.
+
+    "prewarm": false disables it, true or a dict enables it. A dict may set
+    "connect" (open a pooled connection) and "warmup_request" (send a
+    one-token completion so a local server loads the model).
+    """
+    option = config.get("prewarm", True)
+    if not option:
+        return None
+    options = {"connect": True, "warmup_request": False}
+    if isinstance(option, dict):
+        options.update(option)
+    return options
+
+
+class Prewarmer:
+    """Background DNS, connection and model warmup before the first turn"""
+
+    def __init__(self):
+        self.tasks = {}  # endpoint -> task
+        self.warmed_at = {}  # origin -> time of the last warm connection
+        self.warmed_models = set()  # (endpoint, model_name) already loaded by the server
+
+    def prewarm(self, config):
+        """Start prewarming for a model config, returns the task or None.
+
+        Warms the pool of the running loop, clients call this on the loop
+        their requests use.
+        """
+        endpoint = config.get("endpoint")
+        options = prewarm_options(config)
+        if not endpoint or not options:
+            return None
+
+        task = self.tasks.get(endpoint)
+        if task and not task.done():
+            return task
+
+        task = asyncio.ensure_future(self._prewarm(config, options))
+        self.tasks[endpoint] = task
+        task.add_done_callback(lambda t, endpoint=endpoint: self._forget(endpoint, t))
+        return task
+
+    def cancel(self, keep=None):
+        """Cancel running prewarms, except the one for the `keep` endpoint"""
+        for endpoint, task in list(self.tasks.items()):
+            if endpoint != keep:
+                task.cancel()
+
+    async def _prewarm(self, config, options):
+        endpoint = config["endpoint"]
+        scheme, host, port = http_pool.origin_of(endpoint)
+        origin = (scheme, host, port)
+        started = time.monotonic()
+
+        try:
+            if options.get("connect") and time.monotonic() - self.warmed_at.get(origin, -WARM_FOR) >= WARM_FOR:
+                await http_pool.resolve(host, port)
+                # Any response leaves the TCP/TLS connection in the shared pool
+                client = http_pool.get_client(config.get("verify_ssl", False))
+                await client.head(endpoint, timeout=10.0)
+                self.warmed_at[origin] = time.monotonic()
+                logging.debug(f"Prewarmed connection to {host}:{port} in {time.monotonic() - started:.3f}s")
+
+            model_key = (endpoint, config.get("model_name"))
+            if options.get("warmup_request") and model_key not in self.warmed_models:
+                if host not in LOCAL_HOSTS and options.get("warmup_request") != "always":
+                    return
+                await self._warmup_request(config)
+                self.warmed_models.add(model_key)
+                logging.debug(f"Warmed up {config.get('name')} in {time.monotonic() - started:.3f}s")
+        except (httpx.HTTPError, OSError) as e:
+            # Prewarming is best effort, the real request reports errors
+            logging.debug(f"Prewarm for {endpoint} failed: {e}")
+
+    async def _warmup_request(self, config):
+        """One-token completion on the shared pool.
+
+        Sent directly rather than through OpenAIClient, so it is left out
+        of the usage stats. Error statuses raise and are logged by _prewarm.
+        """
+        payload = get_adapter(config).build_payload([{"role": "user", "content": "Hi"}], 1)
+        api_key = api_key_for(config)
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}" if api_key else ""
+        }
+        client = http_pool.get_client(config.get("verify_ssl", False))
+        response = await client.post(config["endpoint"], headers=headers, content=encode_body(payload), timeout=60.0)
+        response.raise_for_status()
+
+    def _forget(self, endpoint, task):
+        if self.tasks.get(endpoint) is task:
+            del self.tasks[endpoint]
+
+
+prewarmer = Prewarmer()
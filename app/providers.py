@@ -0,0 +1,395 @@
+import json
+from urllib.parse import urlsplit
+
+from .attachments import content_attachments
+from .request_body import Fragment, InlineData, InlineText, canonical
+
+
+async def decode_sse(response):
+    """Server-sent events, yields the JSON payload of each event"""
+    data_lines = []
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip(" "))
+            continue
+        if line or not data_lines:
+            continue  # Comments, event names and keep-alive blank lines
+        # A blank line ends the event
+        data = "\n".join(data_lines)
+        data_lines = []
+        if data == "[DONE]":
+            return
+        try:
+            yield json.loads(data)
+        except json.JSONDecodeError:
+            continue
+
+    # Some servers close the stream without a trailing blank line
+    if data_lines and data_lines != ["[DONE]"]:
+        try:
+            yield json.loads("\n".join(data_lines))
+        except json.JSONDecodeError:
+            pass
+
+
+async def decode_ndjson(response):
+    """Newline-delimited JSON, one object per line"""
+    async for line in response.aiter_lines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            continue
+
+
+async def decode_json_stream(response):
+    """Concatenated JSON objects or a JSON array, split at chunk boundaries"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    async for text in response.aiter_text():
+        buffer += text
+        position = 0
+        while True:
+            # Skip whitespace and array punctuation between objects
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                position += 1
+            if position >= len(buffer):
+                break
+            try:
+                obj, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # Incomplete object, wait for more data
+            yield obj
+        buffer = buffer[position:]
+
+
+def document_text(attachment):
+    """Text parts of a document, headed by its file name"""
+    return [f"{attachment.filename}:\n", attachment]
+
+
+def content_text(content):
+    """Message text with its documents appended, as one JSON string"""
+    if not isinstance(content, dict):
+        return content
+    documents = [a for a in content_attachments(content) if a.kind == "document"]
+    if not documents:
+        return content.get('text', '')
+    parts = [content['text'], "\n\n"] if content.get('text') else []
+    for i, attachment in enumerate(documents):
+        if i:
+            parts.append("\n\n")
+        parts.extend(document_text(attachment))
+    return InlineText(parts)
+
+
+STREAM_DECODERS = {
+    "sse": decode_sse,
+    "ndjson": decode_ndjson,
+    "json": decode_json_stream,
+}
+
+
+class ProviderAdapter:
+    """Request and response shapes of one backend family.
+
+    Subclasses build the payload, name the streaming wire format and pull
+    text out of full responses and stream events.
+    """
+    stream_format = "sse"
+    supports_uploads = False  # Whether messages can reference uploaded file ids
+
+    def __init__(self, config):
+        self.config = config
+        self.stream_format = config.get("stream_format", self.stream_format)
+        # Attachment kinds the server accepts as uploaded file references,
+        # text documents are always sent inline
+        kinds = set(config.get("upload_kinds") or ()) - {"document"}
+        self.upload_kinds = kinds if self.supports_uploads else set()
+        # Byte-stable history for servers that reuse the KV cache of a repeated prefix
+        self.prefix_cache = config.get("prefix_cache", False)
+        self.cache_hints = config.get("cache_hints") or {}  # e.g. {"cache_prompt": true} for llama.cpp
+        # Usage in streams needs stream_options, which other servers may reject
+        self.stream_usage = config.get(
+            "stream_usage", urlsplit(config.get("endpoint", "")).hostname == "api.openai.com"
+        )
+
+    def build_payload(self, messages, max_tokens, stream=False, references=None):
+        """Request body for `messages`.
+
+        `references` maps attachment digests to uploaded file ids, those
+        attachments are referenced instead of inlined.
+        """
+        raise NotImplementedError
+
+    def parse_response(self, data):
+        raise NotImplementedError
+
+    def parse_event(self, event):
+        """Text carried by one stream event, or None"""
+        raise NotImplementedError
+
+    def is_final(self, event):
+        """Whether the event marks the end of the stream"""
+        return False
+
+    def parse_usage(self, data):
+        """Token counts of a response or stream event, None when it has none.
+
+        Reads the OpenAI `usage` block and the llama.cpp server's
+        `timings` and `tokens_cached`, returning prompt_tokens,
+        completion_tokens, cached_tokens, prompt_ms and generation_ms
+        where reported.
+        """
+        if not isinstance(data, dict):
+            return None
+        usage = data.get("usage") or {}
+        timings = data.get("timings") or {}
+        found = {
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+            "prompt_ms": timings.get("prompt_ms"),
+            "generation_ms": timings.get("predicted_ms"),
+        }
+        if found["cached_tokens"] is None:
+            found["cached_tokens"] = timings.get("cache_n", data.get("tokens_cached"))
+        found = {key: value for key, value in found.items() if value is not None}
+        return found or None
+
+    def finish_payload(self, payload):
+        """Apply the model's cache hints, and key order for prefix caching"""
+        for key, value in self.cache_hints.items():
+            if isinstance(value, dict) and isinstance(payload.get(key), dict):
+                payload[key] = dict(payload[key], **value)
+            else:
+                payload[key] = value
+        return canonical(payload) if self.prefix_cache else payload
+
+    def decode_stream(self, response):
+        return STREAM_DECODERS[self.stream_format](response)
+
+    @property
+    def fragment_key(self):
+        # Entries shaped for prefix caching differ from the plain ones
+        return type(self), self.prefix_cache
+
+    def cached_entry(self, msg):
+        """Serialized entry of a history message from an earlier request"""
+        fragments = getattr(msg, "fragments", None)
+        return fragments.get(self.fragment_key) if fragments is not None else None
+
+    def cache_entry(self, msg, entry):
+        """Keep the serialized entry of a tree message for later requests.
+
+        Messages with attachments stay unserialized, their data is encoded
+        while the body is written. With prefix caching the entry's keys are
+        sorted first, so a message is the same bytes in every request.
+        """
+        if self.prefix_cache:
+            entry = canonical(entry)
+        fragments = getattr(msg, "fragments", None)
+        if fragments is None or content_attachments(msg['content']):
+            return entry
+        fragment = fragments[self.fragment_key] = Fragment(entry)
+        return fragment
+
+
+class OpenAIAdapter(ProviderAdapter):
+    """OpenAI chat completions, streamed as SSE deltas"""
+    supports_uploads = True
+
+    def build_payload(self, messages, max_tokens, stream=False, references=None):
+        references = references or {}
+        api_messages = []
+        for msg in messages:
+            cached = self.cached_entry(msg)
+            if cached is not None:
+                api_messages.append(cached)
+                continue
+            content = []
+
+            # Handle text content
+            if isinstance(msg['content'], dict) and 'text' in msg['content']:
+                content.append({"type": "text", "text": msg['content']['text']})
+
+            # Handle image, audio and document content
+            for attachment in content_attachments(msg['content']):
+                file_id = references.get(attachment.digest())
+                if attachment.kind == "document":
+                    content.append({"type": "text", "text": InlineText(document_text(attachment))})
+                elif file_id and attachment.kind in self.upload_kinds:
+                    content.append(self.reference_part(attachment, file_id))
+                else:
+                    content.append(self.inline_part(attachment))
+
+            # Handle simple text
+            if not isinstance(msg['content'], dict) and msg['content']:
+                content.append({"type": "text", "text": msg['content']})
+
+            if (self.prefix_cache and len(content) == 1 and content[0].get("type") == "text"
+                    and isinstance(content[0]["text"], str)):
+                # One canonical form for text, however the message was stored
+                content = content[0]["text"]
+
+            api_messages.append(self.cache_entry(msg, {
+                "role": msg['role'],
+                "content": content
+            }))
+
+        payload = {
+            "model": self.config["model_name"],
+            "messages": api_messages,
+            "max_tokens": max_tokens
+        }
+        if stream:
+            payload["stream"] = True
+            if self.stream_usage:
+                # Usage arrives in a last chunk with empty choices
+                payload["stream_options"] = {"include_usage": True}
+        return self.finish_payload(payload)
+
+    def inline_part(self, attachment):
+        # Encoded while the body is written, not held in the payload
+        if attachment.kind == "image":
+            return {"type": "image_url", "image_url": {"url": InlineData.data_url(attachment)}}
+        return {"type": "audio", "audio": {"url": InlineData.data_url(attachment)}}
+
+    def reference_part(self, attachment, file_id):
+        # Only for kinds listed in "upload_kinds", chat completions itself
+        # accepts file parts for documents like PDF, not for images or audio
+        return {"type": "file", "file": {"file_id": file_id}}
+
+    def parse_response(self, data):
+        if data.get("choices") and len(data["choices"]) > 0:
+            content = data["choices"][0]["message"]["content"]
+            if isinstance(content, list):
+                return "\n".join([item.get("text", "") for item in content if item.get("text")])
+            return content
+        return "No response from model"
+
+    def parse_event(self, event):
+        if event.get("choices"):
+            delta = event["choices"][0].get("delta", {})
+            return delta.get("content")
+        return None
+
+
+class OllamaAdapter(ProviderAdapter):
+    """Ollama /api/chat, streamed as NDJSON"""
+    stream_format = "ndjson"
+
+    def build_payload(self, messages, max_tokens, stream=False, references=None):
+        message_list = []
+        for msg in messages:
+            cached = self.cached_entry(msg)
+            if cached is not None:
+                message_list.append(cached)
+                continue
+            content = msg['content']
+            entry = {"role": msg['role']}
+            if isinstance(content, dict):
+                entry["content"] = content_text(content)
+                images = [InlineData(a) for a in content_attachments(content) if a.kind == "image"]
+                if images:
+                    entry["images"] = images
+            else:
+                entry["content"] = content
+            message_list.append(self.cache_entry(msg, entry))
+
+        return self.finish_payload({
+            "model": self.config["model_name"],
+            "messages": message_list,
+            "stream": stream,
+            "options": {"num_predict": max_tokens}
+        })
+
+    def parse_response(self, data):
+        message = data.get("message") or {}
+        return message.get("content") or data.get("response") or "No response from model"
+
+    def parse_event(self, event):
+        message = event.get("message") or {}
+        return message.get("content") or event.get("response")
+
+    def is_final(self, event):
+        return bool(event.get("done"))
+
+    def parse_usage(self, data):
+        # Ollama reports counts and nanosecond durations on the final object
+        if not isinstance(data, dict) or "prompt_eval_count" not in data:
+            return None
+        found = {
+            "prompt_tokens": data.get("prompt_eval_count"),
+            "completion_tokens": data.get("eval_count"),
+        }
+        if data.get("prompt_eval_duration") is not None:
+            found["prompt_ms"] = data["prompt_eval_duration"] / 1e6
+        if data.get("eval_duration") is not None:
+            found["generation_ms"] = data["eval_duration"] / 1e6
+        return found
+
+
+class CustomAdapter(ProviderAdapter):
+    """Langchain-style servers answering with response, text or output.
+
+    Streams are read as a sequence of JSON objects carrying the same keys.
+    """
+    stream_format = "json"
+    text_keys = ("response", "text", "output", "content")
+
+    def build_payload(self, messages, max_tokens, stream=False, references=None):
+        # Extract all messages
+        message_list = []
+        for msg in messages:
+            cached = self.cached_entry(msg)
+            if cached is not None:
+                message_list.append(cached)
+                continue
+            role = "user" if msg['role'] == "user" else "assistant"
+            content = msg['content']
+            if isinstance(content, dict):
+                content = content_text(content)
+            message_list.append(self.cache_entry(msg, {"role": role, "content": content}))
+
+        payload = {
+            "model": self.config["model_name"],
+            "messages": message_list,
+            "max_tokens": max_tokens
+        }
+        if stream:
+            payload["stream"] = True
+        return self.finish_payload(payload)
+
+    def parse_response(self, data):
+        for key in self.text_keys[:3]:
+            if key in data:
+                return data[key]
+        return "No response from model"
+
+    def parse_event(self, event):
+        if not isinstance(event, dict):
+            return None
+        for key in self.text_keys:
+            if isinstance(event.get(key), str):
+                return event[key]
+        return None
+
+    def is_final(self, event):
+        return isinstance(event, dict) and bool(event.get("done"))
+
+
+ADAPTERS = {
+    "openai": OpenAIAdapter,
+    "ollama": OllamaAdapter,
+    "custom": CustomAdapter,
+}
+
+
+def get_adapter(config):
+    """Adapter for a model entry, chosen by api_format or api_type"""
+    name = config.get("api_format") or config.get("api_type") or "openai"
+    # Anything unknown keeps the old behaviour of the custom branch
+    return ADAPTERS.get(name, CustomAdapter)(config)
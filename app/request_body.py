@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Optional, gzip is used when it is missing
+    zstandard = None
+
+WRITE_SIZE = 64 * 1024  # Small JSON pieces are grouped into writes of about this size
+STREAM_THRESHOLD = 1024 * 1024  # Attachment bytes from which bodies are streamed rather than joined
+
+
+class InlineData:
+    """Placeholder for an attachment serialized as a base64 JSON string.
+
+    Payload builders put this where a data URL or base64 string goes, the
+    body writer encodes it chunk by chunk from the attachment's source.
+    """
+
+    def __init__(self, attachment, prefix=""):
+        self.attachment = attachment
+        self.prefix = prefix
+
+    @classmethod
+    def data_url(cls, attachment):
+        return cls(attachment, f"data:{attachment.mime};base64,")
+
+
+class InlineText:
+    """Placeholder for a JSON string joined from text and text attachments.
+
+    Attachments are decoded and escaped piece by piece while the body is
+    written, so a large document is never held as one string.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts  # str or Attachment
+
+
+class Fragment:
+    """JSON serialized once and written to bodies as is.
+
+    History messages shared by several branches and turns are kept in
+    this form, so building a request does not serialize them again.
+    """
+
+    def __init__(self, value):
+        self.data = b"".join(iter_json(value))
+
+
+def canonical(value):
+    """Copy of a payload with every object's keys in sorted order.
+
+    Placeholders and fragments are kept as they are, their contents are
+    already in a fixed form.
+    """
+    if isinstance(value, dict):
+        return {key: canonical(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [canonical(item) for item in value]
+    return value
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def iter_json(value):
+    """Serialize a payload to UTF-8 pieces, expanding InlineData lazily"""
+    if isinstance(value, Fragment):
+        yield value.data
+    elif isinstance(value, InlineText):
+        yield b'"'
+        for part in value.parts:
+            for text in ((part,) if isinstance(part, str) else part.iter_text()):
+                yield _dumps(text)[1:-1].encode('utf-8')
+        yield b'"'
+    elif isinstance(value, InlineData):
+        yield ('"' + value.prefix).encode('utf-8')
+        yield from value.attachment.iter_base64()
+        yield b'"'
+    elif isinstance(value, dict):
+        yield b"{"
+        for i, (key, item) in enumerate(value.items()):
+            yield ((',' if i else '') + _dumps(str(key)) + ':').encode('utf-8')
+            yield from iter_json(item)
+        yield b"}"
+    elif isinstance(value, (list, tuple)):
+        yield b"["
+        for i, item in enumerate(value):
+            if i:
+                yield b","
+            yield from iter_json(item)
+        yield b"]"
+    else:
+        yield _dumps(value).encode('utf-8')
+
+
+def iter_chunks(payload, size=WRITE_SIZE):
+    """Serialized payload grouped into chunks of roughly `size` bytes"""
+    pending = []
+    pending_size = 0
+    for piece in iter_json(payload):
+        pending.append(piece)
+        pending_size += len(piece)
+        if pending_size >= size:
+            yield b"".join(pending)
+            pending = []
+            pending_size = 0
+    if pending:
+        yield b"".join(pending)
+
+
+def _compressor(encoding):
+    """Streaming compressor and the Content-Encoding it produces"""
+    if encoding == "zstd":
+        if zstandard is not None:
+            return zstandard.ZstdCompressor().compressobj(), "zstd"
+        logging.debug("zstandard is not installed, compressing with gzip")
+        encoding = "gzip"
+    if encoding == "gzip":
+        return zlib.compressobj(5, zlib.DEFLATED, 31), "gzip"  # wbits 31 writes a gzip header
+    return None, None
+
+
+def content_encoding(compression):
+    """Content-Encoding header value for a request_compression setting"""
+    return _compressor(compression)[1]
+
+
+def encode_body(payload, compression=None):
+    """Whole request body as bytes, for servers that need Content-Length"""
+    return b"".join(iter_body(payload, compression))
+
+
+def iter_body(payload, compression=None):
+    compressor, _ = _compressor(compression)
+    for chunk in iter_chunks(payload):
+        if compressor is None:
+            yield chunk
+            continue
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+async def stream_body(payload, compression=None):
+    """Request body as an async byte producer.
+
+    Peak memory stays around one write chunk no matter how large the
+    attachments are. Chunks are read, encoded and compressed in the
+    default executor, so a large attachment does not block the loop.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = iter_body(payload, compression)
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def attachment_bytes(value):
+    """Size of the attachments a payload inlines, before base64 encoding"""
+    if isinstance(value, InlineData):
+        return value.attachment.size
+    if isinstance(value, InlineText):
+        return sum(part.size for part in value.parts if not isinstance(part, str))
+    if isinstance(value, dict):
+        return sum(attachment_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(attachment_bytes(item) for item in value)
+    return 0
+
+
+def should_stream(payload, setting="auto"):
+    """Whether to send a payload as a chunked body for a stream_request_body setting.
+
+    "auto" streams only payloads carrying large attachments, smaller
+    ones get a Content-Length every server accepts.
+    """
+    if setting == "auto":
+        return attachment_bytes(payload) >= STREAM_THRESHOLD
+    return bool(setting)
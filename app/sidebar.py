@@ -1,17 +1,86 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QListWidget, QLabel
-from PySide6.QtCore import Signal, QTimer
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QListView, QLabel, QLineEdit, QAbstractItemView
+from PySide6.QtGui import QStandardItemModel, QStandardItem
+from PySide6.QtCore import Qt, Signal, QTimer, QSortFilterProxyModel
+from .diagnostics import DiagnosticsPanel, format_count
+from .usage_stats import usage_store, ROLLUP_DAYS
+
+CONFIG_ROLE = Qt.UserRole + 1
+SEARCH_ROLE = Qt.UserRole + 2
+
+
+class ModelFilterProxy(QSortFilterProxyModel):
+    """Substring filter that narrows incrementally while the user types.
+
+    When the new query extends the previous one, only rows that matched
+    before can still match, so the rest are rejected without a string test.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.query = ""
+        self.accepted = set()  # Source rows accepted by the current query
+        self._narrow_from = None
+
+    def set_query(self, query):
+        query = query.strip().lower()
+        if query == self.query:
+            return
+        self._narrow_from = self.accepted if query.startswith(self.query) else None
+        self.query = query
+        self._refilter()
+
+    def invalidate_rows(self):
+        """Forget cached matches after rows were added, removed or changed"""
+        self._narrow_from = None
+        self._refilter()
+
+    def _refilter(self):
+        self.accepted = set()
+        self.invalidateFilter()
+        self._narrow_from = None
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._narrow_from is not None and source_row not in self._narrow_from:
+            return False
+        if not self.query:
+            match = True
+        else:
+            index = self.sourceModel().index(source_row, 0, source_parent)
+            match = self.query in (index.data(SEARCH_ROLE) or "")
+        if match:
+            self.accepted.add(source_row)
+        return match
+
+
+def model_tooltip(model, rollup):
+    """Upstream model name, with recent speed and cost to help pick a model"""
+    lines = [model.get("model_name", model["name"])]
+    if rollup is not None:
+        speed = rollup.tokens_per_second
+        first_token = rollup.average_first_token
+        if speed is not None and first_token is not None:
+            lines.append(f"{speed:.1f} tok/s, first token after {first_token:.2f} s")
+        elif speed is not None:
+            lines.append(f"{speed:.1f} tok/s")
+        lines.append(
+            f"{format_count(rollup.prompt_tokens + rollup.completion_tokens)} tokens, "
+            f"${rollup.cost:.2f} in the last {ROLLUP_DAYS} days"
+        )
+    return "\n".join(lines)
+
 
 class Sidebar(QWidget):
     modelSelected = Signal(dict)
-    
+    usageRecorded = Signal()  # Emitted by the usage store, possibly from the network thread
+
     def __init__(self):
         super().__init__()
         self.setObjectName("sidebar")
         self.setMinimumWidth(250)
-        
+
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
-        
+
         # Title
         title = QLabel("Models")
         title.setStyleSheet("""
@@ -21,32 +90,170 @@ class Sidebar(QWidget):
             border-bottom: 1px solid #2d2d2d;
         """)
         layout.addWidget(title)
-        
+
+        # Search box, filtering is debounced while typing
+        self.search_input = QLineEdit()
+        self.search_input.setObjectName("modelSearch")
+        self.search_input.setPlaceholderText("Search models...")
+        self.search_input.setClearButtonEnabled(True)
+        layout.addWidget(self.search_input)
+
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(120)
+        self.filter_timer.timeout.connect(self._apply_filter)
+        self.search_input.textChanged.connect(self.filter_timer.start)
+
         # Model list
-        self.model_list = QListWidget()
+        self.source_model = QStandardItemModel(self)
+        self.proxy_model = ModelFilterProxy(self)
+        self.proxy_model.setSourceModel(self.source_model)
+
+        self.model_list = QListView()
+        self.model_list.setModel(self.proxy_model)
+        self.model_list.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.model_list.setUniformItemSizes(True)  # Cheap layout for long lists
         self.model_list.setStyleSheet("""
-            QListWidget::item {
+            QListView::item {
                 padding: 12px 15px;
             }
         """)
-        self.model_list.itemSelectionChanged.connect(self._on_model_selected)
+        # Only the user picks a model: clicks, Enter and arrow keys in the list.
+        # Qt also moves the current row when filtering hides it, which must
+        # not switch the conversation's model.
+        self.model_list.clicked.connect(self._activate)
+        self.model_list.activated.connect(self._activate)
+        self.model_list.selectionModel().currentChanged.connect(self._on_current_changed)
         layout.addWidget(self.model_list, 1)
         
-        self.models = []
-    
+        # Resource usage readout
+        self.diagnostics = DiagnosticsPanel()
+        layout.addWidget(self.diagnostics)
+
+        self.items = {}  # name -> QStandardItem
+        self.selected_name = None
+        self._silent = False  # Set while the selection follows the active tab or rows change
+        self.rollups = {}  # name -> Rollup of the last ROLLUP_DAYS days
+
+        # Rollups are recomputed once a burst of finished requests settles
+        self.usage_timer = QTimer(self)
+        self.usage_timer.setSingleShot(True)
+        self.usage_timer.setInterval(500)
+        self.usage_timer.timeout.connect(self.refresh_usage)
+        self.usageRecorded.connect(self.usage_timer.start)
+
+    @property
+    def models(self):
+        return [self.items[name].data(CONFIG_ROLE) for name in self.items]
+
     def load_models(self, models):
-        self.models = models or []
-        self.model_list.clear()
-        for model in self.models:
-            self.model_list.addItem(model["name"])
-    
+        self.source_model.clear()
+        self.items = {}
+        self.add_models(models or [])
+
+    def add_models(self, models):
+        self._silent = True
+        try:
+            self._add_models(models)
+        finally:
+            self._silent = False
+
+    def _add_models(self, models):
+        for model in models:
+            item = QStandardItem(model["name"])
+            self._set_item_config(item, model)
+            self.items[model["name"]] = item
+            self.source_model.appendRow(item)
+        self.proxy_model.invalidate_rows()
+
+    def remove_models(self, names):
+        self._silent = True
+        try:
+            for name in names:
+                item = self.items.pop(name, None)
+                if item is not None:
+                    self.source_model.removeRow(item.row())
+            self.proxy_model.invalidate_rows()
+        finally:
+            self._silent = False
+
+    def update_models(self, models):
+        """Patch changed rows in place, keeping selection and scroll position"""
+        for model in models:
+            item = self.items.get(model["name"])
+            if item is None:
+                continue
+            self._set_item_config(item, model)
+        self._silent = True
+        try:
+            self.proxy_model.invalidate_rows()
+        finally:
+            self._silent = False
+
+    def _set_item_config(self, item, model):
+        item.setData(model, CONFIG_ROLE)
+        # Precomputed so filtering does not lowercase strings on every keystroke
+        item.setData(f"{model['name']} {model.get('model_name', '')}".lower(), SEARCH_ROLE)
+        item.setToolTip(model_tooltip(model, self.rollups.get(model["name"])))
+
+    def refresh_usage(self):
+        """Reload the per-model rollups into the tooltips and diagnostics"""
+        self.rollups = usage_store.rollups(ROLLUP_DAYS)
+        for name, item in self.items.items():
+            item.setToolTip(model_tooltip(item.data(CONFIG_ROLE), self.rollups.get(name)))
+        self.show_selected_usage()
+
+    def show_selected_usage(self):
+        if self.selected_name is not None:
+            self.diagnostics.show_model_usage(self.selected_name, self.rollups.get(self.selected_name), ROLLUP_DAYS)
+
+    def current_model(self):
+        item = self.items.get(self.selected_name)
+        return item.data(CONFIG_ROLE) if item is not None else None
+
+    def show_model(self, name):
+        """Highlight a model without emitting modelSelected, None for no model"""
+        item = self.items.get(name)
+        if item is None:
+            self.selected_name = None
+            self.model_list.clearSelection()
+            return
+        index = self.proxy_model.mapFromSource(item.index())
+        self._silent = True
+        try:
+            if index.isValid():
+                self.model_list.setCurrentIndex(index)
+            else:
+                self.model_list.clearSelection()
+            self.selected_name = name
+        finally:
+            self._silent = False
+        self.show_selected_usage()
+
     def select_first_model(self):
         """Select and emit the first model if available"""
-        if self.model_list.count() > 0:
-            self.model_list.setCurrentRow(0)
-            self._on_model_selected()
-    
-    def _on_model_selected(self):
-        selected_index = self.model_list.currentRow()
-        if 0 <= selected_index < len(self.models):
-            self.modelSelected.emit(self.models[selected_index])
\ No newline at end of file
+        if self.proxy_model.rowCount() > 0:
+            index = self.proxy_model.index(0, 0)
+            self.model_list.setCurrentIndex(index)
+            self._activate(index)
+
+    def _apply_filter(self):
+        self._silent = True
+        try:
+            self.proxy_model.set_query(self.search_input.text())
+        finally:
+            self._silent = False
+
+    def _on_current_changed(self, current, previous=None):
+        # Arrow keys move the current row while the list has focus
+        if not self._silent and self.model_list.hasFocus():
+            self._activate(current)
+
+    def _activate(self, index):
+        if not index.isValid():
+            return
+        model = index.data(CONFIG_ROLE)
+        if model and model["name"] != self.selected_name:
+            self.selected_name = model["name"]
+            self.show_selected_usage()
+            self.modelSelected.emit(model)
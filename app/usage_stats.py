@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"NGUSAGE1"
+# time, model index, prompt/completion/cached tokens, seconds to first token, generation seconds, cost
+RECORD = struct.Struct("<dHIIIfff")
+UNKNOWN = -1.0  # Seconds to first token of requests that did not stream
+ROLLUP_DAYS = 30  # Window of the rollups shown in the sidebar
+
+
+def request_cost(config, prompt_tokens, completion_tokens, cached_tokens):
+    """Cost from the model's "price" entry, in currency units per million tokens"""
+    price = config.get("price")
+    if not price:
+        return 0.0
+    prompt_price = price.get("prompt", 0)
+    cached_price = price.get("cached", prompt_price)
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (
+        uncached * prompt_price
+        + cached_tokens * cached_price
+        + completion_tokens * price.get("completion", 0)
+    ) / 1e6
+
+
+class Rollup:
+    """Usage totals of one model over a time window"""
+    __slots__ = (
+        "requests", "prompt_tokens", "completion_tokens", "cached_tokens",
+        "timed_tokens", "generation_seconds", "first_tokens", "first_token_seconds", "cost",
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.timed_tokens = 0  # Completion tokens of requests with a generation time
+        self.generation_seconds = 0.0
+        self.first_tokens = 0  # Requests with a measured first token
+        self.first_token_seconds = 0.0
+        self.cost = 0.0
+
+    def add(self, prompt, completion, cached, first_token, generation, cost):
+        self.requests += 1
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        self.cached_tokens += cached
+        if completion and generation > 0:
+            self.timed_tokens += completion
+            self.generation_seconds += generation
+        if first_token >= 0:
+            self.first_tokens += 1
+            self.first_token_seconds += first_token
+        self.cost += cost
+
+    @property
+    def tokens_per_second(self):
+        if not self.generation_seconds:
+            return None
+        return self.timed_tokens / self.generation_seconds
+
+    @property
+    def average_first_token(self):
+        return self.first_token_seconds / self.first_tokens if self.first_tokens else None
+
+
+class UsageStore:
+    """Token usage of every completed request, for per-model rollups.
+
+    Records are fixed-size structs appended to one binary file, about 34
+    bytes a request, so months of use stay small. They are kept in memory
+    in time order: a rollup finds its window start by binary search and
+    unpacks only the records after it. Model names are stored once in a
+    JSON list next to the file and referenced by index.
+
+    Requests may finish on the network thread, so writes take a lock.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.names = []  # Model index -> name
+        self.indexes = {}  # name -> model index
+        self.data = bytearray()  # Records, without the file header
+        self.listeners = []  # Called after each record, from the recording thread
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def names_path(self):
+        return self.path + ".models.json"
+
+    def configure(self, path):
+        """Load the records of earlier runs and open the file for appending"""
+        self.path = path
+        if os.path.exists(self.names_path):
+            try:
+                with open(self.names_path, "r", encoding="utf-8") as f:
+                    self.names = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not read {self.names_path}: {e}")
+        self.indexes = {name: index for index, name in enumerate(self.names)}
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        if data and not data.startswith(MAGIC):
+            logging.warning(f"{path} is not a usage file, starting a new one")
+            data = b""
+        records = data[len(MAGIC):]
+        # A torn final write leaves a partial record, cut it so appends stay aligned
+        records = records[:len(records) - len(records) % RECORD.size]
+        self.data = bytearray(records)
+
+        if data:
+            self._file = open(path, "r+b")
+            self._file.truncate(len(MAGIC) + len(self.data))
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(path, "wb")
+            self._file.write(MAGIC)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def record(self, config, usage, first_token, generation=None):
+        """Add a completed request of the model `config`.
+
+        `usage` is the adapter's parsed usage, `first_token` and
+        `generation` are measured seconds. Requests without a generation
+        time count for tokens and cost but not for speed, those without a
+        first token time (None, not streamed) not for its average.
+        """
+        if self._file is None:
+            return  # Not configured, e.g. in the headless gateway
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        cached = usage.get("cached_tokens") or 0
+        cost = request_cost(config, prompt, completion, cached)
+        with self._lock:
+            record = RECORD.pack(
+                time.time(), self._model_index(config["name"]),
+                prompt, completion, cached, UNKNOWN if first_token is None else first_token, generation or 0.0, cost,
+            )
+            self.data += record
+            try:
+                self._file.write(record)
+                self._file.flush()
+            except OSError as e:
+                logging.warning(f"Could not write usage to {self.path}: {e}")
+        for listener in self.listeners:
+            listener()
+
+    def _model_index(self, name):
+        index = self.indexes.get(name)
+        if index is None:
+            index = self.indexes[name] = len(self.names)
+            self.names.append(name)
+            temp_path = self.names_path + ".tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.names, f)
+                os.replace(temp_path, self.names_path)
+            except OSError as e:
+                # The name is kept in memory and written with the next new model
+                logging.warning(f"Could not write model names to {self.names_path}: {e}")
+        return index
+
+    @staticmethod
+    def _first_since(data, since):
+        """Index of the first record in `data` at or after `since`"""
+        low, high = 0, len(data) // RECORD.size
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from("<d", data, middle * RECORD.size)[0] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def rollups(self, days=ROLLUP_DAYS):
+        """{model name: Rollup} of the last `days` days, all records with None"""
+        with self._lock:
+            data = bytes(self.data)
+        start = self._first_since(data, time.time() - days * 86400) if days else 0
+        totals = {}
+        for _, index, prompt, completion, cached, first_token, generation, cost in RECORD.iter_unpack(
+            memoryview(data)[start * RECORD.size:]
+        ):
+            rollup = totals.get(index)
+            if rollup is None:
+                rollup = totals[index] = Rollup()
+            rollup.add(prompt, completion, cached, first_token, generation, cost)
+        names = self.names
+        # Records of a lost names file keep a placeholder name
+        return {(names[index] if index < len(names) else f"#{index}"): rollup for index, rollup in totals.items()}
+
+
+usage_store = UsageStore()
@@ -1,15 +1,43 @@
+import os
 import sys
 import asyncio
-import qasync
-from PySide6.QtWidgets import QApplication
-from PySide6.QtCore import QFile, QTextStream, QTimer
-from app.main_window import MainWindow
-from app.config_loader import load_models_config
+import argparse
+from app.config_loader import load_settings, data_dir
 import logging
 logging.basicConfig(level=logging.DEBUG)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Not GPT")
+    parser.add_argument("--gateway", action="store_true",
+                        help="serve models.json as a local OpenAI-compatible API, without the GUI")
+    parser.add_argument("--host", help="gateway listen address")
+    parser.add_argument("--port", type=int, help="gateway listen port")
+    # Anything else is left for Qt
+    return parser.parse_known_args()
+
 def main():
-    app = QApplication(sys.argv)
+    args, qt_args = parse_args()
+    settings = load_settings()
+    if args.gateway:
+        from app.gateway import run_gateway
+        run_gateway(args.host or settings["gateway_host"], args.port or settings["gateway_port"])
+        return
+    run_gui(settings, sys.argv[:1] + qt_args)
+
+def run_gui(settings, argv):
+    # Qt is only imported for the GUI, the gateway runs headless
+    import qasync
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QFile, QTextStream, QTimer
+    from app.main_window import MainWindow
+    from app.model_registry import ModelRegistry
+    from app.memory_governor import get_governor
+    from app.journal import JournalStore
+    from app.outbox import outbox
+    from app.usage_stats import usage_store
+    from app.network_thread import start_network_thread, stop_network_thread
+
+    app = QApplication(argv)
     
     # Load stylesheet
     style_file = QFile("style.qss")
@@ -23,27 +51,56 @@ def main():
         }
     """)
 
-    # Load models
-    models = load_models_config()
+    # Load models, the registry keeps watching models.json afterwards
+    registry = ModelRegistry()
+    models = registry.load()
     
     logging.info("Application starting")
+    
+    # Set up asyncio event loop, journals schedule their writes on it
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    
+    if settings["network_thread"]:
+        start_network_thread()
+    
+    governor = get_governor()
+    journals = JournalStore(
+        data_dir(settings, "journals"), data_dir(settings, "attachments"), in_use=governor.files_in_use
+    )
+    # Spilled attachments share the blob folder, freed ones are collected with the blobs
+    governor.configure(
+        settings["memory_budget_mb"] * 1024 * 1024, data_dir(settings, "attachments"),
+        collect=journals.schedule_collect,
+    )
+    outbox.configure(os.path.join(data_dir(settings), "outbox.json"))
+    usage_store.configure(os.path.join(data_dir(settings), "usage.bin"))
 
     # Create main window
-    window = MainWindow()
-    window.show()
+    window = MainWindow(settings, journals)
     
-    # Load models and select first one
+    # Load models, then reopen the conversations of the last run
     window.sidebar.load_models(models)
-    if models:
+    window.attach_registry(registry)
+    window.restore_conversations()
+    governor.usageChanged.connect(window.sidebar.diagnostics.show_memory_usage)
+    # Token usage of finished requests feeds the sidebar's per-model rollups
+    usage_store.listeners.append(window.sidebar.usageRecorded.emit)
+    window.sidebar.refresh_usage()
+    window.show()
+    if models and not window.chat_area.current_model:
         # Use timer to ensure UI is ready
         QTimer.singleShot(100, window.sidebar.select_first_model)
     
-    # Set up asyncio event loop
-    loop = qasync.QEventLoop(app)
-    asyncio.set_event_loop(loop)
+    # Query /v1/models on every endpoint once the loop is running
+    QTimer.singleShot(0, registry.discover)
     
     with loop:
-        sys.exit(loop.run_forever())
+        code = loop.run_forever()
+    stop_network_thread()
+    journals.close()
+    usage_store.close()
+    sys.exit(code)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
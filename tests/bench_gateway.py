@@ -0,0 +1,54 @@
+"""Gateway throughput against the mock upstream.
+
+    python tests/bench_gateway.py [streams] [events]
+
+Opens `streams` concurrent streaming requests of `events` SSE events each
+and reports events per second through the gateway.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+from app import http_pool  # noqa: E402
+from app.gateway import Gateway  # noqa: E402
+from mock_upstream import start_upstream, write_models  # noqa: E402
+
+
+async def stream_once(client, url, events):
+    payload = {"model": "Mock", "stream": True, "max_tokens": events, "messages": [{"role": "user", "content": "hi"}]}
+    count = 0
+    async with client.stream("POST", url, json=payload, timeout=120) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: ") and line != "data: [DONE]":
+                count += 1
+    return count
+
+
+async def main(streams, events):
+    upstream, endpoint = await start_upstream()
+    with tempfile.TemporaryDirectory() as folder:
+        models = os.path.join(folder, "models.json")
+        write_models(models, endpoint)
+        server = await asyncio.start_server(Gateway(models).handle_connection, "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1/chat/completions"
+        limits = httpx.Limits(max_connections=streams)
+        async with httpx.AsyncClient(limits=limits) as client:
+            started = time.monotonic()
+            counts = await asyncio.gather(*(stream_once(client, url, events) for _ in range(streams)))
+            elapsed = time.monotonic() - started
+        server.close()
+        upstream.close()
+        await http_pool.close_clients()
+    total = sum(counts)
+    print(f"{streams} streams x {events} events: {total} events in {elapsed:.2f} s, {total / elapsed:.0f} events/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200, int(sys.argv[2]) if len(sys.argv) > 2 else 200))
@@ -0,0 +1,65 @@
+"""OpenAI-compatible upstream for gateway tests and benchmarks.
+
+Answers every chat completion with a stream of `max_tokens` SSE events,
+or one JSON completion when the request does not stream.
+"""
+import asyncio
+import json
+
+
+async def handle(reader, writer):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            headers = {}
+            for line in head.decode("latin-1").split("\r\n")[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            if "content-length" in headers:
+                body = await reader.readexactly(int(headers["content-length"]))
+            else:
+                parts = []
+                while True:
+                    size = int((await reader.readline()).strip(), 16)
+                    data = await reader.readexactly(size + 2)
+                    if size == 0:
+                        break
+                    parts.append(data[:-2])
+                body = b"".join(parts)
+            payload = json.loads(body)
+            count = payload.get("max_tokens") or 1
+            if payload.get("stream"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+                for i in range(count):
+                    event = {"choices": [{"index": 0, "delta": {"content": f"t{i} "}}], "model": payload["model"]}
+                    data = f"data: {json.dumps(event)}\n\n".encode()
+                    writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    await writer.drain()
+                done = b"data: [DONE]\n\n"
+                writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(done), done))
+            else:
+                data = json.dumps({
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "hello"}}],
+                    "model": payload["model"],
+                }).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(data), data)
+                )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_upstream():
+    """Running server and its chat completions endpoint URL"""
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+def write_models(path, endpoint):
+    with open(path, "w") as f:
+        json.dump([{"name": "Mock", "endpoint": endpoint, "api_type": "openai", "model_name": "mock-1"}], f)
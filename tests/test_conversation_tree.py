@@ -0,0 +1,57 @@
+from app.conversation_tree import ConversationTree
+
+
+def build():
+    """Question with two answers, the second one followed up"""
+    tree = ConversationTree()
+    question = tree.add("user", "Q")
+    first = tree.add("assistant", "A1")
+    tree.select(question)
+    second = tree.add("assistant", "A2")
+    follow_up = tree.add("user", "More")
+    return tree, question, first, second, follow_up
+
+
+def test_history_is_the_branch_on_screen():
+    tree, question, first, second, follow_up = build()
+    assert [m["content"] for m in tree.messages()] == ["Q", "A2", "More"]
+    assert [m["content"] for m in tree.messages(first)] == ["Q", "A1"]
+    assert tree.siblings(first) == [first, second]
+
+
+def test_switching_restores_the_last_active_branch():
+    tree, question, first, second, follow_up = build()
+    tree.switch(first)
+    assert tree.current is first
+    assert not tree.on_branch(follow_up)
+    tree.switch(second)
+    assert tree.current is follow_up
+
+
+def test_replies_on_other_branches_stay_in_the_background():
+    tree, question, first, second, follow_up = build()
+    late = tree.add("assistant", "Late", parent=first, node_id=tree.new_id())
+    assert tree.current is follow_up
+    assert late.parent is first and first.active is None
+
+
+def test_a_reply_to_the_tip_is_selected():
+    tree, question, first, second, follow_up = build()
+    reply = tree.add("assistant", "Answer", parent=follow_up, node_id=tree.new_id())
+    assert tree.current is reply and follow_up.active is reply
+
+
+def test_history_messages_know_their_node():
+    tree, question, first, second, follow_up = build()
+    message = tree.messages()[-1]
+    assert message.node is follow_up
+    assert message == {"role": "user", "content": "More"}
+    # Shared prefixes are the same objects, so cached fragments are reused
+    assert tree.messages(first)[0] is tree.messages()[0]
+
+
+def test_ids_continue_after_explicit_ones():
+    tree = ConversationTree()
+    tree.add("user", "Q", node_id=7)
+    assert tree.add("assistant", "A").id == 8
+    assert [node.id for node in tree.all_nodes()] == [7, 8]
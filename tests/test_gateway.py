@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import http_pool
+from app.api_client import EndpointError
+from app.gateway import Gateway
+
+from mock_upstream import start_upstream, write_models
+
+
+def run_with_gateway(tmp_path, scenario):
+    """Run `scenario(gateway url)` against a gateway in front of the mock upstream"""
+    async def main():
+        upstream, endpoint = await start_upstream()
+        models = tmp_path / "models.json"
+        write_models(models, endpoint)
+        gateway = Gateway(str(models))
+        server = await asyncio.start_server(gateway.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await scenario("127.0.0.1", port)
+        finally:
+            server.close()
+            upstream.close()
+            await http_pool.close_clients()
+    return asyncio.run(main())
+
+
+async def raw_request(host, port, data):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def test_streams_pass_through(tmp_path):
+    async def scenario(host, port):
+        async with httpx.AsyncClient() as client:
+            payload = {"model": "Mock", "stream": True, "max_tokens": 5, "messages": [{"role": "user", "content": "hi"}]}
+            async with client.stream("POST", f"http://{host}:{port}/v1/chat/completions", json=payload) as response:
+                body = (await response.aread()).decode()
+        return response.status_code, body
+
+    status, body = run_with_gateway(tmp_path, scenario)
+    assert status == 200
+    events = [line[6:] for line in body.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    assert "".join(json.loads(e)["choices"][0]["delta"]["content"] for e in events[:-1]) == "t0 t1 t2 t3 t4 "
+    assert json.loads(events[0])["model"] == "mock-1"
+
+
+def test_lists_models(tmp_path):
+    async def scenario(host, port):
+        async with httpx.AsyncClient() as client:
+            return (await client.get(f"http://{host}:{port}/v1/models")).json()
+
+    assert [m["id"] for m in run_with_gateway(tmp_path, scenario)["data"]] == ["Mock"]
+
+
+@pytest.mark.parametrize("request_bytes, status", [
+    (b"POST /v1/chat/completions HTTP/1.1\r\nContent-Length: abc\r\n\r\n", 400),
+    (b"POST /v1/chat/completions HTTP/1.1\r\nContent-Length: -5\r\n\r\n", 400),
+    (b"POST /v1/chat/completions HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n", 400),
+    (b"POST /v1/chat/completions HTTP/1.1\r\nContent-Length: 99999999999\r\n\r\n", 413),
+    (b"POST /v1/chat/completions HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n\r\n[]", 400),
+    (b"POST /v1/chat/completions HTTP/1.1\r\nX-Big: " + b"a" * 70000 + b"\r\n\r\n", 413),
+])
+def test_malformed_requests_get_an_error_status(tmp_path, request_bytes, status):
+    async def scenario(host, port):
+        return await raw_request(host, port, request_bytes)
+
+    response = run_with_gateway(tmp_path, scenario)
+    assert response.startswith(f"HTTP/1.1 {status} ".encode())
+
+
+class FailingClient:
+    """Non-OpenAI upstream that answers every request with an error"""
+    api_format = "ollama"
+    config = {"name": "Failing"}
+
+    async def send_request(self, messages, max_tokens):
+        raise EndpointError("http://upstream", "API Error 503: overloaded", 503)
+
+    async def stream_response(self, messages, max_tokens):
+        raise EndpointError("http://upstream", "API Error 503: overloaded", 503)
+        yield
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_translated_upstream_errors_are_bad_gateway(tmp_path, monkeypatch, stream):
+    monkeypatch.setattr(Gateway, "client_for", lambda self, name: FailingClient())
+
+    async def scenario(host, port):
+        async with httpx.AsyncClient() as client:
+            payload = {"model": "Mock", "stream": stream, "messages": [{"role": "user", "content": "hi"}]}
+            return await client.post(f"http://{host}:{port}/v1/chat/completions", json=payload)
+
+    response = run_with_gateway(tmp_path, scenario)
+    assert response.status_code == 502
+    assert "overloaded" in response.json()["error"]["message"]
+
+
+def test_unexpected_errors_are_answered_with_500(tmp_path, monkeypatch):
+    def broken(self):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(Gateway, "list_models", broken)
+
+    async def scenario(host, port):
+        async with httpx.AsyncClient() as client:
+            return await client.get(f"http://{host}:{port}/v1/models")
+
+    assert run_with_gateway(tmp_path, scenario).status_code == 500
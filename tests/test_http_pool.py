@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+import httpcore
+import pytest
+
+from app import http_pool
+from app.attachments import files_url
+from app.http_pool import api_url
+
+
+@pytest.mark.parametrize("endpoint, expected", [
+    ("http://localhost:8000/v1/chat/completions", "http://localhost:8000/v1/models"),
+    ("https://example.com/openai/v1/chat/completions/", "https://example.com/openai/v1/models"),
+    ("http://localhost:11434/api/chat", "http://localhost:11434/api/chat/v1/models"),
+    ("https://example.com/v10/chat", "https://example.com/v10/chat/v1/models"),
+    ("https://example.com/api/v1beta/chat", "https://example.com/api/v1beta/chat/v1/models"),
+    ("http://localhost:8000", "http://localhost:8000/v1/models"),
+])
+def test_api_url_matches_the_v1_segment(endpoint, expected):
+    assert api_url(endpoint, "models") == expected
+
+
+def test_files_url_sits_next_to_the_chat_endpoint():
+    assert files_url("https://api.openai.com/v1/chat/completions?x=1") == "https://api.openai.com/v1/files"
+
+
+class RefusingBackend(httpcore.AsyncNetworkBackend):
+    """Refuses every address but `accept`, records the attempts"""
+
+    def __init__(self, accept):
+        self.accept = accept
+        self.tried = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.tried.append(host)
+        if host != self.accept:
+            raise httpcore.ConnectError(f"{host} refused")
+        return host
+
+
+def test_connect_falls_back_to_the_next_cached_address(monkeypatch):
+    monkeypatch.setitem(http_pool._dns_cache, ("localhost", 8000), (time.monotonic(), ["::1", "127.0.0.1"]))
+    backend = RefusingBackend("127.0.0.1")
+    stream = asyncio.run(http_pool.CachingNetworkBackend(backend).connect_tcp("localhost", 8000))
+    assert stream == "127.0.0.1"
+    assert backend.tried == ["::1", "127.0.0.1"]
+
+
+def test_failed_connect_drops_the_cached_addresses(monkeypatch):
+    monkeypatch.setitem(http_pool._dns_cache, ("example.test", 80), (time.monotonic(), ["192.0.2.1"]))
+    with pytest.raises(httpcore.ConnectError):
+        asyncio.run(http_pool.CachingNetworkBackend(RefusingBackend(None)).connect_tcp("example.test", 80))
+    assert ("example.test", 80) not in http_pool._dns_cache
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from app import journal as journal_module
+from app.attachments import Attachment
+from app.conversation_tree import ConversationTree
+from app.journal import JournalStore
+
+
+def make_store(tmp_path, in_use=None):
+    folder = tmp_path / "journals"
+    blobs = tmp_path / "blobs"
+    folder.mkdir()
+    blobs.mkdir()
+    return JournalStore(str(folder), str(blobs), in_use=in_use)
+
+
+def age(folder):
+    """Backdate files so collections do not keep them as just written"""
+    old = time.time() - 60
+    for name in os.listdir(folder):
+        os.utime(os.path.join(folder, name), (old, old))
+
+
+def test_replay_rebuilds_branches_and_interrupted_replies(tmp_path):
+    store = make_store(tmp_path)
+
+    async def scenario():
+        journal = store.create()
+        tree = ConversationTree()
+        journal.record_model({"name": "Mock"})
+        question = tree.add("user", "Hi")
+        journal.record_message(question)
+        answer = tree.add("assistant", "Hello", node_id=tree.new_id())
+        journal.start_reply(answer.id, question)
+        journal.record_chunk(answer.id, "Hel")
+        journal.record_chunk(answer.id, "lo")
+        journal.end_reply(answer.id)
+        journal.start_reply(tree.new_id(), question)
+        journal.record_chunk(tree.next_id - 1, "Cut")
+        await journal.flush()
+        journal.close()
+        return journal
+
+    journal = asyncio.run(scenario())
+    model_name, tree = store.open(journal.conversation_id).replay()
+    assert model_name == "Mock"
+    question = tree.get(1)
+    assert question.content == "Hi"
+    assert [child.content for child in question.children] == ["Hello", "Cut"]
+
+
+def test_chunks_of_a_reply_are_merged_before_writing(tmp_path):
+    store = make_store(tmp_path)
+
+    async def scenario():
+        journal = store.create()
+        tree = ConversationTree()
+        journal.start_reply(1, tree.root)
+        for text in ("a", "b", "c"):
+            journal.record_chunk(1, text)
+        await journal.flush()
+        journal.close()
+        return journal
+
+    journal = asyncio.run(scenario())
+    with open(journal.path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["op"] for r in records] == ["start", "chunk"]
+    assert records[1]["text"] == "abc"
+
+
+def test_compaction_rewrites_the_snapshot_with_blobs(tmp_path):
+    store = make_store(tmp_path)
+    image = Attachment(b"png", "image/png", "image")
+    tree = ConversationTree()
+    question = tree.add("user", {"text": "Look", "image": image})
+    tree.add("assistant", "Nice")
+    tree.select(question)
+    tree.add("assistant", "Other")
+
+    async def scenario():
+        journal = store.create()
+        journal.record_clear()
+        await journal.compact(lambda: ("Mock", tree))
+        journal.close()
+        return journal
+
+    journal = asyncio.run(scenario())
+    with open(journal.path, encoding="utf-8") as f:
+        assert [json.loads(line)["op"] for line in f] == ["model", "message", "message", "message", "select"]
+    model_name, replayed = store.open(journal.conversation_id).replay()
+    assert model_name == "Mock"
+    assert [m["content"] for m in replayed.messages()][1:] == ["Other"]
+    content = replayed.get(question.id).content
+    assert content["text"] == "Look"
+    assert content["image"].read_bytes() == b"png"
+
+
+def test_close_waits_for_the_write_in_flight(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    journal = store.create()
+    fsync = os.fsync
+    monkeypatch.setattr(journal_module.os, "fsync", lambda fd: (time.sleep(0.2), fsync(fd)))
+
+    errors = []
+
+    def write():
+        try:
+            journal._write([{"op": "model", "name": "First"}])
+        except OSError as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(0.05)
+    journal.buffer = [{"op": "model", "name": "Second"}]
+    journal.close()
+    writer.join()
+
+    assert errors == []
+
+    with open(journal.path, encoding="utf-8") as f:
+        assert [line for line in f] == ['{"op": "model", "name": "First"}\n', '{"op": "model", "name": "Second"}\n']
+    assert journal._file is None
+
+
+def test_compaction_collects_unreferenced_blobs(tmp_path):
+    store = make_store(tmp_path)
+    kept = Attachment(b"kept", "image/png", "image")
+    dropped = Attachment(b"dropped", "image/png", "image")
+
+    async def scenario():
+        other = store.create()
+        other_tree = ConversationTree()
+        other.record_message(other_tree.add("user", {"text": "a", "image": kept}))
+        await other.flush()
+
+        journal = store.create()
+        tree = ConversationTree()
+        journal.record_message(tree.add("user", {"text": "b", "image": dropped}))
+        await journal.flush()
+        assert sorted(os.listdir(store.blob_dir)) == sorted([kept.digest(), dropped.digest()])
+
+        # Cleared, the snapshot no longer has the image
+        journal.record_clear()
+        await journal.compact(lambda: ("Mock", ConversationTree()))
+        age(store.blob_dir)
+        await store.collect_blobs()
+        store._collect_handle.cancel()
+        other.close()
+        journal.close()
+
+    asyncio.run(scenario())
+    assert os.listdir(store.blob_dir) == [kept.digest()]
+
+
+def test_collection_keeps_blobs_in_use_and_recent_ones(tmp_path):
+    spilled = Attachment(b"spilled", "image/png", "image")
+    store = make_store(tmp_path, in_use=lambda: {spilled.digest()})
+    spilled.spill(store.blob_dir)
+    age(store.blob_dir)
+    Attachment(b"new", "image/png", "image").save_to(store.blob_dir)
+
+    asyncio.run(store.collect_blobs())
+    assert len(os.listdir(store.blob_dir)) == 2
+
+
+def test_shutdown_collection_removes_spilled_files(tmp_path):
+    store = make_store(tmp_path)
+    referenced = Attachment(b"referenced", "image/png", "image")
+
+    async def scenario():
+        journal = store.create()
+        journal.record_message(ConversationTree().add("user", {"image": referenced}))
+        await journal.flush()
+        journal.close()
+
+    asyncio.run(scenario())
+    Attachment(b"spilled", "image/png", "image").spill(store.blob_dir)
+    store.close()
+    assert os.listdir(store.blob_dir) == [referenced.digest()]
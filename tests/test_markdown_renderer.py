@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("PySide6")
+
+from app.markdown_renderer import MarkdownBlockParser  # noqa: E402
+
+ANSWER = "Intro\n\n```python\ndef f():\n    return 1\n\nprint(f())\n```\nAfter\n"
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(ANSWER)])
+def test_blocks_close_the_same_however_the_answer_is_split(size):
+    parser = MarkdownBlockParser()
+    closed = []
+    for start in range(0, len(ANSWER), size):
+        closed += parser.feed(ANSWER[start:start + size])
+    closed += parser.finish()
+    assert closed == ["Intro", "```python\ndef f():\n    return 1\n\nprint(f())\n```", "After"]
+    assert parser.code_source is None
+
+
+def test_open_block_keeps_the_partial_line():
+    parser = MarkdownBlockParser()
+    assert parser.feed("# Title\nSome te") == ["# Title"]
+    assert parser.open_source == "Some te"
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(ANSWER)])
+def test_open_code_block_grows_by_each_chunk(size):
+    parser = MarkdownBlockParser()
+    code = None
+    for start in range(0, len(ANSWER), size):
+        chunk = ANSWER[start:start + size]
+        was_open = parser.fence is not None
+        closed = parser.feed(chunk)
+        if was_open and parser.fence and not closed:
+            # What MarkdownView appends to the open code document
+            code += chunk
+        else:
+            code = parser.code_source
+        assert code == parser.code_source
+
+
+def test_open_shape_changes_only_when_the_block_does():
+    parser = MarkdownBlockParser()
+    parser.feed("Some **bo")
+    assert parser.open_shape == ("paragraph", 0)
+    parser.feed("ld** text\nwrapped")
+    assert parser.open_shape == ("paragraph", 0)
+
+    parser.feed("\n\n- first\n  more")
+    assert parser.open_shape == ("list", 1)
+    parser.feed("\n- sec")
+    assert parser.open_shape == ("list", 2)
+
+    parser.feed("\n\n| a | b |\n")
+    assert parser.open_shape is None
+    parser.feed("\n```py")
+    assert parser.open_shape is None
@@ -0,0 +1,157 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import http_pool
+from app.api_client import EndpointError, EndpointTimeout, EndpointUnreachable, OpenAIClient
+from app.outbox import AlreadyQueued, Outbox
+
+ENDPOINT = "http://127.0.0.1:9/v1/chat/completions"
+
+
+def entry(reply, parent=1, conversation="c1"):
+    return {"conversation": conversation, "parent": parent, "reply": reply, "endpoint": ENDPOINT, "model": "Mock"}
+
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "outbox.json")
+    outbox = Outbox()
+    outbox.configure(path)
+    outbox.add(entry(2))
+    outbox.add(entry(5, parent=4, conversation="c2"))
+
+    restarted = Outbox()
+    restarted.configure(path)
+    assert [e["reply"] for e in restarted.entries_for("c1")] == [2]
+    restarted.prune({"c2"})
+
+    pruned = Outbox()
+    pruned.configure(path)
+    assert list(pruned.entries) == [f"{ENDPOINT}|c2|4"]
+
+
+def test_unreachable_requests_wait_and_are_retried(tmp_path, monkeypatch):
+    outbox = Outbox(str(tmp_path / "outbox.json"))
+    # No probe, the test brings the endpoint back
+    monkeypatch.setattr(outbox, "mark_down", lambda endpoint: outbox.online.setdefault(endpoint, asyncio.Event()))
+    attempts = []
+    queued = []
+
+    async def attempt():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise EndpointUnreachable(ENDPOINT, "refused")
+        return "Hello"
+
+    async def scenario():
+        task = asyncio.ensure_future(outbox.send(entry(2), attempt, queued.append))
+        await asyncio.sleep(0)
+        assert list(outbox.entries) == [f"{ENDPOINT}|c1|1"]
+        outbox.online[ENDPOINT].set()
+        return await task
+
+    assert asyncio.run(scenario()) == "Hello"
+    assert len(queued) == 1 and len(attempts) == 2
+    assert outbox.entries == {}
+
+
+def test_a_second_reply_to_the_same_message_is_not_queued(tmp_path, monkeypatch):
+    outbox = Outbox(str(tmp_path / "outbox.json"))
+    # No probe, the endpoint stays down
+    monkeypatch.setattr(outbox, "mark_down", lambda endpoint: outbox.online.setdefault(endpoint, asyncio.Event()))
+    queued = []
+
+    async def unreachable():
+        raise EndpointUnreachable(ENDPOINT, "refused")
+
+    async def scenario():
+        first = asyncio.ensure_future(outbox.send(entry(2), unreachable, queued.append))
+        await asyncio.sleep(0)
+        with pytest.raises(AlreadyQueued):
+            await outbox.send(entry(3), unreachable, queued.append)
+        # A reply to another message queues next to it
+        second = asyncio.ensure_future(outbox.send(entry(5, parent=4), unreachable, queued.append))
+        await asyncio.sleep(0)
+        assert sorted(e["reply"] for e in outbox.entries.values()) == [2, 5]
+        for task in (first, second):
+            task.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert len(queued) == 2
+    # Cancelled at shutdown, both stay queued for the next run
+    assert sorted(e["reply"] for e in outbox.entries.values()) == [2, 5]
+
+
+def test_a_finished_request_leaves_a_newer_entry_alone(tmp_path, monkeypatch):
+    outbox = Outbox(str(tmp_path / "outbox.json"))
+    monkeypatch.setattr(outbox, "mark_down", lambda endpoint: outbox.online.setdefault(endpoint, asyncio.Event()).set())
+    outbox.add(entry(2))
+
+    async def replaced():
+        # The view dropped the entry meanwhile and another reply took the key
+        outbox.remove(f"{ENDPOINT}|c1|1")
+        outbox.add(entry(3))
+        return "Hello"
+
+    assert asyncio.run(outbox.send(entry(2), replaced, None, queued=True)) == "Hello"
+    assert [e["reply"] for e in outbox.entries.values()] == [3]
+
+
+def test_resumed_entries_keep_their_place(tmp_path, monkeypatch):
+    outbox = Outbox(str(tmp_path / "outbox.json"))
+    monkeypatch.setattr(outbox, "mark_down", lambda endpoint: outbox.online.setdefault(endpoint, asyncio.Event()).set())
+    outbox.add(entry(2))
+
+    async def answer():
+        return "Hello"
+
+    # The view rebuilds the entry from the one left in the outbox file
+    assert asyncio.run(outbox.send(entry(2), answer, None, queued=True)) == "Hello"
+    assert outbox.entries == {}
+
+
+def test_read_timeouts_raise_instead_of_becoming_the_reply(monkeypatch):
+    def timeout(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    async def scenario():
+        client = OpenAIClient({"name": "Mock", "endpoint": ENDPOINT, "model_name": "m", "api_type": "openai"})
+        async with httpx.AsyncClient(transport=httpx.MockTransport(timeout)) as mock:
+            monkeypatch.setattr(http_pool, "get_client", lambda verify_ssl: mock)
+            with pytest.raises(EndpointTimeout):
+                await client.send_request([{"role": "user", "content": "Hi"}])
+            with pytest.raises(EndpointTimeout):
+                async for _ in client.stream_response([{"role": "user", "content": "Hi"}]):
+                    pass
+
+    asyncio.run(scenario())
+
+
+def test_error_responses_raise_instead_of_becoming_the_reply(monkeypatch):
+    def overloaded(request):
+        return httpx.Response(503, json={"error": {"message": "overloaded"}})
+
+    async def scenario():
+        client = OpenAIClient({"name": "Mock", "endpoint": ENDPOINT, "model_name": "m", "api_type": "openai"})
+        async with httpx.AsyncClient(transport=httpx.MockTransport(overloaded)) as mock:
+            monkeypatch.setattr(http_pool, "get_client", lambda verify_ssl: mock)
+            with pytest.raises(EndpointError) as error:
+                await client.send_request([{"role": "user", "content": "Hi"}])
+            assert error.value.status == 503
+            assert "overloaded" in str(error.value)
+            with pytest.raises(EndpointError) as error:
+                async for _ in client.stream_response([{"role": "user", "content": "Hi"}]):
+                    pass
+            assert error.value.status == 503
+
+    asyncio.run(scenario())
+
+
+def test_dropping_a_conversation_forgets_its_entries(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.json"))
+    outbox.add(entry(2))
+    outbox.add(entry(5, parent=4, conversation="c2"))
+    outbox.drop("c1")
+    assert [e["conversation"] for e in outbox.entries.values()] == ["c2"]
@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+
+from app import http_pool, usage_stats
+from app.api_client import OpenAIClient
+from app.network_thread import NetworkThread, ThreadedClient
+from app.prewarm import Prewarmer, prewarmer
+
+LOCAL = {"name": "Local", "endpoint": "http://localhost:8000/v1/chat/completions", "model_name": "local",
+         "prewarm": {"connect": False, "warmup_request": True}}
+
+
+def run_prewarm(monkeypatch, status):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(status, json={"choices": [{"message": {"content": "Hi"}}]})
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_pool, "get_client", lambda verify=False: client)
+        prewarmer = Prewarmer()
+        await prewarmer.prewarm(LOCAL)
+        await client.aclose()
+        return prewarmer
+
+    return asyncio.run(scenario()), requests
+
+
+def test_warmup_request_is_left_out_of_the_usage_stats(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(usage_stats.usage_store, "record", lambda *args: recorded.append(args))
+    prewarmer, requests = run_prewarm(monkeypatch, 200)
+    assert len(requests) == 1
+    assert recorded == []
+    assert (LOCAL["endpoint"], "local") in prewarmer.warmed_models
+
+
+def test_failed_warmup_is_logged_not_raised(monkeypatch):
+    prewarmer, requests = run_prewarm(monkeypatch, 503)
+    assert len(requests) == 1
+    assert prewarmer.warmed_models == set()
+
+
+def test_threaded_client_prewarms_on_the_network_loop(monkeypatch):
+    loops = []
+
+    def get_client(verify=False):
+        loops.append(asyncio.get_running_loop())
+        return httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+
+    monkeypatch.setattr(http_pool, "get_client", get_client)
+    network = NetworkThread()
+    network.start()
+    try:
+        config = dict(LOCAL, prewarm={"connect": False, "warmup_request": "always"}, name="Threaded")
+        ThreadedClient(OpenAIClient(config), network).prewarm()
+        # The prewarm call is queued before the wait, so its task was started by then
+        network.submit(wait_for_prewarm(config["endpoint"])).result(5)
+    finally:
+        network.stop()
+    assert loops == [network.loop]
+
+
+async def wait_for_prewarm(endpoint):
+    task = prewarmer.tasks.get(endpoint)
+    if task is not None:  # None once it already finished
+        await asyncio.wait([task])
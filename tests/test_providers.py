@@ -0,0 +1,94 @@
+import base64
+import json
+
+from app.attachments import Attachment, content_attachments
+from app.conversation_tree import ConversationTree
+from app.providers import OpenAIAdapter, OllamaAdapter
+from app.request_body import encode_body
+
+
+def body(adapter, messages, **kwargs):
+    return json.loads(encode_body(adapter.build_payload(messages, 10, **kwargs)))
+
+
+def test_prefix_cache_flattens_text_only_messages():
+    adapter = OpenAIAdapter({"model_name": "m", "prefix_cache": True})
+    messages = [
+        {"role": "user", "content": "Hello"},
+        {"role": "assistant", "content": {"text": "Hi"}},
+    ]
+    sent = body(adapter, messages)["messages"]
+    assert sent == [{"content": "Hello", "role": "user"}, {"content": "Hi", "role": "assistant"}]
+
+
+def test_prefix_cache_keeps_single_image_part():
+    adapter = OpenAIAdapter({"model_name": "m", "prefix_cache": True})
+    image = Attachment(b"png", "image/png", "image")
+    sent = body(adapter, [{"role": "user", "content": {"image": image}}])["messages"]
+    assert sent[0]["content"] == [
+        {"type": "image_url", "image_url": {"url": "data:image/png;base64,cG5n"}}
+    ]
+
+
+def test_prefix_cache_history_bytes_are_stable_across_turns():
+    adapter = OpenAIAdapter({"model_name": "m", "prefix_cache": True, "cache_hints": {"cache_prompt": True}})
+    tree = ConversationTree()
+    tree.add("user", "Hello")
+    tree.add("assistant", "Hi!")
+    first = encode_body(adapter.build_payload(tree.messages(), 10))
+    tree.add("user", {"text": "More"})
+    second = encode_body(adapter.build_payload(tree.messages(), 10))
+    prefix = b'"messages":[{"content":"Hello","role":"user"},{"content":"Hi!","role":"assistant"}'
+    assert prefix in first and prefix in second
+    assert json.loads(second)["cache_prompt"] is True
+
+
+def test_cache_hints_merge_nested_options():
+    adapter = OllamaAdapter({"model_name": "m", "cache_hints": {"keep_alive": "30m", "options": {"num_ctx": 8192}}})
+    payload = adapter.build_payload([{"role": "user", "content": "hi"}], 5)
+    assert payload["options"] == {"num_predict": 5, "num_ctx": 8192}
+    assert payload["keep_alive"] == "30m"
+
+
+def test_parse_usage_reads_cached_tokens_and_timings():
+    adapter = OpenAIAdapter({"model_name": "m"})
+    usage = adapter.parse_usage({
+        "choices": [],
+        "usage": {"prompt_tokens": 50, "completion_tokens": 5, "prompt_tokens_details": {"cached_tokens": 40}},
+    })
+    assert usage == {"prompt_tokens": 50, "completion_tokens": 5, "cached_tokens": 40}
+    usage = adapter.parse_usage({"timings": {"prompt_ms": 12.5, "predicted_ms": 80.0, "cache_n": 47}})
+    assert usage == {"cached_tokens": 47, "prompt_ms": 12.5, "generation_ms": 80.0}
+    assert adapter.parse_usage({"choices": [{"delta": {"content": "x"}}]}) is None
+
+
+def test_uploaded_images_are_sent_inline_unless_the_kind_is_listed():
+    image = Attachment(b"png", "image/png", "image")
+    messages = [{"role": "user", "content": {"image": image}}]
+    references = {image.digest(): "file-1"}
+    inline = OpenAIAdapter({"model_name": "m"}).build_payload(messages, 10, references=references)
+    assert json.loads(encode_body(inline))["messages"][0]["content"][0]["type"] == "image_url"
+    listed = OpenAIAdapter({"model_name": "m", "upload_kinds": ["image"]})
+    sent = json.loads(encode_body(listed.build_payload(messages, 10, references=references)))
+    assert sent["messages"][0]["content"][0] == {"type": "file", "file": {"file_id": "file-1"}}
+
+
+def test_documents_are_never_upload_kinds():
+    assert OpenAIAdapter({"model_name": "m", "upload_kinds": ["image", "document"]}).upload_kinds == {"image"}
+
+
+def test_legacy_base64_contents_are_wrapped_once():
+    content = {"image_base64": base64.b64encode(b"png").decode()}
+    first, = content_attachments(content)
+    again, = content_attachments(content)
+    assert again is first and first.read_bytes() == b"png"
+
+
+def test_stream_usage_is_only_requested_from_openai_by_default():
+    messages = [{"role": "user", "content": "Hi"}]
+    openai = OpenAIAdapter({"model_name": "m", "endpoint": "https://api.openai.com/v1/chat/completions"})
+    local = OpenAIAdapter({"model_name": "m", "endpoint": "http://localhost:8000/v1/chat/completions"})
+    opted_in = OpenAIAdapter({"model_name": "m", "endpoint": "http://localhost:8000/v1", "stream_usage": True})
+    assert body(openai, messages, stream=True)["stream_options"] == {"include_usage": True}
+    assert "stream_options" not in body(local, messages, stream=True)
+    assert "stream_options" in body(opted_in, messages, stream=True)
@@ -0,0 +1,73 @@
+import asyncio
+import base64
+import gzip
+import json
+
+import pytest
+
+from app.attachments import Attachment, text_attachment
+from app.request_body import (
+    STREAM_THRESHOLD, Fragment, InlineData, InlineText, canonical, content_encoding, encode_body, iter_chunks,
+    should_stream, stream_body,
+)
+
+
+def test_inline_data_is_encoded_from_the_attachment():
+    data = bytes(range(256)) * 700  # Several base64 chunks
+    image = Attachment(data, "image/png", "image")
+    body = json.loads(encode_body({"url": InlineData.data_url(image)}))
+    prefix, encoded = body["url"].split(",", 1)
+    assert prefix == "data:image/png;base64"
+    assert base64.b64decode(encoded) == data
+
+
+def test_inline_text_escapes_every_part():
+    document = text_attachment('quote " and\nnewline ü')
+    body = json.loads(encode_body({"text": InlineText(["Intro\t", document])}))
+    assert body["text"] == 'Intro\tquote " and\nnewline ü'
+
+
+def test_fragments_are_written_as_serialized():
+    fragment = Fragment({"role": "user", "content": "Hi"})
+    assert encode_body({"messages": [fragment, {"role": "assistant"}]}) == (
+        b'{"messages":[{"role":"user","content":"Hi"},{"role":"assistant"}]}'
+    )
+
+
+def test_canonical_sorts_nested_keys_and_keeps_placeholders():
+    fragment = Fragment("x")
+    value = canonical({"b": [{"d": 1, "c": 2}], "a": fragment})
+    assert list(value) == ["a", "b"]
+    assert list(value["b"][0]) == ["c", "d"]
+    assert value["a"] is fragment
+
+
+def test_chunks_join_to_the_whole_body():
+    payload = {"items": [{"n": i, "text": "x" * 100} for i in range(2000)]}
+    chunks = list(iter_chunks(payload, size=4096))
+    assert len(chunks) > 1
+    assert json.loads(b"".join(chunks)) == payload
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_streamed_body_matches_the_encoded_one(compression):
+    payload = {"messages": [{"role": "user", "content": "Hello " * 1000}]}
+
+    async def collect():
+        return b"".join([chunk async for chunk in stream_body(payload, compression)])
+
+    body = asyncio.run(collect())
+    if compression:
+        assert content_encoding(compression) == "gzip"
+        body = gzip.decompress(body)
+    assert body == encode_body(payload)
+
+
+def test_only_payloads_with_large_attachments_are_streamed_by_default():
+    small = {"messages": [{"content": "Hello " * 1000}]}
+    image = Attachment(b"x" * STREAM_THRESHOLD, "image/png", "image")
+    large = {"messages": [{"content": [{"url": InlineData.data_url(image)}]}]}
+    assert not should_stream(small)
+    assert should_stream(large)
+    assert should_stream(small, True)
+    assert not should_stream(large, False)
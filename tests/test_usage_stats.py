@@ -0,0 +1,78 @@
+import os
+import time
+
+from app.usage_stats import MAGIC, RECORD, UsageStore, request_cost
+
+GPT = {"name": "GPT", "price": {"prompt": 10.0, "completion": 30.0, "cached": 5.0}}
+
+
+def make_store(tmp_path):
+    store = UsageStore()
+    store.configure(str(tmp_path / "usage.bin"))
+    return store
+
+
+def test_request_cost_charges_cached_prompt_tokens_at_their_price():
+    assert request_cost(GPT, 1000, 100, 400) == (600 * 10.0 + 400 * 5.0 + 100 * 30.0) / 1e6
+    assert request_cost({"name": "Free"}, 1000, 100, 0) == 0.0
+
+
+def test_rollups_survive_a_restart(tmp_path):
+    store = make_store(tmp_path)
+    store.record(GPT, {"prompt_tokens": 100, "completion_tokens": 50, "cached_tokens": 20}, 0.5, 2.0)
+    store.record({"name": "Local"}, {"prompt_tokens": 10, "completion_tokens": 5}, 0.1, 0.5)
+    store.close()
+
+    rollups = make_store(tmp_path).rollups()
+    gpt = rollups["GPT"]
+    assert (gpt.requests, gpt.prompt_tokens, gpt.completion_tokens, gpt.cached_tokens) == (1, 100, 50, 20)
+    assert gpt.tokens_per_second == 25.0
+    assert rollups["Local"].completion_tokens == 5
+
+
+def test_requests_without_a_first_token_are_left_out_of_its_average(tmp_path):
+    store = make_store(tmp_path)
+    store.record(GPT, {"completion_tokens": 10}, 0.5, 1.0)
+    store.record(GPT, {"completion_tokens": 10}, None, None)
+    rollup = store.rollups()["GPT"]
+    assert rollup.requests == 2
+    assert rollup.average_first_token == 0.5
+    assert rollup.tokens_per_second == 10.0
+
+    store.record({"name": "Batch"}, {"completion_tokens": 10}, None)
+    assert store.rollups()["Batch"].average_first_token is None
+
+
+def test_rollups_only_count_their_window(tmp_path):
+    path = tmp_path / "usage.bin"
+    old = RECORD.pack(time.time() - 40 * 86400, 0, 1000, 0, 0, 0.0, 0.0, 0.0)
+    recent = RECORD.pack(time.time(), 0, 10, 0, 0, 0.0, 0.0, 0.0)
+    path.write_bytes(MAGIC + old + recent)
+    (tmp_path / "usage.bin.models.json").write_text('["GPT"]')
+
+    store = make_store(tmp_path)
+    assert store.rollups(30)["GPT"].prompt_tokens == 10
+    assert store.rollups(None)["GPT"].prompt_tokens == 1010
+
+
+def test_a_torn_record_is_cut_on_load(tmp_path):
+    store = make_store(tmp_path)
+    store.record(GPT, {"prompt_tokens": 1}, 0.1)
+    store.close()
+    with open(tmp_path / "usage.bin", "ab") as f:
+        f.write(b"\0" * 5)
+
+    store = make_store(tmp_path)
+    store.record(GPT, {"prompt_tokens": 2}, 0.1)
+    store.close()
+    data = (tmp_path / "usage.bin").read_bytes()
+    assert len(data) == len(MAGIC) + 2 * RECORD.size
+    assert [record[2] for record in RECORD.iter_unpack(data[len(MAGIC):])] == [1, 2]
+
+
+def test_unwritable_model_names_do_not_lose_the_record(tmp_path):
+    store = make_store(tmp_path)
+    os.mkdir(store.names_path + ".tmp")  # Opening the temp file fails
+    store.record(GPT, {"prompt_tokens": 10, "completion_tokens": 5}, 0.1, 0.5)
+    assert store.rollups()["GPT"].requests == 1
+    store.close()